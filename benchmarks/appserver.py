@@ -0,0 +1,73 @@
+"""
+Serves PanoPuppet with a threaded wsgiref server, one process per load test worker.
+
+    python -m benchmarks.appserver --config /tmp/bench/config.yaml --setup-db --username admin --password admin
+    python -m benchmarks.appserver --config /tmp/bench/config.yaml --port 8000
+
+The config is written by benchmarks.environment.write_config.
+"""
+
+import argparse
+import os
+import socketserver
+import sys
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+__author__ = 'etaklar'
+
+
+class ThreadingWSGIServer(socketserver.ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def setup_django(config):
+    os.environ['PP_CFG'] = config
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'panopuppet.puppet.settings')
+    import django
+    django.setup()
+
+
+def setup_db(username, password):
+    """Create the database tables and a superuser for the load test."""
+    from django.contrib.auth.models import User
+    from django.core.management import call_command
+    call_command('migrate', run_syncdb=True, interactive=False, verbosity=0)
+    if not User.objects.filter(username=username).exists():
+        User.objects.create_superuser(username, '%s@localhost' % username, password)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve PanoPuppet for load tests.')
+    parser.add_argument('--config', required=True, help='PanoPuppet config file')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--setup-db', action='store_true', help='Create the database and user, then exit')
+    parser.add_argument('--username', default='loadtest')
+    parser.add_argument('--password', default='loadtest')
+    args = parser.parse_args()
+
+    setup_django(args.config)
+    if args.setup_db:
+        setup_db(args.username, args.password)
+        return 0
+
+    from django.core.wsgi import get_wsgi_application
+    server = make_server(args.host, args.port, get_wsgi_application(),
+                         server_class=ThreadingWSGIServer, handler_class=QuietHandler)
+    print('Serving PanoPuppet on http://%s:%d/ (pid %d)' % (args.host, args.port, os.getpid()))
+    sys.stdout.flush()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
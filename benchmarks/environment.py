@@ -0,0 +1,49 @@
+"""
+Sets up PanoPuppet (Django) against a PuppetDB url for benchmarks and load tests.
+PanoPuppet reads its config file and asks PuppetDB for its version on import,
+so the PuppetDB (usually the stub) must be running before configure() is called.
+"""
+
+import os
+import tempfile
+
+import yaml
+
+__author__ = 'etaklar'
+
+
+def write_config(puppetdb_host, workdir=None, **options):
+    """
+    Write a PanoPuppet config.yaml using the PuppetDB host.
+    :param workdir: Directory for the config and sqlite database, a temporary directory is created if not given
+    :param options: Extra config options, e.g. CACHE_TIME=0
+    :return: path of the config file
+    """
+    if workdir is None:
+        workdir = tempfile.mkdtemp(prefix='panopuppet-bench-')
+    config = {
+        'PUPPETDB_HOST': puppetdb_host,
+        'SQLITE_DIR': workdir,
+        'SECRET_KEY': 'panopuppet-benchmark',
+        'DEBUG': False,
+        'TEMPLATE_DEBUG': False,
+        'ALLOWED_HOSTS': ['127.0.0.1', 'localhost'],
+        'AUTH_METHOD': 'basic',
+        'CACHE_TIME': 0,
+        'TIME_ZONE': 'UTC',
+    }
+    config.update(options)
+    path = os.path.join(workdir, 'config.yaml')
+    with open(path, 'w') as config_file:
+        yaml.safe_dump(config, config_file, default_flow_style=False)
+    return path
+
+
+def configure(puppetdb_host, workdir=None, **options):
+    """Write a config for the PuppetDB host and set up Django with it."""
+    path = write_config(puppetdb_host, workdir, **options)
+    os.environ['PP_CFG'] = path
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'panopuppet.puppet.settings')
+    import django
+    django.setup()
+    return path
@@ -0,0 +1,637 @@
+"""
+Deterministic generator of a synthetic puppet fleet.
+
+The same size, seed and options always produce the same nodes, reports,
+events, facts and catalogs so benchmarks and load tests are comparable
+between runs. Only the node records are kept in memory, everything else
+is generated on demand from the certname.
+
+    fleet = Fleet(size=10000, seed=1)
+    fleet.nodes()                                    # /nodes records
+    fleet.event_counts()                             # /event-counts summarized by certname
+    fleet.catalog('node000001.dc1.example.com')      # /catalogs/<certname>
+"""
+
+import datetime
+import hashlib
+import json
+import zlib
+
+__author__ = 'etaklar'
+
+TIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%fZ'
+
+# Weights of the node states generated by default.
+# pending is an unchanged run with noop events,
+# mismatch is a node whose catalog is older than its facts and report.
+DEFAULT_STATUS_MIX = {
+    'unchanged': 70,
+    'changed': 12,
+    'failed': 5,
+    'pending': 5,
+    'unreported': 5,
+    'mismatch': 3,
+}
+
+STANDARD_FACTS = ['operatingsystem', 'operatingsystemrelease', 'osfamily', 'kernel', 'kernelrelease',
+                  'puppetversion', 'ipaddress', 'fqdn', 'hostname', 'uptime', 'processorcount',
+                  'memorysize', 'virtual', 'datacenter']
+
+RESOURCE_TYPES = ['File', 'Package', 'Service', 'Exec', 'User', 'Cron', 'File', 'Package']
+
+
+def _num(*parts):
+    """Deterministic non negative integer for the given parts."""
+    return zlib.crc32('|'.join(str(part) for part in parts).encode('utf-8'))
+
+
+def _ratio(*parts):
+    """Deterministic float in the range [0, 1) for the given parts."""
+    return _num(*parts) / 4294967296.0
+
+
+def _sha1(*parts):
+    return hashlib.sha1('|'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+
+
+def _ts(date):
+    return date.strftime(TIME_FORMAT)
+
+
+class Fleet(object):
+    def __init__(self,
+                 size=1000,
+                 seed=0,
+                 status_mix=None,
+                 event_density=5,
+                 fact_count=40,
+                 fact_cardinality=20,
+                 catalog_size=400,
+                 roles=10,
+                 drift=0.05,
+                 history=5,
+                 environments=('production', 'staging', 'development'),
+                 datacenters=('dc1', 'dc2', 'dc3'),
+                 run_interval=30,
+                 now=None):
+        """
+        :param size: Number of nodes in the fleet
+        :param seed: Seed, the same seed gives the same fleet
+        :param status_mix: dict of status: weight, see DEFAULT_STATUS_MIX
+        :param event_density: Average number of events in a report with changes
+        :param fact_count: Number of facts per node, at least the standard facts are generated
+        :param fact_cardinality: Number of distinct values of the generated custom facts
+        :param catalog_size: Number of resources in each catalog
+        :param roles: Number of roles, nodes with the same role share most of their catalog
+        :param drift: Fraction of nodes with locally modified resources in their catalog
+        :param history: Number of reports kept per node
+        :param run_interval: Puppet run interval in minutes
+        :param now: datetime (UTC) the fleet timestamps are relative to, defaults to utcnow()
+        """
+        self.size = size
+        self.seed = seed
+        self.status_mix = status_mix or DEFAULT_STATUS_MIX
+        self.event_density = event_density
+        self.fact_count = max(fact_count, len(STANDARD_FACTS))
+        self.fact_cardinality = max(fact_cardinality, 1)
+        self.catalog_size = catalog_size
+        self.roles = max(roles, 1)
+        self.drift = drift
+        self.history = max(history, 1)
+        self.environments = environments
+        self.datacenters = datacenters
+        self.run_interval = run_interval
+        self.now = now or datetime.datetime.utcnow()
+
+        self._role_resources = {}
+        self._role_index = {}
+        self._report_index = None
+        self._meta = {}
+        self._nodes = []
+        self._node_index = {}
+
+        mix_total = sum(self.status_mix.values())
+        for i in range(size):
+            certname = 'node%06d.%s.example.com' % (i, datacenters[i % len(datacenters)])
+            roll = _ratio(seed, certname, 'status') * mix_total
+            kind = None
+            for name, weight in sorted(self.status_mix.items()):
+                if roll < weight:
+                    kind = name
+                    break
+                roll -= weight
+            if kind is None:
+                kind = 'unchanged'
+            meta = {
+                'index': i,
+                'kind': kind,
+                'role': 'role%02d' % (_num(seed, certname, 'role') % self.roles),
+                'environment': environments[_num(seed, certname, 'env') % len(environments)]
+                if _ratio(seed, certname, 'env') > 0.2 else environments[0],
+                'drifted': _ratio(seed, certname, 'drift') < drift,
+            }
+            self._meta[certname] = meta
+            node = self._make_node(certname, meta)
+            self._node_index[certname] = len(self._nodes)
+            self._nodes.append(node)
+
+    # Nodes
+
+    def _make_node(self, certname, meta):
+        kind = meta['kind']
+        offset = _ratio(self.seed, certname, 'offset') * self.run_interval * 0.9
+        if kind == 'unreported':
+            offset = self.run_interval * (2 + _ratio(self.seed, certname, 'unreported') * 96)
+        report_time = self.now - datetime.timedelta(minutes=offset)
+        facts_time = report_time - datetime.timedelta(seconds=40)
+        catalog_time = facts_time + datetime.timedelta(seconds=10)
+        if kind == 'mismatch':
+            catalog_time = facts_time - datetime.timedelta(minutes=self.run_interval * 2)
+        meta['report_time'] = report_time
+        return {
+            'certname': certname,
+            'deactivated': None,
+            'expired': None,
+            'catalog_timestamp': _ts(catalog_time),
+            'facts_timestamp': _ts(facts_time),
+            'report_timestamp': _ts(report_time),
+            'catalog_environment': meta['environment'],
+            'facts_environment': meta['environment'],
+            'report_environment': meta['environment'],
+            'latest_report_status': self.report_status(certname),
+            'latest_report_hash': self.report_hash(certname),
+            'latest_report_noop': kind == 'pending',
+            'latest_report_noop_pending': kind == 'pending',
+            'cached_catalog_status': 'not_used',
+        }
+
+    def nodes(self):
+        return self._nodes
+
+    def certnames(self):
+        return [node['certname'] for node in self._nodes]
+
+    def node(self, certname):
+        index = self._node_index.get(certname)
+        if index is None:
+            return None
+        return self._nodes[index]
+
+    def meta(self, certname):
+        return self._meta[certname]
+
+    # Reports and events
+
+    def report_kind(self, certname, index=0):
+        """State of the report, index 0 is the latest report."""
+        kind = self._meta[certname]['kind']
+        if index == 0:
+            if kind in ('unreported', 'mismatch'):
+                return 'changed' if _ratio(self.seed, certname, 'kind') < 0.3 else 'unchanged'
+            return kind
+        roll = _ratio(self.seed, certname, index, 'kind')
+        if roll < 0.1:
+            return 'failed'
+        elif roll < 0.35:
+            return 'changed'
+        return 'unchanged'
+
+    def report_status(self, certname, index=0):
+        kind = self.report_kind(certname, index)
+        if kind == 'pending':
+            return 'unchanged'
+        return kind
+
+    def report_hash(self, certname, index=0):
+        return _sha1(self.seed, certname, index, 'report')
+
+    def report_counts(self, certname, index=0):
+        kind = self.report_kind(certname, index)
+        density = max(self.event_density, 1)
+        amount = 1 + _num(self.seed, certname, index, 'events') % (density * 2)
+        counts = {'successes': 0, 'failures': 0, 'noops': 0, 'skips': 0}
+        if kind == 'changed':
+            counts['successes'] = amount
+        elif kind == 'failed':
+            counts['failures'] = 1 + amount // 4
+            counts['successes'] = amount // 2
+            counts['skips'] = amount // 4
+        elif kind == 'pending':
+            counts['noops'] = amount
+        return counts
+
+    def report_time(self, certname, index=0):
+        return self._meta[certname]['report_time'] - datetime.timedelta(minutes=self.run_interval * index)
+
+    def event_count(self, certname):
+        """event-counts record summarized by certname for the latest report, None if it has no events."""
+        counts = self.report_counts(certname)
+        if not any(counts.values()):
+            return None
+        item = {
+            'subject_type': 'certname',
+            'subject': {'title': certname},
+        }
+        item.update(counts)
+        return item
+
+    def event_counts(self):
+        counts = []
+        for node in self._nodes:
+            item = self.event_count(node['certname'])
+            if item is not None:
+                counts.append(item)
+        return counts
+
+    def events(self, certname, index=0):
+        counts = self.report_counts(certname, index)
+        keys = [key for key in self.resource_keys(self._meta[certname]['role']) if key[0] != 'Class']
+        if not keys:
+            return []
+        run_end = self.report_time(certname, index)
+        run_start = run_end - datetime.timedelta(seconds=30)
+        report = self.report_hash(certname, index)
+        environment = self._meta[certname]['environment']
+        events = []
+        position = 0
+        for status, key in (('success', 'successes'), ('failure', 'failures'), ('noop', 'noops'),
+                            ('skipped', 'skips')):
+            for i in range(counts[key]):
+                key = keys[_num(self.seed, certname, index, position, 'event') % len(keys)]
+                resource = self.resources(certname, [key])[0]
+                position += 1
+                events.append({
+                    'certname': certname,
+                    'report': report,
+                    'status': status,
+                    'timestamp': _ts(run_start + datetime.timedelta(seconds=position)),
+                    'run_start_time': _ts(run_start),
+                    'run_end_time': _ts(run_end),
+                    'report_receive_time': _ts(run_end + datetime.timedelta(seconds=1)),
+                    'resource_type': resource['type'],
+                    'resource_title': resource['title'],
+                    'property': 'ensure' if status != 'skipped' else None,
+                    'old_value': 'absent' if status != 'skipped' else None,
+                    'new_value': 'present' if status != 'skipped' else None,
+                    'message': '%s %s[%s]' % (status, resource['type'], resource['title']),
+                    'file': resource['file'],
+                    'line': resource['line'],
+                    'containing_class': resource['containing_class'],
+                    'containment_path': ['Stage[main]', resource['containing_class'],
+                                         '%s[%s]' % (resource['type'], resource['title'])],
+                    'configuration_version': str(_num(self.seed, certname, index, 'version')),
+                    'environment': environment,
+                    'latest_report?': index == 0,
+                })
+        return events
+
+    def report(self, certname, index=0):
+        counts = self.report_counts(certname, index)
+        end_time = self.report_time(certname, index)
+        start_time = end_time - datetime.timedelta(seconds=30)
+        report_hash = self.report_hash(certname, index)
+        events = self.events(certname, index)
+        kind = self.report_kind(certname, index)
+        metrics = [
+            {'category': 'resources', 'name': 'total', 'value': self.catalog_size},
+            {'category': 'resources', 'name': 'changed', 'value': counts['successes']},
+            {'category': 'resources', 'name': 'failed', 'value': counts['failures']},
+            {'category': 'resources', 'name': 'skipped', 'value': counts['skips']},
+            {'category': 'resources', 'name': 'out_of_sync', 'value': counts['successes'] + counts['noops']},
+            {'category': 'events', 'name': 'success', 'value': counts['successes']},
+            {'category': 'events', 'name': 'failure', 'value': counts['failures']},
+            {'category': 'events', 'name': 'noop', 'value': counts['noops']},
+            {'category': 'events', 'name': 'total', 'value': len(events)},
+            {'category': 'time', 'name': 'total', 'value': 28.5},
+            {'category': 'time', 'name': 'config_retrieval', 'value': 4.2},
+        ]
+        logs = [{
+            'file': None,
+            'line': None,
+            'level': 'info',
+            'message': 'Applying configuration version \'%s\'' % _num(self.seed, certname, index, 'version'),
+            'source': 'Puppet',
+            'tags': ['info'],
+            'time': _ts(start_time),
+        }]
+        for event in events:
+            logs.append({
+                'file': event['file'],
+                'line': event['line'],
+                'level': 'err' if event['status'] == 'failure' else 'notice',
+                'message': event['message'],
+                'source': '/Stage[main]/%s/%s[%s]' % (
+                    event['containing_class'], event['resource_type'], event['resource_title']),
+                'tags': ['notice', event['resource_type'].lower()],
+                'time': event['timestamp'],
+            })
+        logs.append({
+            'file': None,
+            'line': None,
+            'level': 'notice',
+            'message': 'Applied catalog in 28.50 seconds',
+            'source': 'Puppet',
+            'tags': ['notice'],
+            'time': _ts(end_time),
+        })
+        return {
+            'certname': certname,
+            'hash': report_hash,
+            'environment': self._meta[certname]['environment'],
+            'status': self.report_status(certname, index),
+            'noop': kind == 'pending',
+            'noop_pending': kind == 'pending',
+            'puppet_version': '4.10.12',
+            'report_format': 7,
+            'configuration_version': str(_num(self.seed, certname, index, 'version')),
+            'transaction_uuid': _sha1(self.seed, certname, index, 'transaction'),
+            'catalog_uuid': _sha1(self.seed, certname, index, 'catalog'),
+            'code_id': None,
+            'cached_catalog_status': 'not_used',
+            'producer': 'puppetmaster.example.com',
+            'start_time': _ts(start_time),
+            'end_time': _ts(end_time),
+            'producer_timestamp': _ts(end_time),
+            'receive_time': _ts(end_time + datetime.timedelta(seconds=1)),
+            'latest_report?': index == 0,
+            'metrics': {'href': '/pdb/query/v4/reports/%s/metrics' % report_hash, 'data': metrics},
+            'logs': {'href': '/pdb/query/v4/reports/%s/logs' % report_hash, 'data': logs},
+            'resource_events': {'href': '/pdb/query/v4/reports/%s/events' % report_hash, 'data': events},
+        }
+
+    def reports(self, certname):
+        """All reports kept for the node, latest first."""
+        return [self.report(certname, index) for index in range(self.history)]
+
+    def find_report(self, report_hash):
+        """(certname, index) of the report with the hash, None if there is no such report."""
+        if self._report_index is None:
+            self._report_index = {}
+            for node in self._nodes:
+                for index in range(self.history):
+                    self._report_index[self.report_hash(node['certname'], index)] = (node['certname'], index)
+        return self._report_index.get(report_hash)
+
+    # Facts
+
+    def fact_names(self):
+        names = list(STANDARD_FACTS)
+        i = 0
+        while len(names) < self.fact_count:
+            names.append('custom_fact_%02d' % i)
+            i += 1
+        return names
+
+    def fact_value(self, certname, name):
+        meta = self._meta.get(certname)
+        if meta is None:
+            return None
+        index = meta['index']
+        if name == 'fqdn':
+            return certname
+        elif name == 'hostname':
+            return certname.split('.')[0]
+        elif name == 'ipaddress':
+            return '10.%d.%d.%d' % ((index >> 16) & 255, (index >> 8) & 255, index & 255)
+        elif name == 'datacenter':
+            return certname.split('.')[1]
+        elif name == 'kernel':
+            return 'Linux'
+        elif name == 'operatingsystem':
+            return ['RedHat', 'CentOS', 'Debian', 'Ubuntu'][_num(self.seed, certname, 'os') % 4]
+        elif name == 'osfamily':
+            return 'RedHat' if self.fact_value(certname, 'operatingsystem') in ('RedHat', 'CentOS') else 'Debian'
+        elif name == 'operatingsystemrelease':
+            return ['6.10', '7.9', '8.11', '16.04', '18.04'][_num(self.seed, certname, 'osrel') % 5]
+        elif name == 'kernelrelease':
+            return '3.10.0-%d.el7.x86_64' % (1000 + _num(self.seed, certname, 'kernel') % 200)
+        elif name == 'puppetversion':
+            return ['4.10.12', '5.5.22', '6.28.0'][_num(self.seed, certname, 'puppet') % 3]
+        elif name == 'uptime':
+            return '%d days' % (_num(self.seed, certname, 'uptime') % 400)
+        elif name == 'processorcount':
+            return [2, 4, 8, 16, 32][_num(self.seed, certname, 'cpu') % 5]
+        elif name == 'memorysize':
+            return '%d.00 GB' % [4, 8, 16, 32, 64][_num(self.seed, certname, 'memory') % 5]
+        elif name == 'virtual':
+            return 'kvm' if _ratio(self.seed, certname, 'virtual') < 0.8 else 'physical'
+        elif name.startswith('custom_fact_'):
+            return 'value_%d' % (_num(self.seed, certname, name) % self.fact_cardinality)
+        return None
+
+    def facts(self, certname):
+        return {name: self.fact_value(certname, name) for name in self.fact_names()}
+
+    def fact_records(self, certname, names=None):
+        environment = self._meta[certname]['environment']
+        return [{'certname': certname, 'name': name, 'value': self.fact_value(certname, name),
+                 'environment': environment}
+                for name in (names if names is not None else self.fact_names())]
+
+    # Catalogs
+
+    def _resource(self, number):
+        """Resource template number from the global resource pool."""
+        rtype = RESOURCE_TYPES[number % len(RESOURCE_TYPES)]
+        profile = 'Profile::P%02d' % (number % 20)
+        if rtype == 'File':
+            title = '/etc/app/conf-%05d.conf' % number
+            parameters = {'ensure': 'file', 'owner': 'root', 'group': 'root', 'mode': '0644',
+                          'content': 'setting_%d = true\n' % number}
+            if number % 3 == 0:
+                parameters.pop('content')
+                parameters['source'] = 'puppet:///modules/app/conf-%05d.conf' % number
+        elif rtype == 'Package':
+            title = 'pkg-%05d' % number
+            parameters = {'ensure': '1.%d.%d' % (number % 7, number % 13)}
+        elif rtype == 'Service':
+            title = 'svc-%05d' % number
+            parameters = {'ensure': 'running', 'enable': True}
+        elif rtype == 'Exec':
+            title = 'run-%05d' % number
+            parameters = {'command': '/usr/local/bin/run-%05d' % number, 'refreshonly': True,
+                          'path': ['/bin', '/usr/bin']}
+        elif rtype == 'User':
+            title = 'user%05d' % number
+            parameters = {'ensure': 'present', 'uid': 10000 + number, 'shell': '/bin/bash'}
+        else:
+            title = 'job-%05d' % number
+            parameters = {'command': '/usr/local/bin/job-%05d' % number, 'minute': number % 60, 'user': 'root'}
+        return {
+            'type': rtype,
+            'title': title,
+            'tags': [rtype.lower(), profile.lower(), 'class'],
+            'exported': False,
+            'file': '/etc/puppetlabs/code/modules/profile/manifests/p%02d.pp' % (number % 20),
+            'line': 1 + number % 200,
+            'parameters': parameters,
+            'containing_class': profile,
+        }
+
+    def role_resources(self, role):
+        """Resource templates shared by all nodes with the role."""
+        if role in self._role_resources:
+            return self._role_resources[role]
+        resources = []
+        pool = self.catalog_size * 4
+        shared = max(self.catalog_size - 10 - 21, 0)
+        start = _num(self.seed, role, 'pool') % pool
+        # Roles overlap in the resource pool so catalogs of different roles share resources.
+        for i in range(shared):
+            resources.append(self._resource((start + i * 3) % pool))
+        self._role_resources[role] = resources
+        return resources
+
+    def nodes_with_role(self, role):
+        return [node['certname'] for node in self._nodes if self._meta[node['certname']]['role'] == role]
+
+    def _node_resource_count(self, role):
+        return max(min(10, self.catalog_size - 21 - len(self.role_resources(role))), 0)
+
+    def resource_keys(self, role):
+        """dict of (type, title): position of the resources in the catalogs of the role."""
+        if role in self._role_index:
+            return self._role_index[role]
+        keys = {('Class', 'Role::%s' % role.capitalize()): ('role', 0)}
+        for i in range(20):
+            keys[('Class', 'Profile::P%02d' % i)] = ('profile', i)
+        for i, template in enumerate(self.role_resources(role)):
+            keys[(template['type'], template['title'])] = ('template', i)
+        for i in range(self._node_resource_count(role)):
+            keys[('File', '/etc/node.d/%02d.conf' % i)] = ('node', i)
+        self._role_index[role] = keys
+        return keys
+
+    def _drifted(self, certname):
+        """Positions of the role templates that are locally modified on the node."""
+        meta = self._meta[certname]
+        templates = self.role_resources(meta['role'])
+        drifted = set()
+        if meta['drifted'] and templates:
+            # Drifted nodes fall into one of three variants so they cluster together.
+            variant = _num(self.seed, certname, 'variant') % 3
+            for i in range(1 + variant):
+                drifted.add(_num(self.seed, meta['role'], variant, i, 'drifted') % len(templates))
+        return drifted
+
+    def _build_resource(self, certname, position, drifted):
+        role = self._meta[certname]['role']
+        kind, i = position
+        if kind == 'role':
+            resource = {
+                'type': 'Class',
+                'title': 'Role::%s' % role.capitalize(),
+                'tags': ['class', 'role'],
+                'exported': False,
+                'file': '/etc/puppetlabs/code/modules/role/manifests/%s.pp' % role,
+                'line': 1,
+                'parameters': {},
+                'containing_class': 'Class[main]',
+            }
+        elif kind == 'profile':
+            resource = {
+                'type': 'Class',
+                'title': 'Profile::P%02d' % i,
+                'tags': ['class', 'profile'],
+                'exported': False,
+                'file': '/etc/puppetlabs/code/modules/profile/manifests/p%02d.pp' % i,
+                'line': 1,
+                'parameters': {},
+                'containing_class': 'Role::%s' % role.capitalize(),
+            }
+        elif kind == 'template':
+            resource = dict(self.role_resources(role)[i])
+            if i in drifted:
+                parameters = dict(resource['parameters'])
+                parameters['drifted'] = 'locally modified'
+                resource['parameters'] = parameters
+        else:
+            # Node specific resources, unique per node.
+            resource = {
+                'type': 'File',
+                'title': '/etc/node.d/%02d.conf' % i,
+                'tags': ['file', 'profile::p00'],
+                'exported': False,
+                'file': '/etc/puppetlabs/code/modules/profile/manifests/p00.pp',
+                'line': 100 + i,
+                'parameters': {'ensure': 'file', 'content': '%s %d\n' % (certname, i)},
+                'containing_class': 'Profile::P00',
+            }
+        resource['resource'] = _sha1(resource['type'], resource['title'], certname)
+        return resource
+
+    def resources(self, certname, keys=None):
+        """
+        Catalog resources of the node, classes first.
+        :param keys: Only build the resources with these (type, title) keys
+        """
+        index = self.resource_keys(self._meta[certname]['role'])
+        drifted = self._drifted(certname)
+        if keys is None:
+            positions = sorted(index.values(), key=lambda position: (
+                ['role', 'profile', 'template', 'node'].index(position[0]), position[1]))
+        else:
+            positions = [index[key] for key in keys if key in index]
+        return [self._build_resource(certname, position, drifted) for position in positions]
+
+    def edges(self, certname):
+        resources = self.resources(certname)
+        edges = []
+        role_title = resources[0]['title']
+        services = {}
+        for resource in resources[1:]:
+            if resource['type'] == 'Class':
+                edges.append(('Class', role_title, 'contains', 'Class', resource['title']))
+            else:
+                edges.append(('Class', resource['containing_class'], 'contains',
+                              resource['type'], resource['title']))
+                if resource['type'] == 'Service':
+                    services.setdefault(resource['containing_class'], resource['title'])
+        for resource in resources[1:]:
+            if resource['type'] == 'Package':
+                service = services.get(resource['containing_class'])
+                if service:
+                    edges.append(('Package', resource['title'], 'before', 'Service', service))
+            elif resource['type'] == 'File':
+                service = services.get(resource['containing_class'])
+                if service:
+                    edges.append(('File', resource['title'], 'notifies', 'Service', service))
+            elif resource['type'] == 'Exec':
+                edges.append(('Exec', resource['title'], 'required-by', 'Class', resource['containing_class']))
+        return [{
+            'source_type': source_type,
+            'source_title': source_title,
+            'relationship': relationship,
+            'target_type': target_type,
+            'target_title': target_title,
+        } for source_type, source_title, relationship, target_type, target_title in edges]
+
+    def catalog(self, certname):
+        if certname not in self._meta:
+            return None
+        resources = self.resources(certname)
+        for resource in resources:
+            resource.pop('containing_class', None)
+        catalog_hash = hashlib.sha1(json.dumps(resources, sort_keys=True).encode('utf-8')).hexdigest()
+        node = self.node(certname)
+        return {
+            'certname': certname,
+            'version': str(_num(self.seed, certname, 0, 'version')),
+            'hash': catalog_hash,
+            'transaction_uuid': _sha1(self.seed, certname, 0, 'transaction'),
+            'catalog_uuid': _sha1(self.seed, certname, 0, 'catalog'),
+            'code_id': None,
+            'environment': self._meta[certname]['environment'],
+            'producer': 'puppetmaster.example.com',
+            'producer_timestamp': node['catalog_timestamp'],
+            'edges': {'href': '/pdb/query/v4/catalogs/%s/edges' % certname, 'data': self.edges(certname)},
+            'resources': {'href': '/pdb/query/v4/catalogs/%s/resources' % certname, 'data': resources},
+        }
+
+    # Metrics
+
+    def num_resources(self):
+        return self.size * self.catalog_size
+
+    def avg_resources_per_node(self):
+        return float(self.catalog_size)
@@ -0,0 +1,409 @@
+"""
+End-to-end load test of PanoPuppet against the stub PuppetDB.
+
+    python -m benchmarks.loadtest --nodes 10000 --workers 2 --users 20 --duration 60 --mix mixed
+    python -m benchmarks.loadtest --target http://127.0.0.1:8000/ --worker-pids 1234,1235 --users 50
+
+Without --target a stub PuppetDB and --workers PanoPuppet processes (benchmarks.appserver) are started.
+Virtual users log in, then repeatedly pick a request from the traffic mix, wait for the response and
+sleep --think-time. At the end latency percentiles and throughput are reported per request type, and
+peak RSS and thread count for every worker process (read from /proc, linux only).
+"""
+
+import argparse
+import json
+import random
+import re
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+import requests
+
+from benchmarks.environment import write_config
+from benchmarks.stub_puppetdb import fleet_arguments, fleet_from_arguments
+
+__author__ = 'etaklar'
+
+DASHBOARD_SHOW = ('recent', 'failed', 'unreported', 'changed', 'pending', 'mismatch')
+SORT_FIELDS = ('certname', 'catalog_timestamp', 'report_timestamp', 'facts_timestamp', 'successes', 'noops',
+               'failures', 'skips')
+
+
+def dashboard_status(fleet, rng):
+    return '/pano/api/dashboard/status'
+
+
+def dashboard(fleet, rng):
+    return '/pano/api/dashboard/?show=%s' % rng.choice(DASHBOARD_SHOW)
+
+
+def dashboard_nodes(fleet, rng):
+    return '/pano/api/dashboard/nodes/?show=%s' % rng.choice(DASHBOARD_SHOW)
+
+
+def nodes_page(fleet, rng):
+    pages = max(fleet.size // 50, 1)
+    return '/pano/api/nodes/?limits=50&page=%d&sortfield=%s&sortfieldby=%s' % (
+        rng.randint(1, pages), rng.choice(SORT_FIELDS), rng.choice(('asc', 'desc')))
+
+
+def nodes_csv(fleet, rng):
+    return '/pano/api/nodes/?dl_csv=true'
+
+
+def nodes_csv_facts(fleet, rng):
+    return '/pano/api/nodes/?dl_csv=true&include_facts=kernel,operatingsystem,ipaddress'
+
+
+def reports(fleet, rng):
+    return '/pano/api/reports/%s/' % rng.choice(fleet.certnames())
+
+
+def events(fleet, rng):
+    certname = rng.choice(fleet.certnames())
+    return '/pano/events/%s/?report_timestamp=%s' % (fleet.report_hash(certname),
+                                                     fleet.node(certname)['report_timestamp'])
+
+
+def agent_log(fleet, rng):
+    return '/pano/api/reports/%s/agent_log' % fleet.report_hash(rng.choice(fleet.certnames()))
+
+
+# Traffic mixes, lists of (weight, request).
+MIXES = {
+    'dashboard': [
+        (6, dashboard_status),
+        (3, dashboard),
+        (1, dashboard_nodes),
+    ],
+    'nodes': [
+        (9, nodes_page),
+        (1, nodes_csv),
+    ],
+    'export': [
+        (1, nodes_csv),
+        (1, nodes_csv_facts),
+    ],
+    'drilldown': [
+        (4, reports),
+        (4, events),
+        (2, agent_log),
+    ],
+    'mixed': [
+        (30, dashboard_status),
+        (10, dashboard),
+        (5, dashboard_nodes),
+        (25, nodes_page),
+        (2, nodes_csv),
+        (1, nodes_csv_facts),
+        (12, reports),
+        (10, events),
+        (5, agent_log),
+    ],
+}
+
+
+def percentile(values, percent):
+    """Nearest rank percentile of a sorted list."""
+    if not values:
+        return 0.0
+    rank = int(round(percent / 100.0 * len(values) + 0.5)) - 1
+    return values[min(max(rank, 0), len(values) - 1)]
+
+
+def free_port():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def wait_for_port(port, process, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError('Process %s exited with code %s' % (' '.join(process.args), process.returncode))
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except socket.error:
+            time.sleep(0.1)
+    raise RuntimeError('Timed out waiting for port %d' % port)
+
+
+def proc_status(pid):
+    """Current RSS, peak RSS (kB) and thread count of a process, None if unavailable."""
+    try:
+        with open('/proc/%d/status' % pid) as status_file:
+            status = status_file.read()
+    except (IOError, OSError):
+        return None
+    values = {}
+    for field in ('VmRSS', 'VmHWM', 'Threads'):
+        match = re.search(r'^%s:\s+(\d+)' % field, status, re.MULTILINE)
+        values[field] = int(match.group(1)) if match else 0
+    return values
+
+
+class ProcessSampler(threading.Thread):
+    """Samples memory and thread count of the worker processes during the test."""
+
+    def __init__(self, pids, interval=0.5):
+        super(ProcessSampler, self).__init__(name='process-sampler')
+        self.daemon = True
+        self.pids = pids
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.peaks = {pid: {'peak_rss_kb': 0, 'rss_kb': 0, 'peak_threads': 0} for pid in pids}
+
+    def sample(self):
+        for pid in self.pids:
+            status = proc_status(pid)
+            if status is None:
+                continue
+            peaks = self.peaks[pid]
+            peaks['rss_kb'] = status['VmRSS']
+            peaks['peak_rss_kb'] = max(peaks['peak_rss_kb'], status['VmHWM'], status['VmRSS'])
+            peaks['peak_threads'] = max(peaks['peak_threads'], status['Threads'])
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.sample()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        self.sample()
+
+
+def login(session, base_url, username, password):
+    login_url = base_url + 'pano/login/'
+    session.get(login_url)
+    response = session.post(login_url, data={
+        'username': username,
+        'password': password,
+        'csrfmiddlewaretoken': session.cookies.get('csrftoken', ''),
+    }, headers={'Referer': login_url}, allow_redirects=False)
+    if response.status_code != 302 or 'sessionid' not in session.cookies:
+        raise RuntimeError('Login as %s failed with status %d' % (username, response.status_code))
+    # Like the nodes page, load the node list once without parameters so the paging state exists in the session.
+    session.get(base_url + 'pano/api/nodes/')
+
+
+class VirtualUser(threading.Thread):
+    def __init__(self, number, base_urls, fleet, mix, args, results, stop_at):
+        super(VirtualUser, self).__init__(name='vu-%d' % number)
+        self.daemon = True
+        self.base_url = base_urls[number % len(base_urls)]
+        self.fleet = fleet
+        self.rng = random.Random(args.seed * 1000 + number)
+        self.requests = [request for weight, request in mix]
+        self.weights = [weight for weight, request in mix]
+        self.args = args
+        self.results = results
+        self.stop_at = stop_at
+
+    def run(self):
+        session = requests.Session()
+        try:
+            login(session, self.base_url, self.args.username, self.args.password)
+        except (requests.RequestException, RuntimeError) as e:
+            self.results.error('login', str(e))
+            return
+        while time.time() < self.stop_at:
+            request = self.rng.choices(self.requests, weights=self.weights)[0]
+            path = request(self.fleet, self.rng)
+            started = time.perf_counter()
+            try:
+                response = session.get(self.base_url + path.lstrip('/'), timeout=self.args.timeout)
+                # Read the whole body, for streamed CSV the time includes the full download.
+                size = len(response.content)
+                elapsed = time.perf_counter() - started
+                if response.status_code == 200:
+                    self.results.add(request.__name__, elapsed, size)
+                else:
+                    self.results.error(request.__name__, 'HTTP %d' % response.status_code)
+            except requests.RequestException as e:
+                self.results.error(request.__name__, e.__class__.__name__)
+            if self.args.think_time:
+                time.sleep(self.rng.uniform(0, 2 * self.args.think_time))
+
+
+class Results(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.bytes = defaultdict(int)
+        self.errors = defaultdict(lambda: defaultdict(int))
+
+    def add(self, name, elapsed, size):
+        with self.lock:
+            self.latencies[name].append(elapsed)
+            self.bytes[name] += size
+
+    def error(self, name, reason):
+        with self.lock:
+            self.errors[name][reason] += 1
+
+    def summary(self, duration):
+        rows = {}
+        names = set(self.latencies) | set(self.errors)
+        everything = []
+        for name in sorted(names):
+            values = sorted(self.latencies.get(name, []))
+            everything.extend(values)
+            rows[name] = self.row(values, duration, sum(self.errors[name].values()), self.bytes[name])
+            rows[name]['error_reasons'] = dict(self.errors[name])
+        everything.sort()
+        rows['total'] = self.row(everything, duration, sum(sum(e.values()) for e in self.errors.values()),
+                                 sum(self.bytes.values()))
+        return rows
+
+    @staticmethod
+    def row(values, duration, errors, size):
+        return {
+            'requests': len(values),
+            'errors': errors,
+            'throughput': len(values) / duration if duration else 0.0,
+            'mean': sum(values) / len(values) if values else 0.0,
+            'p50': percentile(values, 50),
+            'p95': percentile(values, 95),
+            'p99': percentile(values, 99),
+            'max': values[-1] if values else 0.0,
+            'bytes': size,
+        }
+
+
+def stub_arguments(args):
+    argv = ['--nodes', str(args.nodes), '--seed', str(args.seed), '--event-density', str(args.event_density),
+            '--fact-count', str(args.fact_count), '--fact-cardinality', str(args.fact_cardinality),
+            '--catalog-size', str(args.catalog_size), '--roles', str(args.roles), '--drift', str(args.drift),
+            '--latency', str(args.latency), '--latency-per-record', str(args.latency_per_record),
+            '--jitter', str(args.jitter)]
+    if args.status_mix:
+        argv += ['--status-mix', args.status_mix]
+    return argv
+
+
+def start_environment(args, workdir):
+    """Start the stub PuppetDB and the PanoPuppet workers, return (processes, worker base urls, worker pids)."""
+    processes = []
+    stub_port = free_port()
+    stub = subprocess.Popen([sys.executable, '-m', 'benchmarks.stub_puppetdb', '--port', str(stub_port)] +
+                            stub_arguments(args), stdout=subprocess.DEVNULL)
+    processes.append(stub)
+    wait_for_port(stub_port, stub)
+
+    options = {'CACHE_TIME': args.cache_time}
+    config = write_config('http://127.0.0.1:%d/' % stub_port, workdir, **options)
+    appserver = [sys.executable, '-m', 'benchmarks.appserver', '--config', config,
+                 '--username', args.username, '--password', args.password]
+    subprocess.check_call(appserver + ['--setup-db'])
+
+    base_urls = []
+    pids = []
+    for number in range(args.workers):
+        port = free_port()
+        worker = subprocess.Popen(appserver + ['--port', str(port)], stdout=subprocess.DEVNULL)
+        processes.append(worker)
+        wait_for_port(port, worker)
+        base_urls.append('http://127.0.0.1:%d/' % port)
+        pids.append(worker.pid)
+    return processes, base_urls, pids
+
+
+def print_report(summary, workers, duration, users):
+    print('Duration %.1fs, %d virtual users' % (duration, users))
+    print('%-18s %8s %7s %9s %9s %9s %9s %9s' % ('request', 'count', 'errors', 'req/s', 'p50 ms', 'p95 ms',
+                                                 'p99 ms', 'max ms'))
+    for name, row in sorted(summary.items(), key=lambda item: item[0] == 'total'):
+        print('%-18s %8d %7d %9.2f %9.1f %9.1f %9.1f %9.1f' % (
+            name, row['requests'], row['errors'], row['throughput'], row['p50'] * 1000, row['p95'] * 1000,
+            row['p99'] * 1000, row['max'] * 1000))
+    for name, row in sorted(summary.items()):
+        for reason, count in sorted(row.get('error_reasons', {}).items()):
+            print('  %s: %d x %s' % (name, count, reason))
+    if workers:
+        print('%-10s %14s %14s %13s' % ('worker', 'peak RSS MB', 'end RSS MB', 'peak threads'))
+        for pid, peaks in sorted(workers.items()):
+            print('%-10d %14.1f %14.1f %13d' % (pid, peaks['peak_rss_kb'] / 1024.0, peaks['rss_kb'] / 1024.0,
+                                                peaks['peak_threads']))
+
+
+def main():
+    parser = fleet_arguments(argparse.ArgumentParser(description='Load test PanoPuppet against a stub PuppetDB.'))
+    parser.add_argument('--mix', default='mixed', choices=sorted(MIXES), help='Traffic mix')
+    parser.add_argument('--users', type=int, default=10, help='Concurrent virtual users')
+    parser.add_argument('--duration', type=float, default=30, help='Test duration in seconds')
+    parser.add_argument('--ramp-up', type=float, default=0, help='Seconds over which the users are started')
+    parser.add_argument('--think-time', type=float, default=0, help='Average pause between requests in seconds')
+    parser.add_argument('--timeout', type=float, default=120, help='Request timeout in seconds')
+    parser.add_argument('--workers', type=int, default=1, help='PanoPuppet worker processes to start')
+    parser.add_argument('--cache-time', type=int, default=0, help='CACHE_TIME of the started workers')
+    parser.add_argument('--latency', type=float, default=5, help='Stub PuppetDB base latency in ms')
+    parser.add_argument('--latency-per-record', type=float, default=0, help='Stub latency per record in us')
+    parser.add_argument('--jitter', type=float, default=0, help='Stub maximum random extra latency in ms')
+    parser.add_argument('--target', default=None,
+                        help='Base url of an already running PanoPuppet, for example http://127.0.0.1:8000/. '
+                             'It must use a stub PuppetDB started with the same fleet options.')
+    parser.add_argument('--worker-pids', default='', help='Comma separated pids to sample when using --target')
+    parser.add_argument('--username', default='loadtest')
+    parser.add_argument('--password', default='loadtest')
+    parser.add_argument('--output', default=None, help='Write the results as json to this file')
+    args = parser.parse_args()
+
+    fleet = fleet_from_arguments(args)
+    processes = []
+    workdir = None
+    if args.target:
+        base_urls = [url if url.endswith('/') else url + '/' for url in args.target.split(',')]
+        pids = [int(pid) for pid in args.worker_pids.split(',') if pid]
+    else:
+        workdir = tempfile.mkdtemp(prefix='panopuppet-loadtest-')
+        processes, base_urls, pids = start_environment(args, workdir)
+
+    sampler = ProcessSampler(pids)
+    results = Results()
+    try:
+        sampler.start()
+        started = time.time()
+        stop_at = started + args.ramp_up + args.duration
+        users = []
+        for number in range(args.users):
+            user = VirtualUser(number, base_urls, fleet, MIXES[args.mix], args, results, stop_at)
+            user.start()
+            users.append(user)
+            if args.ramp_up:
+                time.sleep(args.ramp_up / args.users)
+        for user in users:
+            user.join()
+        duration = time.time() - started
+        sampler.stop()
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    summary = results.summary(duration)
+    print_report(summary, sampler.peaks, duration, args.users)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump({'mix': args.mix, 'users': args.users, 'workers': len(base_urls), 'nodes': args.nodes,
+                       'duration': duration, 'requests': summary,
+                       'processes': {str(pid): peaks for pid, peaks in sampler.peaks.items()}},
+                      output_file, indent=2, sort_keys=True)
+    return 1 if summary['total']['errors'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
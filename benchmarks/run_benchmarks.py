@@ -0,0 +1,340 @@
+"""
+Benchmarks of the pure python functions that dominate PanoPuppet request CPU.
+
+    python -m benchmarks.run_benchmarks                      # compare against benchmarks/baselines.json
+    python -m benchmarks.run_benchmarks --update-baselines   # store new baselines
+    python -m benchmarks.run_benchmarks --sizes 1000,10000,100000 --filter dictstatus
+
+Inputs are generated with the fleet generator at several fleet sizes.
+Every run times a fixed calibration workload and the results are scaled by
+it before being compared with the baselines, so baselines stored on one
+machine can be used on another. A benchmark regresses when its scaled time
+is more than --threshold times the baseline, the exit code is then 1.
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import timeit
+
+from benchmarks.fleet import Fleet
+from benchmarks.stub_puppetdb import start_stub
+
+__author__ = 'etaklar'
+
+BASELINES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines.json')
+DEFAULT_SIZES = (1000, 10000)
+DEFAULT_THRESHOLD = 1.3
+
+# A query as generated by the query builder, used for query_to_rules.
+QUERY_BUILDER_QUERY = json.dumps(
+    ['and',
+     ['in', 'certname', ['extract', 'certname', ['select_fact_contents',
+                                                 ['and', ['=', 'path', ['operatingsystem']],
+                                                  ['=', 'value', 'CentOS']]]]],
+     ['or',
+      ['in', 'certname', ['extract', 'certname', ['select_fact_contents',
+                                                  ['and', ['=', 'path', ['kernelrelease']],
+                                                   ['~', 'value', '3.10']]]]],
+      ['in', 'certname', ['extract', 'certname', ['select_resources',
+                                                  ['and', ['=', 'type', 'Class'],
+                                                   ['=', 'title', 'Role::Role01']]]]]],
+     ['in', 'certname', ['extract', 'certname', ['select_nodes',
+                                                 ['and', ['~', 'certname', 'dc1'],
+                                                  ['>', 'report_timestamp', '2016-01-01T00:00:00.000Z']]]]]])
+
+
+def calibrate():
+    """Fixed pure python workload used to scale timings between machines."""
+    data = {}
+    for i in range(20000):
+        data['node%06d' % i] = (i * 7919) % 1000
+    return sorted(data.items(), key=lambda item: item[1])
+
+
+def event_dict(fleet):
+    return {item['subject']['title']: item for item in fleet.event_counts()}
+
+
+def reports_dict(fleet):
+    return {node['certname']: {'certname': node['certname'], 'status': node['latest_report_status']}
+            for node in fleet.nodes()}
+
+
+def bench_dictstatus_all(fleet):
+    from panopuppet.pano.methods.dictfuncs import dictstatus
+    nodes = fleet.nodes()
+    events = event_dict(fleet)
+    run_time = fleet.run_interval
+
+    def run():
+        # dictstatus adds empty entries to the status dict, start from a fresh copy.
+        dictstatus(nodes, None, dict(events), sortby='report_timestamp', asc=True, sort=False,
+                   puppet_run_time=run_time, format_time=False)
+    return run
+
+
+def bench_dictstatus_all_status_sort(fleet):
+    from panopuppet.pano.methods.dictfuncs import dictstatus
+    nodes = fleet.nodes()
+    events = event_dict(fleet)
+    run_time = fleet.run_interval
+
+    def run():
+        dictstatus(nodes, None, dict(events), sortby='failures', asc=True, sort=False,
+                   puppet_run_time=run_time, format_time=False)
+    return run
+
+
+def bench_dictstatus_dashboard(fleet):
+    from panopuppet.pano.methods.dictfuncs import dictstatus
+    nodes = fleet.nodes()
+    events = event_dict(fleet)
+    reports = reports_dict(fleet)
+    run_time = fleet.run_interval
+
+    def run():
+        dictstatus(nodes, reports, dict(events), sort=True, sortby='latestReport', get_status='notall',
+                   puppet_run_time=run_time)
+    return run
+
+
+def bench_summary_of_events(fleet):
+    from panopuppet.pano.methods.events import summary_of_events
+    events = []
+    for node in fleet.nodes():
+        events.extend(fleet.events(node['certname']))
+
+    def run():
+        summary_of_events(events)
+    return run
+
+
+def bench_dictdiffer(fleet):
+    from panopuppet.pano.methods.dictfuncs import DictDiffer
+    # Two nodes with the same role where one has drifted, keyed by title like catalogue_compare_json.
+    certnames = fleet.certnames()
+    baseline = certnames[0]
+    role = fleet.meta(baseline)['role']
+    other = next((c for c in certnames if fleet.meta(c)['role'] == role and fleet.meta(c)['drifted']),
+                 certnames[-1])
+    node_for = {resource['title']: resource for resource in fleet.catalog(baseline)['resources']['data']}
+    node_agn = {resource['title']: resource for resource in fleet.catalog(other)['resources']['data']}
+
+    def run():
+        diff = DictDiffer(node_agn, node_for)
+        diff.added()
+        diff.removed()
+        diff.changed()
+    return run
+
+
+def bench_mk_puppetdb_query(fleet):
+    from panopuppet.pano.puppetdb.puppetdb import mk_puppetdb_query
+    node_filter = ', ["or"' + ''.join(
+        ',["=","certname","%s"]' % certname for certname in fleet.certnames()[:100]) + ']'
+    params = [
+        {
+            'query': {1: '["~","certname","dc1"]'},
+            'order_by': {'order_field': {'field': 'report_timestamp', 'order': 'desc'}},
+            'limit': 50,
+            'offset': 100,
+            'include_total': 'true',
+        },
+        {
+            'query': {1: '["and" %s, ["=","latest_report?",true],["in", "certname",["extract", "certname",'
+                         '["select_nodes",["null?","deactivated",true]]]]]' % node_filter},
+            'summarize_by': 'certname',
+        },
+        {
+            'query': {
+                'operator': 'and',
+                1: '["=","latest_report?",true]',
+                2: '["=","certname","%s"]' % fleet.certnames()[0],
+            },
+        },
+    ]
+
+    def run():
+        for param in params:
+            mk_puppetdb_query(param)
+    return run
+
+
+def bench_generate_csv(fleet):
+    from panopuppet.pano.methods.dictfuncs import dictstatus
+    from panopuppet.pano.puppetdb.pdbutils import generate_csv
+    include_facts = ['kernel', 'ipaddress', 'operatingsystem']
+    rows = dictstatus(fleet.nodes(), None, event_dict(fleet), sortby='report_timestamp', sort=False,
+                      puppet_run_time=fleet.run_interval, format_time=False)
+    facts = {}
+    for fact in include_facts:
+        facts[fact] = {node['certname']: {'certname': node['certname'], 'name': fact,
+                                          'value': fleet.fact_value(node['certname'], fact)}
+                       for node in fleet.nodes()}
+    jobs = {}
+    for i, row in enumerate(rows, 1):
+        jobs[i] = {'id': i, 'include_facts': include_facts, 'node': row, 'facts': facts}
+
+    def run():
+        generate_csv(jobs)
+    return run
+
+
+def bench_json_to_datetime(fleet):
+    from panopuppet.pano.puppetdb.pdbutils import json_to_datetime
+    timestamps = [node['report_timestamp'] for node in fleet.nodes()]
+
+    def run():
+        for timestamp in timestamps:
+            json_to_datetime(timestamp)
+    return run
+
+
+def bench_is_unreported(fleet):
+    from panopuppet.pano.puppetdb.pdbutils import is_unreported
+    timestamps = [node['report_timestamp'] for node in fleet.nodes()]
+    run_time = fleet.run_interval
+
+    def run():
+        for timestamp in timestamps:
+            is_unreported(timestamp, unreported=run_time)
+    return run
+
+
+def bench_query_to_rules(fleet):
+    from panopuppet.pano.templatetags.common import query_to_rules
+
+    def run():
+        query_to_rules(QUERY_BUILDER_QUERY)
+    return run
+
+
+# name, setup function, which sizes the benchmark runs at:
+# 'fleet' runs at every --sizes, 'catalog' at every --catalog-sizes and 'fixed' once.
+BENCHMARKS = [
+    ('dictstatus_all', bench_dictstatus_all, 'fleet'),
+    ('dictstatus_all_status_sort', bench_dictstatus_all_status_sort, 'fleet'),
+    ('dictstatus_dashboard', bench_dictstatus_dashboard, 'fleet'),
+    ('summary_of_events', bench_summary_of_events, 'fleet'),
+    ('dictdiffer_catalog', bench_dictdiffer, 'catalog'),
+    ('mk_puppetdb_query', bench_mk_puppetdb_query, 'fixed'),
+    ('generate_csv', bench_generate_csv, 'fleet'),
+    ('json_to_datetime', bench_json_to_datetime, 'fleet'),
+    ('is_unreported', bench_is_unreported, 'fleet'),
+    ('query_to_rules', bench_query_to_rules, 'fixed'),
+]
+
+
+def measure(func, repeat=5, min_time=0.2):
+    """Best time in seconds of a single call to func."""
+    timer = timeit.Timer(func)
+    number, elapsed = timer.autorange()
+    if elapsed < min_time:
+        number = max(int(number * min_time / max(elapsed, 1e-9)), 1)
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def load_baselines(path):
+    if not os.path.exists(path):
+        return {'calibration': None, 'results': {}}
+    with open(path) as baseline_file:
+        return json.load(baseline_file)
+
+
+def format_time(seconds):
+    if seconds >= 1:
+        return '%.3fs' % seconds
+    elif seconds >= 0.001:
+        return '%.3fms' % (seconds * 1000)
+    return '%.3fus' % (seconds * 1000000)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the hot PanoPuppet functions.')
+    parser.add_argument('--sizes', default=','.join(str(size) for size in DEFAULT_SIZES),
+                        help='Comma separated fleet sizes')
+    parser.add_argument('--catalog-sizes', default='5000', help='Comma separated catalog sizes for catalog diffs')
+    parser.add_argument('--filter', default=None, help='Only run benchmarks whose name contains this string')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='Fail when a benchmark is slower than threshold * baseline')
+    parser.add_argument('--baselines', default=BASELINES_FILE)
+    parser.add_argument('--update-baselines', action='store_true', help='Store the results as the new baselines')
+    parser.add_argument('--output', default=None, help='Write the results as json to this file')
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(',') if size]
+    catalog_sizes = [int(size) for size in args.catalog_sizes.split(',') if size]
+
+    # PanoPuppet asks PuppetDB for its version on import.
+    server, url = start_stub(Fleet(size=1))
+    from benchmarks.environment import configure
+    configure(url)
+
+    calibration = measure(calibrate, repeat=args.repeat)
+    baselines = load_baselines(args.baselines)
+    base_calibration = baselines.get('calibration') or calibration
+    scale = base_calibration / calibration
+
+    fleets = {}
+    results = {}
+    regressions = []
+    print('%-40s %12s %12s %8s' % ('benchmark', 'time', 'baseline', 'ratio'))
+    for name, setup, kind in BENCHMARKS:
+        if args.filter and args.filter not in name:
+            continue
+        if kind == 'fleet':
+            runs = [('%s[%d]' % (name, size), dict(size=size)) for size in sizes]
+        elif kind == 'catalog':
+            runs = [('%s[%d]' % (name, size), dict(size=10, catalog_size=size)) for size in catalog_sizes]
+        else:
+            runs = [(name, dict(size=min(sizes or [1000])))]
+        for key, fleet_options in runs:
+            fleet_key = tuple(sorted(fleet_options.items()))
+            if fleet_key not in fleets:
+                fleets[fleet_key] = Fleet(seed=1, **fleet_options)
+            func = setup(fleets[fleet_key])
+            elapsed = measure(func, repeat=args.repeat)
+            # Time as it would have been on the machine the baselines were made on.
+            scaled = elapsed * scale
+            results[key] = scaled
+            baseline = baselines['results'].get(key)
+            if baseline:
+                ratio = scaled / baseline
+                status = ''
+                if ratio > args.threshold:
+                    status = 'REGRESSION'
+                    regressions.append(key)
+                print('%-40s %12s %12s %7.2fx %s' % (key, format_time(scaled), format_time(baseline), ratio, status))
+            else:
+                print('%-40s %12s %12s %8s' % (key, format_time(scaled), '-', '-'))
+            sys.stdout.flush()
+    server.shutdown()
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump({'calibration': calibration, 'results': results}, output_file, indent=2, sort_keys=True)
+
+    if args.update_baselines:
+        baselines['calibration'] = base_calibration
+        baselines['results'].update(results)
+        baselines['machine'] = '%s %s, python %s' % (platform.system(), platform.machine(),
+                                                     platform.python_version())
+        with open(args.baselines, 'w') as baseline_file:
+            json.dump(baselines, baseline_file, indent=2, sort_keys=True)
+            baseline_file.write('\n')
+        print('Baselines written to %s' % args.baselines)
+        return 0
+
+    if regressions:
+        print('%d benchmark(s) slower than %.2fx their baseline: %s' % (
+            len(regressions), args.threshold, ', '.join(regressions)))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,662 @@
+"""
+Local stand-in for PuppetDB serving a synthetic fleet, see benchmarks/fleet.py.
+
+Serves the v4 query endpoints PanoPuppet uses (nodes, reports, events,
+event-counts, aggregate-event-counts, facts, fact-contents, factsets,
+fact-names, catalogs, resources, environments), the population mbeans
+and /pdb/meta/v1/version. Queries are evaluated for the operators used
+by PanoPuppet including subqueries and extract, order_by, limit, offset
+and include_total are supported.
+
+Run it stand alone:
+    python -m benchmarks.stub_puppetdb --nodes 10000 --port 8080 --latency 20
+
+Or from a benchmark:
+    server, url = start_stub(Fleet(size=1000))
+    ...
+    server.shutdown()
+
+/stub/stats returns the number of requests served per endpoint.
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import urllib.parse as urlparse
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+from benchmarks.fleet import Fleet, _sha1
+
+__author__ = 'etaklar'
+
+SELECT_ENTITIES = {
+    'select_nodes': 'nodes',
+    'select_facts': 'facts',
+    'select_fact_contents': 'fact-contents',
+    'select_factsets': 'factsets',
+    'select_resources': 'resources',
+    'select_reports': 'reports',
+    'select_events': 'events',
+    'select_catalogs': 'catalogs',
+}
+
+# Fields of an event that can be answered from the per node event summary.
+EVENT_SUMMARY_FIELDS = {'certname', 'latest_report?', 'report', 'environment'}
+
+
+class QueryError(Exception):
+    pass
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def _constraints(query):
+    """
+    Equality constraints in the top level "and" of the query.
+    Used to narrow down which records must be generated before the query is evaluated.
+    :return: dict of field: set of values
+    """
+    found = {}
+    if not isinstance(query, list) or not query:
+        return found
+    operator = query[0]
+    if operator == 'and':
+        for sub in query[1:]:
+            for field, values in _constraints(sub).items():
+                if field in found:
+                    found[field] = found[field] & values
+                else:
+                    found[field] = values
+    elif operator == 'or':
+        subs = [_constraints(sub) for sub in query[1:]]
+        if subs and all(len(sub) == 1 for sub in subs):
+            fields = set(field for sub in subs for field in sub)
+            if len(fields) == 1:
+                field = fields.pop()
+                found[field] = set(value for sub in subs for value in sub[field])
+    elif operator == '=' and isinstance(query[1], str) and not isinstance(query[2], dict):
+        value = query[2]
+        found[query[1]] = {tuple(value) if isinstance(value, list) else value}
+    elif operator == 'in' and isinstance(query[1], str) and isinstance(query[2], list) \
+            and query[2] and query[2][0] == 'array':
+        found[query[1]] = set(query[2][1])
+    return found
+
+
+def _fields(query):
+    """Fields referenced by the query, not counting subqueries."""
+    fields = set()
+    if not isinstance(query, list) or not query:
+        return fields
+    operator = query[0]
+    if operator in ('and', 'or'):
+        for sub in query[1:]:
+            fields |= _fields(sub)
+    elif operator == 'not':
+        fields |= _fields(query[1])
+    elif operator in ('=', '~', '<', '>', '<=', '>=', 'null?', 'in', '~>'):
+        field = query[1]
+        if isinstance(field, str):
+            fields.add(field)
+        elif isinstance(field, list) and field and isinstance(field[0], str) and field[0] == 'fact':
+            fields.add('fact')
+        else:
+            fields.update(f for f in field if isinstance(f, str))
+    else:
+        fields.add(operator)
+    return fields
+
+
+def _compare(operator, value, other):
+    if value is None:
+        return False
+    try:
+        if operator == '<':
+            return value < other
+        elif operator == '>':
+            return value > other
+        elif operator == '<=':
+            return value <= other
+        elif operator == '>=':
+            return value >= other
+    except TypeError:
+        try:
+            return _compare(operator, float(value), float(other))
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+class StubPuppetDB(object):
+    def __init__(self, fleet, latency=0, latency_per_record=0, jitter=0, seed=0):
+        """
+        :param fleet: Fleet to serve
+        :param latency: Base latency of every response in milliseconds
+        :param latency_per_record: Extra latency per returned record in microseconds
+        :param jitter: Maximum random extra latency in milliseconds
+        """
+        self.fleet = fleet
+        self.latency = latency
+        self.latency_per_record = latency_per_record
+        self.jitter = jitter
+        self._random = random.Random(seed)
+        self._stats_lock = threading.Lock()
+        self.stats = {}
+
+    # Records
+
+    def records(self, entity, query, cache):
+        """All records of the entity that can match the query."""
+        fleet = self.fleet
+        constraints = _constraints(query)
+        certnames = constraints.get('certname')
+        if certnames is None:
+            certnames = [node['certname'] for node in fleet.nodes()]
+        else:
+            certnames = [certname for certname in certnames if fleet.node(certname) is not None]
+
+        if entity == 'nodes':
+            return [fleet.node(certname) for certname in certnames]
+        elif entity == 'environments':
+            return [{'name': environment} for environment in fleet.environments]
+        elif entity == 'fact-names':
+            return fleet.fact_names()
+        elif entity in ('facts', 'fact-contents'):
+            names = constraints.get('name')
+            if entity == 'fact-contents' and 'path' in constraints:
+                names = set(path[0] for path in constraints['path'] if path)
+            names = [name for name in (names or fleet.fact_names()) if name in fleet.fact_names()]
+            records = []
+            for certname in certnames:
+                for record in fleet.fact_records(certname, names):
+                    if entity == 'fact-contents':
+                        record['path'] = [record['name']]
+                    records.append(record)
+            return records
+        elif entity == 'factsets':
+            return [{
+                'certname': certname,
+                'environment': fleet.meta(certname)['environment'],
+                'timestamp': fleet.node(certname)['facts_timestamp'],
+                'producer_timestamp': fleet.node(certname)['facts_timestamp'],
+                'hash': _sha1(certname, 'factset'),
+                'facts': {'href': '/pdb/query/v4/factsets/%s/facts' % certname,
+                          'data': [{'name': name, 'value': value} for name, value in
+                                   sorted(fleet.facts(certname).items())]},
+            } for certname in certnames]
+        elif entity in ('reports', 'events'):
+            pairs = self._report_pairs(certnames, constraints)
+            if entity == 'reports':
+                return [fleet.report(certname, index) for certname, index in pairs]
+            records = []
+            for certname, index in pairs:
+                records.extend(fleet.events(certname, index))
+            return records
+        elif entity == 'catalogs':
+            return [fleet.catalog(certname) for certname in certnames]
+        elif entity == 'resources':
+            return self._resources(certnames, constraints)
+        raise QueryError('Unknown entity %s' % entity)
+
+    def _report_pairs(self, certnames, constraints):
+        fleet = self.fleet
+        if 'hash' in constraints or 'report' in constraints:
+            hashes = constraints.get('hash', set()) | constraints.get('report', set())
+            pairs = [fleet.find_report(report_hash) for report_hash in hashes]
+            return [pair for pair in pairs if pair is not None and pair[0] in set(certnames)]
+        if constraints.get('latest_report?') == {True}:
+            return [(certname, 0) for certname in certnames]
+        return [(certname, index) for certname in certnames for index in range(fleet.history)]
+
+    def _resources(self, certnames, constraints):
+        fleet = self.fleet
+        types = constraints.get('type')
+        titles = constraints.get('title')
+        records = []
+        for certname in certnames:
+            meta = fleet.meta(certname)
+            keys = None
+            if types is not None or titles is not None:
+                keys = [key for key in fleet.resource_keys(meta['role'])
+                        if (types is None or key[0] in types) and (titles is None or key[1] in titles)]
+                if not keys:
+                    continue
+            for resource in fleet.resources(certname, keys):
+                resource.pop('containing_class', None)
+                resource['certname'] = certname
+                resource['environment'] = meta['environment']
+                records.append(resource)
+        return records
+
+    # Query evaluation
+
+    def field_value(self, entity, record, field):
+        if isinstance(field, list):
+            if field and field[0] == 'fact':
+                return self.fleet.fact_value(record.get('certname'), field[1])
+            return tuple(record.get(f) for f in field)
+        if field == 'latest_report?' and 'latest_report?' not in record:
+            return True
+        if entity == 'events' and field == 'report':
+            return record.get('report')
+        if '.' in field and field not in record:
+            value = record
+            for part in field.split('.'):
+                value = value.get(part) if isinstance(value, dict) else None
+            return value
+        return record.get(field)
+
+    def subquery_values(self, subquery, cache):
+        """Set of values extracted by a ["extract", fields, ["select_<entity>", query]] subquery."""
+        key = json.dumps(subquery, sort_keys=True)
+        if key in cache:
+            return cache[key]
+        if not subquery or subquery[0] == 'array':
+            values = set(subquery[1]) if subquery else set()
+        elif subquery[0] == 'extract':
+            fields = subquery[1]
+            select = subquery[2]
+            if not isinstance(select, list) or select[0] not in SELECT_ENTITIES:
+                raise QueryError('Unsupported subquery %s' % json.dumps(subquery))
+            entity = SELECT_ENTITIES[select[0]]
+            query = select[1] if len(select) > 1 else None
+            values = set()
+            for record in self.filter(entity, query, cache):
+                if isinstance(fields, list):
+                    values.add(tuple(self.field_value(entity, record, field) for field in fields))
+                else:
+                    value = self.field_value(entity, record, fields)
+                    values.add(tuple(value) if isinstance(value, list) else value)
+        else:
+            raise QueryError('Unsupported subquery %s' % json.dumps(subquery))
+        cache[key] = values
+        return values
+
+    def match(self, entity, record, query, cache):
+        if not query:
+            return True
+        operator = query[0]
+        if operator == 'and':
+            return all(self.match(entity, record, sub, cache) for sub in query[1:])
+        elif operator == 'or':
+            return any(self.match(entity, record, sub, cache) for sub in query[1:])
+        elif operator == 'not':
+            return not self.match(entity, record, query[1], cache)
+        elif operator == 'in':
+            value = self.field_value(entity, record, query[1])
+            if isinstance(value, list):
+                value = tuple(value)
+            return value in self.subquery_values(query[2], cache)
+        elif operator == 'subquery':
+            sub_entity = query[1]
+            certnames = self.subquery_values(
+                ['extract', 'certname', ['select_' + sub_entity.replace('-', '_'), query[2]]], cache)
+            return record.get('certname') in certnames
+        elif operator == 'extract':
+            return self.match(entity, record, query[2] if len(query) > 2 else None, cache)
+        value = self.field_value(entity, record, query[1])
+        if operator == '=':
+            if isinstance(value, list):
+                value = list(value)
+            return value == query[2]
+        elif operator == '~':
+            if value is None:
+                return False
+            return re.search(query[2], str(value)) is not None
+        elif operator == '~>':
+            if not isinstance(value, (list, tuple)) or len(value) != len(query[2]):
+                return False
+            return all(re.search(pattern, str(part)) for pattern, part in zip(query[2], value))
+        elif operator == 'null?':
+            return (value is None) == query[2]
+        elif operator in ('<', '>', '<=', '>='):
+            return _compare(operator, value, query[2])
+        raise QueryError('Unsupported operator %s' % operator)
+
+    def filter(self, entity, query, cache):
+        if entity == 'event-counts':
+            raise QueryError('event-counts can not be used in a subquery')
+        return [record for record in self.records(entity, query, cache)
+                if self.match(entity, record, query, cache)]
+
+    def event_counts(self, query, summarize_by, cache):
+        """event-counts for the events matching the query summarized by certname, resource or containing_class."""
+        fleet = self.fleet
+        if summarize_by == 'certname' and _fields(query) <= EVENT_SUMMARY_FIELDS | {'in'}:
+            # Only node level fields are used, answer from the event summary of the latest reports.
+            # Queries over all reports are answered for the latest report only.
+            counts = []
+            constraints = _constraints(query)
+            certnames = constraints.get('certname') or [node['certname'] for node in fleet.nodes()]
+            for certname in certnames:
+                if fleet.node(certname) is None:
+                    continue
+                summary = {
+                    'certname': certname,
+                    'latest_report?': True,
+                    'report': fleet.report_hash(certname),
+                    'environment': fleet.meta(certname)['environment'],
+                }
+                if not self.match('events', summary, query, cache):
+                    continue
+                item = fleet.event_count(certname)
+                if item is not None:
+                    counts.append(item)
+            return counts
+        summaries = {}
+        for event in self.filter('events', query, cache):
+            if summarize_by == 'certname':
+                key = event['certname']
+                subject = {'title': event['certname']}
+            elif summarize_by == 'containing_class':
+                key = event['containing_class']
+                subject = {'title': event['containing_class']}
+            elif summarize_by == 'resource':
+                key = (event['resource_type'], event['resource_title'])
+                subject = {'type': event['resource_type'], 'title': event['resource_title']}
+            else:
+                raise QueryError('Unsupported summarize_by %s' % summarize_by)
+            if key not in summaries:
+                summaries[key] = {'subject_type': summarize_by, 'subject': subject,
+                                  'successes': 0, 'failures': 0, 'noops': 0, 'skips': 0}
+            field = {'success': 'successes', 'failure': 'failures', 'noop': 'noops', 'skipped': 'skips'}
+            summaries[key][field[event['status']]] += 1
+        return list(summaries.values())
+
+    def aggregate_event_counts(self, query, summarize_by, cache):
+        results = []
+        for summary in summarize_by.split(','):
+            counts = self.event_counts(query, summary.strip(), cache)
+            results.append({
+                'summarize_by': summary.strip(),
+                'successes': sum(1 for item in counts if item['successes']),
+                'failures': sum(1 for item in counts if item['failures']),
+                'noops': sum(1 for item in counts if item['noops']),
+                'skips': sum(1 for item in counts if item['skips']),
+                'total': len(counts),
+            })
+        return results
+
+    @staticmethod
+    def extract(records, fields, group_by=None):
+        """Top level extract with optional functions and group_by."""
+        if not isinstance(fields, list) or (fields and fields[0] == 'function'):
+            fields = [fields]
+        functions = [field for field in fields if isinstance(field, list) and field[0] == 'function']
+        plain = [field for field in fields if not (isinstance(field, list) and field[0] == 'function')]
+        if not functions:
+            return [{field: record.get(field) for field in plain} for record in records]
+        groups = {}
+        for record in records:
+            key = tuple(record.get(field) for field in (group_by or []))
+            groups.setdefault(key, []).append(record)
+        if not groups and not group_by:
+            groups[()] = []
+        results = []
+        for key, members in groups.items():
+            row = dict(zip(group_by or [], key))
+            for function in functions:
+                name = function[1]
+                values = [record.get(function[2]) for record in members] if len(function) > 2 else members
+                values = [value for value in values if value is not None]
+                if name == 'count':
+                    row['count'] = len(values)
+                elif name in ('max', 'min'):
+                    row[name] = (max if name == 'max' else min)(values) if values else None
+                elif name == 'sum':
+                    row['sum'] = sum(values)
+                elif name == 'avg':
+                    row['avg'] = float(sum(values)) / len(values) if values else None
+            results.append(row)
+        return results
+
+    @staticmethod
+    def order(records, order_by):
+        for order in reversed(order_by):
+            field = order.get('field')
+            reverse = order.get('order', 'asc').lower() == 'desc'
+            records.sort(key=lambda record: (record.get(field) is None, record.get(field)
+                                             if record.get(field) is not None else 0), reverse=reverse)
+        return records
+
+    # Endpoints
+
+    def query(self, entity, params, extra=None):
+        """
+        :param entity: Query endpoint name
+        :param params: dict of GET params
+        :param extra: Extra query added to the query from the params, used for path style urls
+        :return: list of records, total number of records
+        """
+        cache = {}
+        query = json.loads(params['query']) if params.get('query') else None
+        if extra:
+            query = ['and', extra, query] if query else extra
+        extract = None
+        group_by = None
+        if query and query[0] == 'extract':
+            extract = query[1]
+            if len(query) > 3 and isinstance(query[3], list) and query[3][0] == 'group_by':
+                group_by = query[3][1:]
+            query = query[2] if len(query) > 2 and query[2] and query[2][0] != 'group_by' else None
+
+        if entity == 'event-counts':
+            records = self.event_counts(query, params.get('summarize_by', 'certname'), cache)
+        elif entity == 'aggregate-event-counts':
+            records = self.aggregate_event_counts(query, params.get('summarize_by', 'certname'), cache)
+        elif entity == 'fact-names':
+            records = self.fleet.fact_names()
+        else:
+            records = self.filter(entity, query, cache)
+        if extract is not None:
+            records = self.extract(records, extract, group_by)
+
+        if params.get('order_by') and records and isinstance(records[0], dict):
+            self.order(records, json.loads(params['order_by']))
+        total = len(records)
+        offset = int(params.get('offset') or 0)
+        if offset:
+            records = records[offset:]
+        if params.get('limit'):
+            records = records[:int(params['limit'])]
+        return records, total
+
+    def mbean(self, name):
+        if 'num-resources' in name:
+            return {'Value': self.fleet.num_resources()}
+        elif 'avg-resources-per-node' in name:
+            return {'Value': self.fleet.avg_resources_per_node()}
+        elif 'num-nodes' in name:
+            return {'Value': self.fleet.size}
+        return None
+
+    def handle(self, path, params):
+        """
+        :param path: Url path without the query string
+        :param params: dict of GET params
+        :return: status code, dict of headers, body
+        """
+        path = urlparse.unquote(path)
+        if path.startswith('/metrics/v1/mbeans/'):
+            self._count('mbeans')
+            value = self.mbean(path[len('/metrics/v1/mbeans/'):])
+            if value is None:
+                return 404, {}, {'error': 'No such mbean'}
+            return 200, {}, value
+        if path == '/pdb/meta/v1/version':
+            self._count('version')
+            return 200, {}, {'version': '4.4.0'}
+        if path == '/stub/stats':
+            with self._stats_lock:
+                return 200, {}, dict(self.stats)
+        if not path.startswith('/pdb/query/v4/'):
+            return 404, {}, {'error': 'Not found'}
+
+        parts = path[len('/pdb/query/v4/'):].strip('/').split('/')
+        entity = parts[0]
+        self._count(entity)
+        try:
+            if entity == 'catalogs' and len(parts) >= 2:
+                catalog = self.fleet.catalog(parts[1])
+                if catalog is None:
+                    return 404, {}, {'error': 'Could not find catalog for %s' % parts[1]}
+                if len(parts) == 3 and parts[2] in ('resources', 'edges'):
+                    return 200, {}, catalog[parts[2]]['data']
+                return 200, {}, catalog
+            if entity == 'nodes' and len(parts) >= 2:
+                node = self.fleet.node(parts[1])
+                if node is None:
+                    return 404, {}, {'error': 'No information is known about node %s' % parts[1]}
+                if len(parts) == 3 and parts[2] in ('facts', 'resources'):
+                    records, total = self.query(parts[2], params, ['=', 'certname', parts[1]])
+                    return 200, self._total_header(params, total), records
+                return 200, {}, node
+            if entity == 'reports' and len(parts) == 3:
+                found = self.fleet.find_report(parts[1])
+                if found is None:
+                    return 200, {}, []
+                report = self.fleet.report(*found)
+                section = {'logs': 'logs', 'metrics': 'metrics', 'events': 'resource_events'}.get(parts[2])
+                if section is None:
+                    return 404, {}, {'error': 'Not found'}
+                return 200, {}, report[section]['data']
+            extra = None
+            if entity == 'facts' and len(parts) >= 2:
+                extra = ['=', 'name', parts[1]]
+                if len(parts) == 3:
+                    extra = ['and', extra, ['=', 'value', parts[2]]]
+            elif len(parts) != 1:
+                return 404, {}, {'error': 'Not found'}
+            records, total = self.query(entity, params, extra)
+            return 200, self._total_header(params, total), records
+        except (QueryError, ValueError, IndexError, TypeError) as e:
+            return 400, {}, 'Invalid query: %s' % e
+
+    @staticmethod
+    def _total_header(params, total):
+        if str(params.get('include_total', '')).lower() == 'true':
+            return {'X-Records': str(total)}
+        return {}
+
+    def _count(self, entity):
+        with self._stats_lock:
+            self.stats[entity] = self.stats.get(entity, 0) + 1
+
+    def delay(self, records):
+        delay = self.latency / 1000.0
+        if self.latency_per_record and isinstance(records, list):
+            delay += len(records) * self.latency_per_record / 1000000.0
+        if self.jitter:
+            delay += self._random.uniform(0, self.jitter) / 1000.0
+        if delay > 0:
+            time.sleep(delay)
+
+
+def make_handler(stub):
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            url = urlparse.urlsplit(self.path)
+            params = dict(urlparse.parse_qsl(url.query, keep_blank_values=True))
+            status, headers, body = stub.handle(url.path, params)
+            stub.delay(body)
+            if isinstance(body, str):
+                payload = body.encode('utf-8')
+                content_type = 'text/plain'
+            else:
+                payload = json.dumps(body).encode('utf-8')
+                content_type = 'application/json'
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(payload)))
+            for header, value in headers.items():
+                self.send_header(header, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        do_HEAD = do_GET
+
+        def log_message(self, format, *args):
+            pass
+
+    return StubHandler
+
+
+def start_stub(fleet, host='127.0.0.1', port=0, **options):
+    """
+    Start a stub PuppetDB for the fleet in a background thread.
+    :param options: latency, latency_per_record and jitter, see StubPuppetDB
+    :return: server, base url of the server
+    """
+    stub = StubPuppetDB(fleet, **options)
+    server = ThreadingHTTPServer((host, port), make_handler(stub))
+    server.stub = stub
+    thread = threading.Thread(target=server.serve_forever, name='stub-puppetdb')
+    thread.daemon = True
+    thread.start()
+    return server, 'http://%s:%d/' % (server.server_address[0], server.server_address[1])
+
+
+def fleet_arguments(parser):
+    """Add the fleet generator options to an argparse parser."""
+    parser.add_argument('--nodes', type=int, default=1000, help='Number of nodes in the fleet')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--event-density', type=int, default=5, help='Average events in a report with changes')
+    parser.add_argument('--fact-count', type=int, default=40, help='Facts per node')
+    parser.add_argument('--fact-cardinality', type=int, default=20, help='Distinct values of custom facts')
+    parser.add_argument('--catalog-size', type=int, default=400, help='Resources per catalog')
+    parser.add_argument('--roles', type=int, default=10)
+    parser.add_argument('--drift', type=float, default=0.05, help='Fraction of nodes with drifted catalogs')
+    parser.add_argument('--status-mix', default=None,
+                        help='Weights of node states, e.g. unchanged=70,changed=12,failed=5,pending=5,'
+                             'unreported=5,mismatch=3')
+    return parser
+
+
+def fleet_from_arguments(args):
+    status_mix = None
+    if args.status_mix:
+        status_mix = {}
+        for item in args.status_mix.split(','):
+            name, weight = item.split('=')
+            status_mix[name.strip()] = float(weight)
+    return Fleet(size=args.nodes,
+                 seed=args.seed,
+                 status_mix=status_mix,
+                 event_density=args.event_density,
+                 fact_count=args.fact_count,
+                 fact_cardinality=args.fact_cardinality,
+                 catalog_size=args.catalog_size,
+                 roles=args.roles,
+                 drift=args.drift)
+
+
+def main():
+    parser = fleet_arguments(argparse.ArgumentParser(description='Stub PuppetDB serving a synthetic fleet.'))
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=0, help='Base latency in ms')
+    parser.add_argument('--latency-per-record', type=float, default=0, help='Extra latency per record in us')
+    parser.add_argument('--jitter', type=float, default=0, help='Maximum random extra latency in ms')
+    args = parser.parse_args()
+
+    fleet = fleet_from_arguments(args)
+    stub = StubPuppetDB(fleet, latency=args.latency, latency_per_record=args.latency_per_record,
+                        jitter=args.jitter, seed=args.seed)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(stub))
+    print('Serving %d nodes on http://%s:%d/' % (fleet.size, args.host, args.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,38 @@
+import time
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+
+from panopuppet.pano.methods.catalogcapture import CatalogCapture, SourceSession
+from panopuppet.pano.settings import CATALOG_CAPTURE_QUERY
+
+__author__ = 'etaklar'
+
+
+class Command(BaseCommand):
+    help = 'Saves the catalogues of the nodes whose catalogue changed, every CATALOG_CAPTURE_INTERVAL seconds.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', default=None, help='Source to watch, the default source if not given.')
+        parser.add_argument('--query', default=CATALOG_CAPTURE_QUERY,
+                            help='PuppetDB query selecting the nodes to watch, all active nodes if not given.')
+        parser.add_argument('--once', action='store_true', help='Compare the catalogues of all nodes once and exit.')
+
+    def handle(self, *args, **options):
+        try:
+            source = SourceSession(options['source'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        capture = CatalogCapture(source, query=options['query'])
+        while True:
+            try:
+                capture.refresh()
+            except requests.RequestException as e:
+                # PuppetDB is not reachable, the next run picks up the changes since the last successful one.
+                self.stderr.write('Capturing catalogues failed: %s' % e)
+            else:
+                self.stdout.write('Checked %(nodes)d nodes, saved %(saved)d catalogues, '
+                                  'deleted %(deleted)d old catalogues.' % capture.last_run)
+            if options['once']:
+                break
+            time.sleep(capture.refresh_interval)
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from panopuppet.pano.methods.catalogstore import compact_catalogues, delete_unused_blobs
+
+__author__ = 'etaklar'
+
+
+class Command(BaseCommand):
+    help = 'Moves saved catalogues stored as json to compressed, deduplicated blobs.'
+
+    def handle(self, *args, **options):
+        moved = compact_catalogues()
+        deleted = delete_unused_blobs()
+        self.stdout.write('Compacted %d saved catalogues, deleted %d unused blobs.' % (moved, deleted))
@@ -0,0 +1,135 @@
+"""
+Saves the catalogue of every node when it changes, so the catalogue history is complete without anyone
+saving catalogues by hand.
+
+Every CATALOG_CAPTURE_INTERVAL seconds the nodes with a catalog_timestamp newer than the newest one seen
+are listed, and the hashes of their catalogues are compared with the hash of the catalogue saved last for
+each node. A node compiles a new catalogue every run but the hash only changes when the catalogue does,
+only catalogues with a new hash are fetched, CATALOG_CAPTURE_THREADS at a time, and saved through
+catalogstore.capture_catalogue. Every CATALOG_CAPTURE_FULL_INTERVAL seconds the hashes of all nodes are
+compared, which picks up nodes missed while PanoPuppet was not running.
+
+After saving, the saved catalogues of the nodes that got a new one are thinned out, see
+catalogstore.apply_retention.
+"""
+
+from panopuppet.pano.methods.catalogdrift import fetch_catalogues
+from panopuppet.pano.methods.catalogstore import apply_retention, capture_catalogue
+from panopuppet.pano.models import SavedCatalogs
+from panopuppet.pano.puppetdb import admission, puppetdb
+from panopuppet.pano.puppetdb.mirror import WATERMARK_OVERLAP
+from panopuppet.pano.puppetdb.pdbutils import BackgroundRefresh, certname_filter, latest_timestamp, \
+    timestamp_before
+from panopuppet.pano.puppetdb.puppetdb import get_server, set_server
+from panopuppet.pano.settings import CATALOG_CAPTURE_FULL_INTERVAL, CATALOG_CAPTURE_INTERVAL, \
+    CATALOG_CAPTURE_QUERY, CATALOG_CAPTURE_THREADS
+
+__author__ = 'etaklar'
+
+# Number of certnames per catalogue hash query and per batch of catalogues fetched.
+CAPTURE_BATCH = 100
+
+
+class SourceSession(object):
+    """Used in place of a request to query a configured source outside of a request."""
+
+    def __init__(self, source=None):
+        self.session = {}
+        if source is not None and set_server(self, source) is False:
+            raise ValueError('Unknown source %s' % source)
+
+
+class CatalogCapture(BackgroundRefresh):
+    refresh_interval = CATALOG_CAPTURE_INTERVAL
+    full_refresh_interval = CATALOG_CAPTURE_FULL_INTERVAL
+
+    def __init__(self, request, query=CATALOG_CAPTURE_QUERY, threads=CATALOG_CAPTURE_THREADS):
+        """
+        :param request: Request or anything with a session to pick the source from
+        :param query: PuppetDB query selecting the nodes to watch, None for all active nodes
+        """
+        super(CatalogCapture, self).__init__()
+        self.request = request
+        self.query = query
+        self.threads = threads
+        self.watermark = None
+        # Counts of the last run: nodes checked, catalogues saved and saved catalogues deleted.
+        self.last_run = None
+
+    def _api_get(self, path, params):
+        source_url, source_certs, source_verify = get_server(self.request)
+        return puppetdb.api_get(
+            api_url=source_url,
+            cert=source_certs,
+            verify=source_verify,
+            path=path,
+            api_version='v4',
+            params=params,
+        )
+
+    def _nodes(self, since=None):
+        query = '["null?","deactivated",true]'
+        if since:
+            query = '["and",%s,[">","catalog_timestamp","%s"]]' % (query, since)
+        if self.query:
+            query = '["and",%s,%s]' % (query, self.query)
+        return self._api_get('/nodes', {
+            'query': '["extract",["certname","catalog_timestamp","latest_report_hash"],%s]' % query})
+
+    def _catalogue_hashes(self, certnames):
+        catalogues = self._api_get('/catalogs', {
+            'query': '["extract",["certname","hash"],%s]' % certname_filter(certnames)})
+        return dict((catalogue['certname'], catalogue['hash']) for catalogue in catalogues)
+
+    @staticmethod
+    def _saved_hashes(certnames):
+        """:return: dict of certname to the hash of the catalogue saved last"""
+        saved = SavedCatalogs.objects.filter(hostname__in=certnames).order_by('timestamp', 'id')
+        return dict(saved.values_list('hostname', 'catalogue_id'))
+
+    def changed_nodes(self, nodes):
+        """:return: The nodes whose catalogue hash differs from their last saved catalogue"""
+        changed = []
+        for start in range(0, len(nodes), CAPTURE_BATCH):
+            batch = nodes[start:start + CAPTURE_BATCH]
+            certnames = [node['certname'] for node in batch]
+            hashes = self._catalogue_hashes(certnames)
+            saved = self._saved_hashes(certnames)
+            changed.extend(node for node in batch
+                           if node['certname'] in hashes and hashes[node['certname']] != saved.get(node['certname']))
+        return changed
+
+    def capture(self, nodes):
+        """
+        Fetch and save the changed catalogues of nodes.
+        :return: list of the certnames of the saved catalogues
+        """
+        captured = []
+        changed = self.changed_nodes(nodes)
+        for start in range(0, len(changed), CAPTURE_BATCH):
+            batch = dict((node['certname'], node) for node in changed[start:start + CAPTURE_BATCH])
+            catalogues = fetch_catalogues(self.request, list(batch), threads=self.threads)
+            for certname, catalogue in catalogues.items():
+                if not isinstance(catalogue, dict) or 'error' in catalogue:
+                    continue
+                capture_catalogue(certname, catalogue, batch[certname].get('latest_report_hash') or '')
+                captured.append(certname)
+        return captured
+
+    def _run(self, since):
+        with admission.priority(admission.BACKGROUND):
+            nodes = self._nodes(since)
+            captured = self.capture(nodes)
+            deleted = apply_retention(hostnames=captured) if captured else 0
+        # Only moved on when every changed catalogue was saved, a failed run is repeated.
+        self.watermark = latest_timestamp(nodes, ('catalog_timestamp',), self.watermark)
+        self.last_run = {'nodes': len(nodes), 'saved': len(captured), 'deleted': deleted}
+
+    def full_refresh(self):
+        self._run(None)
+
+    def incremental_refresh(self):
+        if self.watermark is None:
+            return self.full_refresh()
+        self._run(timestamp_before(self.watermark, WATERMARK_OVERLAP))
+
@@ -0,0 +1,110 @@
+"""
+Diff of the resources or edges of two catalogues.
+
+Resources are matched by type and title, edges by source, relationship and target. Each resource is
+reduced to a hash of its canonical json first, only the resources whose hashes differ are compared
+field by field and parameter by parameter. The certname is left out, the same resource on two nodes
+is equal.
+"""
+
+import hashlib
+import json
+
+__author__ = 'etaklar'
+
+
+# json.dumps with options creates an encoder on every call, which takes most of the time for small resources.
+_canonical_encoder = json.JSONEncoder(sort_keys=True, separators=(',', ':'), check_circular=False)
+
+
+def canonical_json(data):
+    return _canonical_encoder.encode(data).encode('utf-8')
+
+
+def resource_key(resource):
+    return resource['type'], resource['title']
+
+
+def edge_key(edge):
+    return edge['source_type'], edge['source_title'], edge['relationship'], edge['target_type'], edge['target_title']
+
+
+SECTION_KEYS = {
+    'resources': resource_key,
+    'edges': edge_key,
+}
+
+
+def without_certname(item):
+    return {key: value for key, value in item.items() if key != 'certname'}
+
+
+def resource_hash(item):
+    """sha1 of the canonical json of a resource or edge without its certname."""
+    return hashlib.sha1(canonical_json(without_certname(item))).hexdigest()
+
+
+def fingerprint(items, key):
+    """
+    :param key: resource_key or edge_key
+    :return: dict of key to (hash, item without certname)
+    """
+    index = {}
+    for item in items:
+        item = without_certname(item)
+        index[key(item)] = (hashlib.sha1(canonical_json(item)).hexdigest(), item)
+    return index
+
+
+def diff_parameters(old_parameters, new_parameters):
+    """
+    :return: dict with the added and removed parameters and their values, and the changed parameters with
+             their from and against values
+    """
+    return {
+        'added': {name: value for name, value in new_parameters.items() if name not in old_parameters},
+        'removed': {name: value for name, value in old_parameters.items() if name not in new_parameters},
+        'changed': {name: {'from': old_parameters[name], 'against': value} for name, value in new_parameters.items()
+                    if name in old_parameters and old_parameters[name] != value},
+    }
+
+
+def describe_change(old_item, new_item):
+    """
+    The changed entry of a resource or edge.
+    :return: dict with the from and against items, the names of the changed fields other than the parameters and
+             for resources the parameter changes, see diff_parameters
+    """
+    change = {
+        'from': old_item,
+        'against': new_item,
+        'fields': sorted(field for field in set(old_item) | set(new_item)
+                         if field not in ('parameters', 'certname') and old_item.get(field) != new_item.get(field)),
+    }
+    if 'parameters' in old_item or 'parameters' in new_item:
+        change['parameters'] = diff_parameters(old_item.get('parameters') or {}, new_item.get('parameters') or {})
+    return change
+
+
+def diff_fingerprints(old_index, new_index):
+    """
+    :param old_index: fingerprint of the catalogue compared from
+    :param new_index: fingerprint of the catalogue compared against
+    :return: dict with added_entries, deleted_entries and changed_entries, see describe_change
+    """
+    return {
+        'added_entries': [item for key, (item_hash, item) in new_index.items() if key not in old_index],
+        'deleted_entries': [item for key, (item_hash, item) in old_index.items() if key not in new_index],
+        'changed_entries': [describe_change(old_index[key][1], item) for key, (item_hash, item) in new_index.items()
+                            if key in old_index and old_index[key][0] != item_hash],
+    }
+
+
+def diff_items(old_items, new_items, section):
+    """
+    :param old_items: resources or edges of the catalogue compared from
+    :param new_items: resources or edges of the catalogue compared against
+    :param section: resources or edges
+    """
+    key = SECTION_KEYS[section]
+    return diff_fingerprints(fingerprint(old_items, key), fingerprint(new_items, key))
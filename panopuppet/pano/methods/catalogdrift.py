@@ -0,0 +1,212 @@
+"""
+Drift of the catalogues of a group of nodes from a baseline catalogue.
+
+The catalogues of the nodes are fetched a batch at a time with run_puppetdb_jobs and fingerprinted on a
+pool of processes while the next batch is fetched. A catalogue's signature is the sha1 of the hashes of
+its resources and edges, see catalogdiff.fingerprint, nodes with the same signature have the same
+catalogue apart from the certname and form a cluster. The diff against the baseline is computed once per
+cluster and batch.
+
+The pool is shared by all requests of the PanoPuppet process and started with forkserver (spawn where
+forkserver is not available), forking a threaded web server process could copy locks held by other
+threads. Every batch is sent with the fingerprints of its baseline, the processes send back the signature
+of every catalogue and, for the first catalogue of the batch with a signature, its diff against the baseline.
+"""
+
+import hashlib
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import django
+
+from panopuppet.pano.methods.catalogdiff import SECTION_KEYS, diff_fingerprints, fingerprint
+from panopuppet.pano.puppetdb.pdbutils import run_puppetdb_jobs
+from panopuppet.pano.puppetdb.puppetdb import get_server
+from panopuppet.pano.settings import CATALOG_DRIFT_BATCH_SIZE, CATALOG_DRIFT_PROCESSES
+
+__author__ = 'etaklar'
+
+# Catalogue sections taken into account, in the order they are hashed into the signature.
+SECTIONS = ('resources', 'edges')
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def signature(indexes):
+    """
+    :param indexes: dict of section to the fingerprint of the section
+    :return: sha1 of the sorted keys and hashes of every section
+    """
+    digest = hashlib.sha1()
+    for section in SECTIONS:
+        for key, (item_hash, item) in sorted(indexes[section].items()):
+            digest.update(item_hash.encode('ascii'))
+        # Separates the sections so an edge can never take the place of a resource.
+        digest.update(b'|')
+    return digest.hexdigest()
+
+
+def fingerprint_catalogue(sections):
+    """
+    :param sections: dict of section to the list of its resources or edges
+    :return: tuple(signature, dict of section to fingerprint)
+    """
+    indexes = dict((section, fingerprint(sections[section], SECTION_KEYS[section])) for section in SECTIONS)
+    return signature(indexes), indexes
+
+
+def compare_batch(baseline_indexes, batch):
+    """
+    :param baseline_indexes: dict of section to the fingerprint of the baseline's section
+    :param batch: list of dicts of section to the list of the resources or edges of a catalogue
+    :return: list of tuple(signature, dict of section to diff against the baseline or None when an earlier
+             catalogue of the batch has the same signature)
+    """
+    results = []
+    seen_signatures = set()
+    for sections in batch:
+        catalogue_signature, indexes = fingerprint_catalogue(sections)
+        if catalogue_signature in seen_signatures:
+            results.append((catalogue_signature, None))
+            continue
+        seen_signatures.add(catalogue_signature)
+        results.append((catalogue_signature, dict(
+            (section, diff_fingerprints(baseline_indexes[section], indexes[section])) for section in SECTIONS)))
+    return results
+
+
+class InlineExecutor(object):
+    """Runs the comparisons in the calling thread, used when CATALOG_DRIFT_PROCESSES is 0."""
+
+    def submit(self, function, *args):
+        return _Done(function(*args))
+
+    def shutdown(self, wait=True):
+        pass
+
+
+class _Done(object):
+    def __init__(self, result):
+        self._result = result
+
+    def result(self):
+        return self._result
+
+
+def make_executor(processes):
+    """
+    :param processes: Number of processes, 0 to compare in this process
+    :return: New executor, its processes are started with forkserver or spawn
+    """
+    if processes == 0:
+        return InlineExecutor()
+    start_method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+    # The new processes load the settings the way the web server does before they import this module.
+    return ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context(start_method),
+                               initializer=django.setup)
+
+
+def get_executor():
+    """:return: The executor shared by all requests, CATALOG_DRIFT_PROCESSES processes"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            processes = CATALOG_DRIFT_PROCESSES
+            if processes is None:
+                # Sending the catalogues to another process only pays off with a cpu to run it on.
+                processes = os.cpu_count() if (os.cpu_count() or 1) > 1 else 0
+            _pool = make_executor(processes)
+        return _pool
+
+
+def _discard_executor(executor):
+    """Forget the shared executor after one of its processes died, the next request starts a new one."""
+    global _pool
+    with _pool_lock:
+        if _pool is executor:
+            _pool = None
+    executor.shutdown(wait=False)
+
+
+def catalogue_sections(catalogue):
+    return dict((section, catalogue[section]['data']) for section in SECTIONS)
+
+
+def fetch_catalogues(request, certnames, threads=None):
+    """
+    :param certnames: list of certnames
+    :param threads: Number of catalogues fetched at the same time, None for all of them
+    :return: dict of certname to the catalogue as returned by PuppetDB
+    """
+    source_url, source_certs, source_verify = get_server(request)
+    jobs = dict((certname, {
+        'id': certname,
+        'path': '/catalogs/%s' % certname,
+        'url': source_url,
+        'certs': source_certs,
+        'verify': source_verify,
+        'api_version': 'v4',
+        'request': request,
+    }) for certname in certnames)
+    return run_puppetdb_jobs(jobs, threads=threads or len(jobs))
+
+
+def catalogue_drift(request, baseline_sections, certnames, batch_size=None, executor=None):
+    """
+    Clusters the nodes by catalogue signature and diffs every cluster against the baseline.
+    :param baseline_sections: dict of section to the list of the baseline's resources or edges
+    :param certnames: list of the certnames to compare
+    :param executor: Executor comparing the batches, None for the shared pool
+    :return: dict with the baseline signature, the clusters sorted by size and the certnames that have
+             no catalogue with the error PuppetDB returned
+    """
+    batch_size = batch_size or CATALOG_DRIFT_BATCH_SIZE
+    shared = executor is None
+    executor = executor or get_executor()
+    baseline_signature, baseline_indexes = fingerprint_catalogue(baseline_sections)
+    futures = []
+    errors = {}
+    nodes = 0
+    for start in range(0, len(certnames), batch_size):
+        catalogues = fetch_catalogues(request, certnames[start:start + batch_size])
+        batch_certnames = []
+        batch = []
+        for certname in certnames[start:start + batch_size]:
+            catalogue = catalogues.get(certname)
+            if not isinstance(catalogue, dict) or 'error' in catalogue:
+                errors[certname] = catalogue.get('error') if isinstance(catalogue, dict) else 'No catalogue.'
+                continue
+            batch_certnames.append(certname)
+            batch.append(catalogue_sections(catalogue))
+        if batch:
+            nodes += len(batch)
+            futures.append((batch_certnames, executor.submit(compare_batch, baseline_indexes, batch)))
+        # Free this batch while the processes work on it.
+        catalogues = batch = None
+    clusters = {}
+    try:
+        for batch_certnames, future in futures:
+            for certname, (catalogue_signature, diff) in zip(batch_certnames, future.result()):
+                cluster = clusters.setdefault(catalogue_signature,
+                                              {'signature': catalogue_signature, 'certnames': []})
+                cluster['certnames'].append(certname)
+                if diff is not None:
+                    cluster.update(diff)
+    except BrokenProcessPool:
+        if shared:
+            _discard_executor(executor)
+        raise
+    for cluster in clusters.values():
+        cluster['certnames'].sort()
+        cluster['baseline'] = cluster['signature'] == baseline_signature
+    return {
+        'baseline_signature': baseline_signature,
+        'nodes': nodes,
+        'clusters': sorted(clusters.values(), key=lambda cluster: (-len(cluster['certnames']), cluster['signature'])),
+        'errors': errors,
+    }
+
@@ -0,0 +1,265 @@
+"""
+Graph of the resources of a catalogue built from its edges.
+
+Resources are numbered and the edges are kept as adjacency lists in both directions, so the
+dependencies and dependents of a resource and the resources around it are found without looking at
+the rest of the catalogue. An edge goes from the resource applied first to the one applied after it,
+for every relationship PuppetDB returns: before, required-by, notifies and subscription-of order the
+resources, contains links a class to its resources.
+
+Cycles and the layout hints, the layer of every resource in a left to right drawing and the cycle it
+is in, are worked out once per relationship set. Graphs are kept for the CATALOG_GRAPH_CACHE_SIZE
+catalogues used last, keyed by catalogue hash: a catalogue with the same hash has the same edges.
+"""
+
+import threading
+from collections import OrderedDict, deque
+
+from panopuppet.pano.settings import CATALOG_GRAPH_CACHE_SIZE
+
+__author__ = 'etaklar'
+
+CONTAINS = 'contains'
+ORDERING = ('before', 'required-by', 'notifies', 'subscription-of')
+RELATIONSHIPS = (CONTAINS,) + ORDERING
+
+_graphs = OrderedDict()
+_graphs_lock = threading.Lock()
+
+
+def resource_id(resource_type, title):
+    """:return: Puppet resource reference, Type[title]"""
+    return '%s[%s]' % (resource_type, title)
+
+
+class CatalogGraph(object):
+    def __init__(self, edges):
+        """:param edges: edges of a catalogue as returned by PuppetDB"""
+        self.ids = []
+        self.numbers = {}
+        # Per resource number, lists of (resource number, relationship) of the edges from and to it.
+        self.successors = []
+        self.predecessors = []
+        self.edge_count = 0
+        for edge in edges:
+            source = self._number(resource_id(edge['source_type'], edge['source_title']))
+            target = self._number(resource_id(edge['target_type'], edge['target_title']))
+            self.successors[source].append((target, edge['relationship']))
+            self.predecessors[target].append((source, edge['relationship']))
+            self.edge_count += 1
+        # relationships: (components, layers) see _analyse
+        self._analysed = {}
+        self._analyse_lock = threading.Lock()
+
+    def _number(self, resource):
+        number = self.numbers.get(resource)
+        if number is None:
+            number = self.numbers[resource] = len(self.ids)
+            self.ids.append(resource)
+            self.successors.append([])
+            self.predecessors.append([])
+        return number
+
+    def __contains__(self, resource):
+        return resource in self.numbers
+
+    def walk(self, resource, relationships=ORDERING, reverse=False, depth=None, limit=None):
+        """
+        Breadth first walk along the edges, the transitive dependents of resource, or its dependencies
+        with reverse.
+        :param depth: Maximum number of edges from resource, None for no limit
+        :param limit: Maximum number of resources to return
+        :return: tuple(list of (resource, distance) without resource itself, True when limit cut the walk short)
+        """
+        adjacency = self.predecessors if reverse else self.successors
+        start = self.numbers[resource]
+        distances = {start: 0}
+        found = []
+        pending = deque([start])
+        while pending:
+            node = pending.popleft()
+            if depth is not None and distances[node] >= depth:
+                continue
+            for neighbour, relationship in adjacency[node]:
+                if neighbour in distances or relationship not in relationships:
+                    continue
+                if limit is not None and len(found) >= limit:
+                    return found, True
+                distances[neighbour] = distances[node] + 1
+                found.append((self.ids[neighbour], distances[neighbour]))
+                pending.append(neighbour)
+        return found, False
+
+    def dependencies(self, resource, relationships=ORDERING, depth=None, limit=None):
+        """The resources applied before resource, see walk."""
+        return self.walk(resource, relationships, reverse=True, depth=depth, limit=limit)
+
+    def dependents(self, resource, relationships=ORDERING, depth=None, limit=None):
+        """The resources applied after resource, see walk."""
+        return self.walk(resource, relationships, reverse=False, depth=depth, limit=limit)
+
+    def _components(self, relationships):
+        """
+        Strongly connected components, iterative Tarjan so deep chains do not hit the recursion limit.
+        :return: list of the component number of every resource, components numbered in reverse
+                 topological order
+        """
+        count = len(self.ids)
+        index = [None] * count
+        lowlink = [0] * count
+        on_stack = [False] * count
+        component = [None] * count
+        stack = []
+        counter = 0
+        components = 0
+        for root in range(count):
+            if index[root] is not None:
+                continue
+            index[root] = lowlink[root] = counter
+            counter += 1
+            stack.append(root)
+            on_stack[root] = True
+            work = [(root, iter(self.successors[root]))]
+            while work:
+                node, neighbours = work[-1]
+                advanced = False
+                for neighbour, relationship in neighbours:
+                    if relationship not in relationships:
+                        continue
+                    if index[neighbour] is None:
+                        index[neighbour] = lowlink[neighbour] = counter
+                        counter += 1
+                        stack.append(neighbour)
+                        on_stack[neighbour] = True
+                        work.append((neighbour, iter(self.successors[neighbour])))
+                        advanced = True
+                        break
+                    elif on_stack[neighbour]:
+                        lowlink[node] = min(lowlink[node], index[neighbour])
+                if advanced:
+                    continue
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[node])
+                if lowlink[node] == index[node]:
+                    while True:
+                        member = stack.pop()
+                        on_stack[member] = False
+                        component[member] = components
+                        if member == node:
+                            break
+                    components += 1
+        return component
+
+    def _analyse(self, relationships):
+        """
+        :return: tuple(list of the cycles as lists of resource numbers, list of the layer of every resource)
+                 The layer is the longest path to the resource from a resource without predecessors,
+                 counting a cycle as one resource.
+        """
+        relationships = frozenset(relationships)
+        with self._analyse_lock:
+            if relationships in self._analysed:
+                return self._analysed[relationships]
+            component = self._components(relationships)
+            members = {}
+            for node, number in enumerate(component):
+                members.setdefault(number, []).append(node)
+            cycles = []
+            for number, nodes in members.items():
+                if len(nodes) > 1 or any(neighbour == nodes[0] and relationship in relationships
+                                         for neighbour, relationship in self.successors[nodes[0]]):
+                    cycles.append(sorted(nodes))
+            # Tarjan numbers the components in reverse topological order, the highest number comes first.
+            component_layer = [0] * len(members)
+            for number in range(len(members) - 1, -1, -1):
+                for node in members[number]:
+                    for neighbour, relationship in self.successors[node]:
+                        if relationship in relationships and component[neighbour] != number:
+                            component_layer[component[neighbour]] = max(component_layer[component[neighbour]],
+                                                                         component_layer[number] + 1)
+            layers = [component_layer[component[node]] for node in range(len(self.ids))]
+            self._analysed[relationships] = (cycles, layers)
+            return self._analysed[relationships]
+
+    def cycles(self, relationships=ORDERING):
+        """:return: list of the cycles, each a sorted list of the resources in it"""
+        return sorted(sorted(self.ids[node] for node in cycle) for cycle in self._analyse(relationships)[0])
+
+    def layout(self, resources, relationships=RELATIONSHIPS):
+        """
+        Layout hints of the resources.
+        :return: dict of resource to dict with its layer and, for resources in a cycle, the number of the cycle
+        """
+        cycles, layers = self._analyse(relationships)
+        in_cycle = {}
+        for number, cycle in enumerate(cycles):
+            for node in cycle:
+                in_cycle[node] = number
+        hints = {}
+        for resource in resources:
+            node = self.numbers[resource]
+            hints[resource] = {'layer': layers[node]}
+            if node in in_cycle:
+                hints[resource]['cycle'] = in_cycle[node]
+        return hints
+
+    def neighbourhood(self, resource, relationships=RELATIONSHIPS, depth=1, limit=None):
+        """
+        The resources at most depth edges away from resource in either direction and the edges between them.
+        :return: dict with the resources and their layout hints, the edges, and truncated when limit cut
+                 the neighbourhood short
+        """
+        start = self.numbers[resource]
+        distances = {start: 0}
+        pending = deque([start])
+        truncated = False
+        while pending and not truncated:
+            node = pending.popleft()
+            if distances[node] >= depth:
+                continue
+            for neighbour, relationship in self.successors[node] + self.predecessors[node]:
+                if neighbour in distances or relationship not in relationships:
+                    continue
+                if limit is not None and len(distances) >= limit:
+                    truncated = True
+                    break
+                distances[neighbour] = distances[node] + 1
+                pending.append(neighbour)
+        hints = self.layout([self.ids[node] for node in distances], relationships)
+        resources = []
+        edges = []
+        for node, distance in sorted(distances.items(), key=lambda item: (item[1], self.ids[item[0]])):
+            resources.append(dict(hints[self.ids[node]], resource=self.ids[node], distance=distance))
+            for neighbour, relationship in self.successors[node]:
+                if neighbour in distances and relationship in relationships:
+                    edges.append({'source': self.ids[node], 'relationship': relationship,
+                                  'target': self.ids[neighbour]})
+        return {'resources': resources, 'edges': edges, 'truncated': truncated}
+
+
+def cached_graph(catalogue_hash):
+    """:return: The kept CatalogGraph of the catalogue with this hash, None when it is not kept"""
+    with _graphs_lock:
+        graph = _graphs.get(catalogue_hash)
+        if graph is not None:
+            _graphs.move_to_end(catalogue_hash)
+        return graph
+
+
+def get_graph(catalogue_hash, load_edges):
+    """
+    The graph of a catalogue, built on first use and kept for the CATALOG_GRAPH_CACHE_SIZE catalogues used last.
+    :param load_edges: function returning the edges of the catalogue, called when the graph is not kept
+    :return: CatalogGraph
+    """
+    graph = cached_graph(catalogue_hash)
+    if graph is not None:
+        return graph
+    graph = CatalogGraph(load_edges())
+    with _graphs_lock:
+        _graphs[catalogue_hash] = graph
+        while len(_graphs) > CATALOG_GRAPH_CACHE_SIZE:
+            _graphs.popitem(last=False)
+    return graph
@@ -0,0 +1,374 @@
+"""
+Storage of saved catalogues as compressed, deduplicated blobs.
+
+A catalogue is split in three blobs: the resources, the edges and the rest of the catalogue (meta). The
+certname is removed from every resource and edge so identical sections of different nodes are the same
+blob. Blobs are zlib compressed json keyed by the sha256 of the json, a section that was saved before is
+not stored again.
+
+Successive catalogues of a node differ in a few resources. Only the resources and edges that were added,
+removed or changed since the node's previous saved catalogue are stored, every CATALOG_KEYFRAME_INTERVAL
+saves the complete catalogue is stored again so at most that many changes are applied to load one. The
+changes between two saved catalogues of a node follow from the stored changes, see diff_saved.
+
+Deleting a saved catalogue others are stored against stores those again against the catalogue before
+it, see delete_saved_catalogues. apply_retention keeps the newest CATALOG_RETENTION_KEEP catalogues of
+a node and one a day of the older ones.
+
+Sections are loaded and decompressed on their own, fetching the edges does not read the resources.
+Catalogues saved before the blobs were used keep their json in SavedCatalogs.catalogue and are read from
+there until compact_catalogues moves them to blobs.
+"""
+
+import datetime
+import hashlib
+import json
+import zlib
+from collections import OrderedDict
+
+from django.db import transaction
+from django.utils import timezone
+
+from panopuppet.pano.methods.catalogdiff import SECTION_KEYS, canonical_json, without_certname
+from panopuppet.pano.models import CatalogBlob, SavedCatalogs
+from panopuppet.pano.settings import CATALOG_KEYFRAME_INTERVAL, CATALOG_RETENTION_DAYS, CATALOG_RETENTION_KEEP
+
+__author__ = 'etaklar'
+
+SECTIONS = ('resources', 'edges')
+
+
+def store_blob(data):
+    """
+    :param data: json serializable data
+    :return: CatalogBlob, an existing one when the same data was stored before
+    """
+    encoded = canonical_json(data)
+    digest = hashlib.sha256(encoded).hexdigest()
+    blob, created = CatalogBlob.objects.get_or_create(
+        digest=digest,
+        defaults={'data': zlib.compress(encoded, 9), 'size': len(encoded)})
+    return blob
+
+
+def load_blob(blob):
+    return json.loads(zlib.decompress(bytes(blob.data)).decode('utf-8'))
+
+
+def _strip_certname(items):
+    return [without_certname(item) for item in items]
+
+
+def _add_certname(items, certname):
+    for item in items:
+        item['certname'] = certname
+    return items
+
+
+def make_delta(old_items, new_items, key):
+    """
+    :param key: function returning the key of an item
+    :return: dict with the added and removed items and the changed items as [old, new] pairs,
+             None when the keys of the items are not unique
+    """
+    old = dict((key(item), item) for item in old_items)
+    new = dict((key(item), item) for item in new_items)
+    if len(old) != len(old_items) or len(new) != len(new_items):
+        return None
+    return {
+        'added': [item for item_key, item in new.items() if item_key not in old],
+        'removed': [item for item_key, item in old.items() if item_key not in new],
+        'changed': [[old[item_key], item] for item_key, item in new.items()
+                    if item_key in old and old[item_key] != item],
+    }
+
+
+def apply_delta(items, delta, key):
+    """
+    :param items: dict of key to item, changed in place
+    """
+    for item in delta['removed']:
+        items.pop(key(item), None)
+    for old_item, new_item in delta['changed']:
+        items[key(new_item)] = new_item
+    for item in delta['added']:
+        items[key(item)] = item
+    return items
+
+
+def compose_deltas(deltas, key):
+    """:return: The delta with the same result as applying deltas in order"""
+    pairs = OrderedDict()
+    for delta in deltas:
+        changes = [(item, None) for item in delta['removed']] + \
+                  [tuple(pair) for pair in delta['changed']] + \
+                  [(None, item) for item in delta['added']]
+        for old_item, new_item in changes:
+            item_key = key(new_item if old_item is None else old_item)
+            if item_key in pairs:
+                pairs[item_key][1] = new_item
+            else:
+                pairs[item_key] = [old_item, new_item]
+    return {
+        'added': [new for old, new in pairs.values() if old is None and new is not None],
+        'removed': [old for old, new in pairs.values() if old is not None and new is None],
+        'changed': [[old, new] for old, new in pairs.values()
+                    if old is not None and new is not None and old != new],
+    }
+
+
+def _load_items(saved, section):
+    """
+    The resources or edges of a saved catalogue without certname, rebuilt from the last complete
+    ones and the changes saved after them.
+    :return: tuple(items had a certname, items)
+    """
+    key = SECTION_KEYS[section]
+    deltas = []
+    while saved.base_id is not None:
+        deltas.append(load_blob(getattr(saved, '%s_blob' % section)))
+        # Only the blob of the section is read.
+        saved = SavedCatalogs.objects.select_related('%s_blob' % section).get(id=saved.base_id)
+    content = load_blob(getattr(saved, '%s_blob' % section))
+    items = OrderedDict((key(item), item) for item in content['data'])
+    for delta in reversed(deltas):
+        apply_delta(items, delta, key)
+    return content['certname'], list(items.values())
+
+
+def _store_catalogue(catalogue, base=None):
+    """
+    :param base: SavedCatalogs to store the changes against, None to store the complete catalogue
+    :return: dict with the meta, resources and edges blob of the catalogue, and the base and depth
+    """
+    meta = dict(catalogue)
+    contents = {}
+    for section in SECTIONS:
+        items = catalogue[section]['data']
+        meta[section] = {key: value for key, value in catalogue[section].items() if key != 'data'}
+        contents[section] = {'certname': any('certname' in item for item in items), 'data': _strip_certname(items)}
+    blobs = {'base': None, 'depth': 0, 'meta_blob': store_blob(meta)}
+    if base is not None:
+        deltas = {}
+        for section in SECTIONS:
+            base_certname, base_items = _load_items(base, section)
+            delta = make_delta(base_items, contents[section]['data'], SECTION_KEYS[section])
+            # Whether to add the certname is taken from the complete catalogue the changes are applied to.
+            if delta is None or base_certname != contents[section]['certname']:
+                break
+            deltas[section] = delta
+        else:
+            contents = deltas
+            blobs['base'] = base
+            blobs['depth'] = base.depth + 1
+    for section in SECTIONS:
+        blobs['%s_blob' % section] = store_blob(contents[section])
+    return blobs
+
+
+def save_catalogue(certname, catalogue, report_hash):
+    """
+    Stores the changes against the node's previous saved catalogue, or the complete catalogue every
+    CATALOG_KEYFRAME_INTERVAL saves so loading a catalogue applies a limited number of changes.
+    :param catalogue: Catalogue as returned by PuppetDB
+    :param report_hash: Hash of the report the catalogue belongs to
+    :return: SavedCatalogs
+    """
+    with transaction.atomic():
+        previous = SavedCatalogs.objects.filter(hostname=certname, catalogue='').order_by('-id').first()
+        if previous is not None and previous.depth + 1 >= CATALOG_KEYFRAME_INTERVAL:
+            previous = None
+        return SavedCatalogs.objects.create(hostname=certname,
+                                            catalogue_id=catalogue['hash'],
+                                            linked_report=report_hash,
+                                            timestamp=catalogue['producer_timestamp'],
+                                            **_store_catalogue(catalogue, previous))
+
+
+def capture_catalogue(certname, catalogue, report_hash):
+    """
+    Saves the catalogue unless the node has a saved catalogue with the same hash, that one is linked to
+    report_hash instead.
+    :return: tuple(SavedCatalogs, report the catalogue was linked to before, None when it was saved now)
+    """
+    saved = SavedCatalogs.objects.filter(hostname=certname, catalogue_id=catalogue['hash']).defer('catalogue').first()
+    if saved is None:
+        return save_catalogue(certname, catalogue, report_hash), None
+    old_linked_report = saved.linked_report
+    if old_linked_report != report_hash:
+        saved.linked_report = report_hash
+        saved.timestamp = catalogue['producer_timestamp']
+        saved.save(update_fields=['linked_report', 'timestamp'])
+    return saved, old_linked_report
+
+
+def load_section(saved, section):
+    """
+    :param saved: SavedCatalogs
+    :param section: resources or edges
+    :return: list of the resources or edges
+    """
+    if saved.catalogue:
+        return json.loads(saved.catalogue)[section]['data']
+    if section not in SECTIONS:
+        raise KeyError(section)
+    with_certname, items = _load_items(saved, section)
+    if with_certname:
+        _add_certname(items, saved.hostname)
+    return items
+
+
+def load_catalogue(saved):
+    """
+    :param saved: SavedCatalogs
+    :return: The catalogue as returned by PuppetDB when it was saved, resources and edges added since
+             the last complete catalogue are at the end of the lists
+    """
+    if saved.catalogue:
+        return json.loads(saved.catalogue)
+    catalogue = load_blob(saved.meta_blob)
+    for section in SECTIONS:
+        catalogue[section]['data'] = load_section(saved, section)
+    return catalogue
+
+
+def _stored_deltas(saved_from, saved_to, section):
+    """The deltas leading from saved_from to saved_to in order, None if saved_to is not based on saved_from."""
+    deltas = []
+    saved = saved_to
+    while saved.id != saved_from.id:
+        if saved.base_id is None:
+            return None
+        deltas.append(load_blob(getattr(saved, '%s_blob' % section)))
+        saved = SavedCatalogs.objects.select_related('%s_blob' % section).get(id=saved.base_id)
+    return list(reversed(deltas))
+
+
+def diff_saved(saved_from, saved_to, section):
+    """
+    The changes between two saved catalogues of a node from the stored changes, without loading
+    either catalogue. Resources and edges are returned without certname.
+    :param section: resources or edges
+    :return: dict with added, removed and changed ([from, to] pairs) items, None when one of the
+             catalogues is not saved as changes against the other
+    """
+    if saved_from.hostname != saved_to.hostname or saved_from.catalogue or saved_to.catalogue or \
+            section not in SECTIONS:
+        return None
+    key = SECTION_KEYS[section]
+    deltas = _stored_deltas(saved_from, saved_to, section)
+    if deltas is not None:
+        return compose_deltas(deltas, key)
+    deltas = _stored_deltas(saved_to, saved_from, section)
+    if deltas is not None:
+        delta = compose_deltas(deltas, key)
+        return {
+            'added': delta['removed'],
+            'removed': delta['added'],
+            'changed': [[new, old] for old, new in delta['changed']],
+        }
+    return None
+
+
+def delete_saved_catalogues(hostname, saved_ids):
+    """
+    Delete saved catalogues of a node. The catalogues stored as changes against a deleted one are stored
+    again against their nearest remaining predecessor, or completely when there is none.
+    :param saved_ids: ids of SavedCatalogs of the node
+    :return: Number of catalogues deleted
+    """
+    doomed = set(saved_ids)
+    if not doomed:
+        return 0
+    with transaction.atomic():
+        bases = dict(SavedCatalogs.objects.filter(hostname=hostname).values_list('id', 'base_id'))
+        dependents = SavedCatalogs.objects.filter(hostname=hostname, base_id__in=doomed).exclude(id__in=doomed)
+        # Loaded before anything is deleted, the chains they are stored on are still complete.
+        rebase = [(dependent, load_catalogue(dependent)) for dependent in dependents]
+        for dependent, catalogue in rebase:
+            base_id = bases[dependent.id]
+            while base_id is not None and base_id in doomed:
+                base_id = bases[base_id]
+            base = SavedCatalogs.objects.get(id=base_id) if base_id is not None else None
+            for field, value in _store_catalogue(catalogue, base).items():
+                setattr(dependent, field, value)
+            dependent.save()
+        # A catalogue is only stored against an older one, deleting the newest first never deletes a
+        # catalogue another one is still stored against.
+        for saved_id in sorted(doomed, reverse=True):
+            SavedCatalogs.objects.filter(id=saved_id).delete()
+    return len(doomed)
+
+
+def thin_out(timestamps, keep, days, now):
+    """
+    Which of a node's saved catalogues to delete: the newest keep catalogues are kept, of the older ones
+    the newest of each day for the last days days.
+    :param timestamps: list of (id, timestamp) of the saved catalogues
+    :param now: aware datetime
+    :return: set of ids to delete
+    """
+    newest_first = sorted(timestamps, key=lambda item: (item[1], item[0]), reverse=True)
+    oldest_day = (now - datetime.timedelta(days=days)).date()
+    days_kept = set()
+    doomed = set()
+    for saved_id, timestamp in newest_first[keep:]:
+        day = timestamp.astimezone(datetime.timezone.utc).date()
+        if day < oldest_day or day in days_kept:
+            doomed.add(saved_id)
+        else:
+            days_kept.add(day)
+    return doomed
+
+
+def apply_retention(keep=None, days=None, hostnames=None):
+    """
+    Thin out the saved catalogues of every node, see thin_out.
+    :param hostnames: Only thin out the catalogues of these nodes
+    :return: Number of catalogues deleted
+    """
+    keep = CATALOG_RETENTION_KEEP if keep is None else keep
+    days = CATALOG_RETENTION_DAYS if days is None else days
+    saved = SavedCatalogs.objects.all()
+    if hostnames is not None:
+        saved = saved.filter(hostname__in=hostnames)
+    by_host = {}
+    for saved_id, hostname, timestamp in saved.values_list('id', 'hostname', 'timestamp'):
+        by_host.setdefault(hostname, []).append((saved_id, timestamp))
+    now = timezone.now()
+    deleted = 0
+    for hostname, timestamps in by_host.items():
+        if len(timestamps) > keep:
+            deleted += delete_saved_catalogues(hostname, thin_out(timestamps, keep, days, now))
+    if deleted:
+        delete_unused_blobs()
+    return deleted
+
+
+def delete_unused_blobs():
+    """Delete the blobs no saved catalogue refers to anymore, call after deleting saved catalogues."""
+    used = set()
+    for field in ('meta_blob', 'resources_blob', 'edges_blob'):
+        used.update(SavedCatalogs.objects.exclude(**{field: None}).values_list(field, flat=True))
+    unused = list(set(CatalogBlob.objects.values_list('digest', flat=True)) - used)
+    # SQLite allows a limited number of query parameters.
+    for start in range(0, len(unused), 500):
+        CatalogBlob.objects.filter(digest__in=unused[start:start + 500]).delete()
+    return len(unused)
+
+
+def compact_catalogues():
+    """
+    Move the catalogues saved as json to blobs.
+    :return: Number of catalogues moved
+    """
+    moved = 0
+    for saved_id in SavedCatalogs.objects.exclude(catalogue='').values_list('id', flat=True):
+        with transaction.atomic():
+            saved = SavedCatalogs.objects.select_for_update().get(id=saved_id)
+            for field, blob in _store_catalogue(json.loads(saved.catalogue)).items():
+                setattr(saved, field, blob)
+            saved.catalogue = ''
+            saved.save()
+        moved += 1
+    return moved
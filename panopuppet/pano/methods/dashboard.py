@@ -0,0 +1,299 @@
+"""
+The dashboard counts and node lists, shared by the dashboard APIs and the dashboard event stream.
+
+federated_dashboard runs the dashboard queries against every source at the same time and merges the
+results, sources that do not answer within FEDERATED_DASHBOARD_TIMEOUT seconds are left out.
+"""
+
+import threading
+import time
+
+from django.utils.timezone import activate, get_current_timezone
+
+from panopuppet.pano.methods.dictfuncs import dictstatus as dictstatus
+from panopuppet.pano.puppetdb.mirror import take_mirrored_jobs
+from panopuppet.pano.puppetdb import resilience
+from panopuppet.pano.puppetdb.pdbutils import in_context, run_puppetdb_jobs
+from panopuppet.pano.puppetdb.puppetdb import get_server, set_server
+from panopuppet.pano.settings import AVAILABLE_SOURCES, FEDERATED_DASHBOARD_TIMEOUT
+
+__author__ = 'etaklar'
+
+# Node lists that are part of the status lists, any other show value lists the most recent nodes.
+DASHBOARD_LISTS = ('failed', 'unreported', 'changed', 'mismatch', 'pending')
+
+
+class SessionSnapshot(object):
+    """Copy of a request's session, used in place of the request outside of the request's thread."""
+
+    def __init__(self, request):
+        self.session = dict(request.session.items())
+
+
+def dashboard_status(request, show=None):
+    """
+    :param request: Request or anything with a session to pick the source and permission filter from
+    :param show: Node list to return: recent, failed, unreported, changed, mismatch or pending, None for no list
+    :return: tuple(dict with the dashboard counts, dict of certname: status, list of node rows or None)
+             status is one of unreported, failed, pending, changed or unchanged
+    """
+    context = {}
+    source_url, source_certs, source_verify = get_server(request)
+    pdb_vers = get_server(request, type='puppetdb_vers')
+
+    puppet_run_time = get_server(request, type='run_time')
+
+    events_params = {
+        'query':
+            {
+                1: '["and",["=","latest_report?",true],["in", "certname",["extract", "certname",["select_nodes",["null?","deactivated",true]]]]]'
+            },
+        'summarize_by': 'certname',
+    }
+    reports_params = {
+        'query':
+            {
+                1: '["and",["=","latest_report?",true],["in", "certname",["extract", "certname",["select_nodes",["null?","deactivated",true]]]]]'
+            }
+    }
+    nodes_params = {
+        'limit': 25,
+        'order_by': {
+            'order_field': {
+                'field': 'report_timestamp',
+                'order': 'desc',
+            },
+            'query_field': {'field': 'certname'},
+        },
+    }
+
+    if pdb_vers == 4:
+        tot_res_path = 'mbeans/puppetlabs.puppetdb.population:name=num-resources'
+        avg_res_path = 'mbeans/puppetlabs.puppetdb.population:name=avg-resources-per-node'
+    else:
+        tot_res_path = 'mbeans/puppetlabs.puppetdb.query.population:type=default,name=num-resources'
+        avg_res_path = 'mbeans/puppetlabs.puppetdb.query.population:type=default,name=avg-resources-per-node'
+
+    jobs = {
+        'tot_resource': {
+            'url': source_url,
+            'certs': source_certs,
+            'verify': source_verify,
+            'id': 'tot_resource',
+            'path': tot_res_path,
+        },
+        'avg_resource': {
+            'url': source_url,
+            'certs': source_certs,
+            'verify': source_verify,
+            'id': 'avg_resource',
+            'path': avg_res_path,
+        },
+        'all_nodes': {
+            'url': source_url,
+            'certs': source_certs,
+            'verify': source_verify,
+            'api_version': 'v4',
+            'id': 'all_nodes',
+            'path': '/nodes',
+            'request': request
+        },
+        'reports': {
+            'url': source_url,
+            'certs': source_certs,
+            'verify': source_verify,
+            'api_version': 'v4',
+            'id': 'reports',
+            'path': '/reports',
+            'params': reports_params,
+            'request': request
+        },
+        'events': {
+            'url': source_url,
+            'certs': source_certs,
+            'verify': source_verify,
+            'id': 'event_counts',
+            'path': 'event-counts',
+            'api_version': 'v4',
+            'params': events_params,
+            'request': request
+        },
+    }
+    if show is not None and show not in DASHBOARD_LISTS:
+        # The most recent nodes.
+        jobs['nodes'] = {
+            'url': source_url,
+            'certs': source_certs,
+            'verify': source_verify,
+            'api_version': 'v4',
+            'id': 'nodes',
+            'path': '/nodes',
+            'params': nodes_params,
+            'request': request
+        }
+    # Jobs the fleet mirror can answer are not sent to PuppetDB.
+    mirrored_results = take_mirrored_jobs(request, jobs)
+    puppetdb_results = run_puppetdb_jobs(jobs)
+    puppetdb_results.update(mirrored_results)
+
+    # Assign vars from the completed jobs
+    # Number of results from all_nodes is our population.
+    puppet_population = len(puppetdb_results['all_nodes'])
+
+    # Total resources managed by puppet metric
+    total_resources = puppetdb_results['tot_resource'].get('value', puppetdb_results['tot_resource'])
+
+    # Average resource per node metric
+    avg_resource_node = puppetdb_results['avg_resource'].get('value', puppetdb_results['avg_resource'])
+
+    # Information about all active nodes in puppet
+    all_nodes_list = puppetdb_results['all_nodes']
+
+    # All available events for the latest puppet reports
+    event_list = puppetdb_results['event_counts']
+    event_dict = {item['subject']['title']: item for item in event_list}
+    # All of the latest reports
+    reports_list = puppetdb_results['reports']
+    reports_dict = {item['certname']: item for item in reports_list}
+
+    failed_list, changed_list, unreported_list, mismatch_list, pending_list = dictstatus(
+        all_nodes_list,
+        reports_dict,
+        event_dict,
+        sort=True,
+        sortby='latestReport',
+        get_status='notall',
+        puppet_run_time=puppet_run_time)
+
+    pending_list = [x for x in pending_list if x not in unreported_list]
+    changed_list = [x for x in changed_list if
+                    x not in unreported_list and x not in failed_list and x not in pending_list]
+    failed_list = [x for x in failed_list if x not in unreported_list]
+    unreported_list = [x for x in unreported_list if x not in failed_list]
+
+    node_unreported_count = len(unreported_list)
+    node_fail_count = len(failed_list)
+    node_change_count = len(changed_list)
+    node_off_timestamps_count = len(mismatch_list)
+    node_pending_count = len(pending_list)
+
+    context['population'] = puppet_population
+    context['total_resource'] = total_resources['Value']
+    context['avg_resource'] = "{:.2f}".format(avg_resource_node['Value'])
+    context['failed_nodes'] = node_fail_count
+    context['changed_nodes'] = node_change_count
+    context['unreported_nodes'] = node_unreported_count
+    context['mismatching_timestamps'] = node_off_timestamps_count
+    context['pending_nodes'] = node_pending_count
+
+    # A node in more than one list gets the status listed last.
+    node_status = {node['certname']: 'unchanged' for node in all_nodes_list}
+    for status, status_list in (('changed', changed_list),
+                                ('pending', pending_list),
+                                ('failed', failed_list),
+                                ('unreported', unreported_list)):
+        for node in status_list:
+            node_status[node[0]] = status
+
+    if show is None:
+        merged_nodes_list = None
+    elif show in DASHBOARD_LISTS:
+        merged_nodes_list = {
+            'failed': failed_list,
+            'unreported': unreported_list,
+            'changed': changed_list,
+            'mismatch': mismatch_list,
+            'pending': pending_list,
+        }[show]
+    else:
+        merged_nodes_list = dictstatus(puppetdb_results['nodes'],
+                                       reports_dict,
+                                       event_dict,
+                                       sort=False,
+                                       get_status="all",
+                                       puppet_run_time=puppet_run_time)
+
+    return context, node_status, merged_nodes_list
+
+
+def merge_counts(counts_list):
+    """Sum the dashboard counts of several sources, the average resources per node is worked out again."""
+    merged = {}
+    for counts in counts_list:
+        for key, value in counts.items():
+            if key != 'avg_resource':
+                merged[key] = merged.get(key, 0) + value
+    population = merged.get('population', 0)
+    merged['avg_resource'] = "{:.2f}".format(merged.get('total_resource', 0) / population if population else 0)
+    return merged
+
+
+def source_names():
+    """
+    :return: list with the name of every configured source, old style configurations have a single source
+             named default as their PUPPETDB_HOST is an url or a list of replica urls rather than a name
+    """
+    if isinstance(AVAILABLE_SOURCES, dict):
+        return list(AVAILABLE_SOURCES)
+    return ['default']
+
+
+def federated_dashboard(request, show='recent', timeout=FEDERATED_DASHBOARD_TIMEOUT):
+    """
+    The dashboard of every source in AVAILABLE_SOURCES, all sources are queried at the same time.
+    :param show: Node list to return, see dashboard_status
+    :param timeout: Seconds to wait for all sources together, sources answering later are left out
+    :return: dict with the summed counts, the node list with the source name appended to each row and
+             per source the state (ok, timeout or error), the time taken and the counts
+    """
+    # Every source gets its own copy of the session to select the source in.
+    snapshots = {source: SessionSnapshot(request) for source in source_names()}
+    # Node timestamps are formatted in the timezone of the user.
+    timezone = get_current_timezone()
+    results = {}
+    deadline = time.time() + timeout
+    if resilience.current_deadline() is not None:
+        deadline = min(deadline, resilience.current_deadline())
+
+    def fetch(source):
+        activate(timezone)
+        started = time.time()
+        try:
+            # Old style configurations have a single source which is the default.
+            if isinstance(AVAILABLE_SOURCES, dict):
+                set_server(snapshots[source], source)
+            counts, node_status, node_list = dashboard_status(snapshots[source], show)
+        except Exception as e:
+            results[source] = {'state': 'error', 'error': str(e), 'elapsed': time.time() - started}
+        else:
+            results[source] = {'state': 'ok', 'counts': counts, 'node_list': node_list,
+                               'elapsed': time.time() - started}
+
+    workers = []
+    for source in snapshots:
+        # Queries of sources that are too late are given up instead of running on in the background.
+        worker = threading.Thread(target=in_context(fetch, until=deadline), args=(source,), name='federated-dashboard',
+                                  daemon=True)
+        worker.start()
+        workers.append(worker)
+    for worker in workers:
+        worker.join(max(0, deadline - time.time()))
+    # Sources still running are ignored, a copy keeps late answers out of the merge.
+    results = dict(results)
+
+    sources = {}
+    node_list = []
+    for source in snapshots:
+        result = results.get(source, {'state': 'timeout', 'elapsed': timeout})
+        sources[source] = {key: value for key, value in result.items() if key != 'node_list'}
+        if result['state'] == 'ok' and result['node_list']:
+            node_list.extend(list(row) + [source] for row in result['node_list'])
+    node_list.sort(key=lambda row: row[2], reverse=True)
+    if show not in DASHBOARD_LISTS:
+        node_list = node_list[:25]
+
+    context = merge_counts(result['counts'] for result in results.values() if result['state'] == 'ok')
+    context['sources'] = sources
+    context['node_list'] = node_list
+    context['selected_view'] = show
+    return context
@@ -0,0 +1,158 @@
+"""
+Server-sent events with dashboard updates, one producer per PuppetDB source and permission filter.
+
+The producer thread runs while clients are connected. Every DASHBOARD_PUSH_INTERVAL seconds it works
+out the dashboard counts and the status of each node once, and pushes a dashboard event when the counts
+changed and a nodes event with the nodes whose status changed to every connected client. The number of
+clients does not change the number of PuppetDB requests.
+
+Every open stream holds a server thread, so the pages only use the feed when DASHBOARD_PUSH is enabled.
+Streams are closed after STREAM_MAX_AGE seconds so they do not hold a worker forever. EventSource
+clients reconnect by themselves and send the id of the last event received, the events they missed are
+sent again when still kept.
+"""
+
+import json
+import threading
+import time
+from collections import deque
+
+from panopuppet.pano.methods.dashboard import SessionSnapshot, dashboard_status
+from panopuppet.pano.puppetdb import admission
+from panopuppet.pano.puppetdb.puppetdb import get_permission_filter, get_server
+from panopuppet.pano.settings import DASHBOARD_PUSH_INTERVAL
+
+__author__ = 'etaklar'
+
+# Seconds between comments sent to keep idle connections open.
+KEEPALIVE_INTERVAL = 15
+STREAM_MAX_AGE = 600
+# Number of events kept for clients resuming with Last-Event-ID.
+EVENT_BACKLOG = 100
+# Milliseconds the client waits before reconnecting.
+RECONNECT_DELAY = 5000
+
+_feeds = {}
+_feeds_lock = threading.Lock()
+
+
+def format_event(event_id, name, data):
+    return 'id: %d\nevent: %s\ndata: %s\n\n' % (event_id, name, data)
+
+
+class DashboardFeed(object):
+    def __init__(self, request, interval=DASHBOARD_PUSH_INTERVAL):
+        # The session of the client that started the feed.
+        self.request = SessionSnapshot(request)
+        self.interval = interval
+        self.condition = threading.Condition()
+        # (id, name, json data) of the latest events
+        self.events = deque(maxlen=EVENT_BACKLOG)
+        self.event_id = 0
+        self.counts = None
+        self.node_status = None
+        self.subscribers = 0
+        self.running = False
+
+    def subscribe(self):
+        with self.condition:
+            self.subscribers += 1
+            if self.running:
+                return
+            self.running = True
+        worker = threading.Thread(target=self._produce, name='DashboardFeed-producer')
+        worker.setDaemon(True)
+        worker.start()
+
+    def unsubscribe(self):
+        with self.condition:
+            self.subscribers -= 1
+
+    def _produce(self):
+        admission.attach_priority(admission.BACKGROUND)
+        while True:
+            try:
+                counts, node_status = dashboard_status(self.request)[:2]
+            except Exception:
+                # PuppetDB is not reachable, the clients keep showing the last counts.
+                pass
+            else:
+                self.publish(counts, node_status)
+            time.sleep(self.interval)
+            with self.condition:
+                if self.subscribers <= 0:
+                    self.running = False
+                    return
+
+    def _add_event(self, name, data):
+        self.event_id += 1
+        self.events.append((self.event_id, name, json.dumps(data)))
+
+    def publish(self, counts, node_status):
+        """Add the events for the changes since the previous publish and wake up the clients."""
+        with self.condition:
+            if counts != self.counts:
+                self._add_event('dashboard', counts)
+            if self.node_status is not None:
+                transitions = []
+                for certname in sorted(set(self.node_status) | set(node_status)):
+                    previous = self.node_status.get(certname)
+                    status = node_status.get(certname)
+                    if status != previous:
+                        transitions.append({'certname': certname, 'status': status, 'previous': previous})
+                if transitions:
+                    self._add_event('nodes', transitions)
+            self.counts = counts
+            self.node_status = node_status
+            self.condition.notify_all()
+
+    def _pending(self, sent_id):
+        """Events after sent_id, or the current counts when some of those events are no longer kept."""
+        # Ids from before a restart are larger than the current id.
+        if sent_id is not None and self.event_id - len(self.events) <= sent_id <= self.event_id:
+            return [event for event in self.events if event[0] > sent_id]
+        if self.counts is None:
+            return []
+        return [(self.event_id, 'dashboard', json.dumps(self.counts))]
+
+    def stream(self, last_event_id=None, max_age=STREAM_MAX_AGE):
+        """
+        Generator of server-sent events, starting with the current counts.
+        :param last_event_id: id of the last event the client received before reconnecting
+        """
+        self.subscribe()
+        try:
+            started = time.time()
+            sent_id = last_event_id
+            yield 'retry: %d\n\n' % RECONNECT_DELAY
+            while time.time() - started < max_age:
+                with self.condition:
+                    events = self._pending(sent_id)
+                    if not events:
+                        self.condition.wait(KEEPALIVE_INTERVAL)
+                        events = self._pending(sent_id)
+                if not events:
+                    yield ': keepalive\n\n'
+                    continue
+                for event in events:
+                    yield format_event(*event)
+                sent_id = events[-1][0]
+        finally:
+            self.unsubscribe()
+
+
+def get_feed(request):
+    """
+    The dashboard feed of the request's source and permission filter, None if the user may not see any nodes.
+    :return: DashboardFeed
+    """
+    allowed, permission_filter = get_permission_filter(request)
+    if not allowed:
+        return None
+    source_url, source_certs, source_verify = get_server(request)
+    key = (source_url, permission_filter)
+    with _feeds_lock:
+        feed = _feeds.get(key)
+        if feed is None:
+            feed = _feeds[key] = DashboardFeed(request)
+    return feed
@@ -1,7 +1,11 @@
 import requests
 import hashlib
-import difflib
+from concurrent.futures import ThreadPoolExecutor
 
+from panopuppet.pano.methods.filecache import decode_body, declared_charset, filebucket_body, fileserver_body, \
+    get_store
+from panopuppet.pano.methods.textdiff import diff_files
+from panopuppet.pano.puppetdb.pdbutils import in_context
 from panopuppet.pano.puppetdb.puppetdb import api_get as pdb_api_get, get_server, mk_puppetdb_query
 
 __author__ = 'takeshi'
@@ -24,39 +28,36 @@ def get_file(request, certname, environment, rtitle, rtype, md5sum_from=None, md
                                                                                          type='fileserver')
     # If Clientbucket is enabled continue else return False
 
-    def fetch_filebucket(url, method):
-        headers = {
-            'Accept': 's',
-        }
-        methods = {'get': requests.get,
-                   'head': requests.head,
-                   }
-        if method not in methods:
-            print('No can has method: %s' % method)
-            return False
-        resp = methods[method](url,
-                               headers=headers,
-                               verify=filebucket_verify,
-                               cert=filebucket_certs)
-        if resp.status_code != 200:
-            return False
-        else:
-            return resp.text
-
-    def fetch_fileserver(url, method):
-        methods = {'get': requests.get,
-                   }
-
-        if method not in methods:
-            print('No can has method: %s' % method)
+    def fetch_filebucket(md5sum):
+        # A single GET, a file missing from the filebucket is a 404. Known md5s are not fetched again.
+        def fetch():
+            resp = requests.get(filebucket_source + environment + '/file_bucket_file/md5/' + md5sum,
+                                headers={'Accept': 's'},
+                                verify=filebucket_verify,
+                                cert=filebucket_certs)
+            if resp.status_code != 200:
+                return None, None
+            return resp.content, declared_charset(resp)
+
+        body, charset = filebucket_body(md5sum, fetch)
+        if body is None:
             return False
-        resp = methods[method](url,
-                               verify=fileserver_verify,
-                               cert=fileserver_certs)
-        if resp.status_code != 200:
+        return decode_body(body, charset)
+
+    def fetch_fileserver(source_path):
+        # https://puppetmaster.example.com:8140/production/file_content/files/autofs/auto.home
+        def fetch():
+            resp = requests.get(fileserver_source + environment + '/file_content/' + source_path,
+                                verify=fileserver_verify,
+                                cert=fileserver_certs)
+            if resp.status_code != 200:
+                return None, None
+            return resp.content, declared_charset(resp)
+
+        body, charset = fileserver_body(fileserver_source, environment, source_path, fetch)
+        if body is None:
             return False
-        else:
-            return resp.text
+        return decode_body(body, charset)
 
     def get_resource(certname, rtype, rtitle):
         resource_params = {
@@ -91,19 +92,32 @@ def get_resource(certname, rtype, rtitle):
                 md5sum_from = md5sum_from.replace('{md5}', '')
                 md5sum_to = md5sum_to.replace('{md5}', '')
 
-                from_url = filebucket_source + environment + '/file_bucket_file/md5/' + md5sum_from
-                to_url = filebucket_source + environment + '/file_bucket_file/md5/' + md5sum_to
-
-                if fetch_filebucket(from_url, 'head') is not False:
-                    resource_from = fetch_filebucket(from_url, 'get')
-                else:
+                # Both sides are fetched at the same time. The new file is often not in the filebucket,
+                # its PuppetDB resource is looked up alongside unless the file is in the local cache.
+                executor = ThreadPoolExecutor(max_workers=3)
+                from_future = executor.submit(in_context(fetch_filebucket), md5sum_from)
+                to_future = executor.submit(in_context(fetch_filebucket), md5sum_to)
+                store = get_store()
+                resource_future = None
+                if store is None or md5sum_to not in store:
+                    resource_future = executor.submit(in_context(get_resource), certname=certname, rtype=rtype,
+                                                      rtitle=rtitle)
+                executor.shutdown(wait=False)
+
+                resource_from = from_future.result()
+                if resource_from is False:
                     # Could not find old MD5 in Filebucket
                     return False
-                if fetch_filebucket(to_url, 'head') is not False:
-                    resource_to = fetch_filebucket(to_url, 'get')
+                resource_to = to_future.result()
+                # The diff is kept by the md5 of both files.
+                md5_to = md5sum_to
                 # Try puppetdb resources if not found in filebucket.
-                else:
-                    resource_to = get_resource(certname=certname, rtype=rtype, rtitle=rtitle)
+                if resource_to is False:
+                    md5_to = None
+                    if resource_future is not None:
+                        resource_to = resource_future.result()
+                    else:
+                        resource_to = get_resource(certname=certname, rtype=rtype, rtitle=rtitle)
                     if resource_to is False:
                         # Could not find new file in Filebucket or as a PuppetDB Resource
                         return False
@@ -111,7 +125,7 @@ def get_resource(certname, rtype, rtitle):
                         resource_to = resource_to[0]
                     if 'content' in resource_to['parameters']:
                         resource_to = resource_to['parameters']['content']
-                        hash_of_resource = get_hash(resource_to)
+                        hash_of_resource = md5_to = get_hash(resource_to)
                         if hash_of_resource == md5sum_to:
                             # file from resource matches filebucket md5 hash
                             hash_matches = True
@@ -122,18 +136,16 @@ def get_resource(certname, rtype, rtitle):
                             # extract the path for the file
                             source_path = source_path.split('/')  # ['puppet:', '', '', 'files', 'autofs', 'auto.home']
                             source_path = '/'.join(source_path[3:])  # Skip first 3 entries since they are not needed
-                            # https://puppetmaster.example.com:8140/production/file_content/files/autofs/auto.home
-                            url = fileserver_source + environment + '/file_content/' + source_path
-                            resource_to = fetch_fileserver(url, 'get')
+                            resource_to = fetch_fileserver(source_path)
                     else:
                         return False
+                if not isinstance(resource_to, str):
+                    # The source of the new file could not be fetched.
+                    return False
                 # now that we have come this far, we have both files.
-                # Lets differentiate the shit out of these files.
-                from_split_lines = resource_from.split('\n')
-                to_split_lines = resource_to.split('\n')
-                diff = difflib.unified_diff(from_split_lines, to_split_lines)
-                diff = ('\n'.join(list(diff))).split('\n')
-                return diff
+                if md5_to is None:
+                    md5_to = get_hash(resource_to)
+                return diff_files(resource_from, resource_to, md5sum_from, md5sum_to, md5sum_from, md5_to)
             else:
                 return False
         else:
@@ -147,8 +159,8 @@ def get_resource(certname, rtype, rtitle):
         return False
     # Creates headers and url from the data we got
 
-    url_clientbucket = filebucket_source + environment + '/file_bucket_file/md5/' + md5sum
-    if fetch_filebucket(url_clientbucket, 'head') is False:
+    filebucket_results = fetch_filebucket(md5sum)
+    if filebucket_results is False:
         # Check if theres a resource available for the latest file available
         if file_status == 'to':
             resp_pdb = get_resource(certname=certname, rtype=rtype, rtitle=rtitle)
@@ -165,9 +177,7 @@ def get_resource(certname, rtype, rtitle):
                         # extract the path for the file
                         source_path = source_path.split('/')  # ['puppet:', '', '', 'files', 'autofs', 'auto.home']
                         source_path = '/'.join(source_path[3:])  # Skip first 3 entries since they are not needed
-                        # https://puppetmaster.example.com:8140/production/file_content/files/autofs/auto.home
-                        url = fileserver_source + environment + '/file_content/' + source_path
-                        source_content = fetch_fileserver(url, 'get')
+                        source_content = fetch_fileserver(source_path)
                         prepend_text = 'This file with MD5 %s was retrieved from the PuppetMaster Fileserver.\n\n' % (
                             get_hash(source_content))
                         return prepend_text + source_content
@@ -182,6 +192,5 @@ def get_resource(certname, rtype, rtitle):
         else:
             return False
     else:
-        filebucket_results = fetch_filebucket(url_clientbucket, 'get')
         prepend_text = 'This file with MD5 %s was found in Filebucket.\n\n' % (md5sum)
         return prepend_text + filebucket_results
@@ -0,0 +1,223 @@
+"""
+Local cache of the files shown and compared on the filebucket page.
+
+A filebucket file is known by the md5 of its content and never changes, so the bodies are kept on disk
+in FILEBUCKET_CACHE_DIR, one file per md5, and fetched from the filebucket only once. The bodies used
+least recently are removed when the cache grows beyond FILEBUCKET_CACHE_SIZE megabytes. Reading a body
+updates its modification time, so the order survives a restart.
+
+Files on the Puppet fileserver are known by environment and path and do change, the md5 of the content
+of a path is remembered for FILESERVER_CACHE_TTL seconds and the content kept in the same store.
+
+The bodies are kept as the bytes the server sent, see decode_body for how they are turned into text. The
+charset the server declared for a body is kept next to it in a file named after the md5 with .charset appended.
+"""
+
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from panopuppet.pano.settings import FILEBUCKET_CACHE_DIR, FILEBUCKET_CACHE_SIZE, FILESERVER_CACHE_TTL
+
+__author__ = 'etaklar'
+
+_store = None
+_store_lock = threading.Lock()
+
+# (fileserver, environment, path): (time fetched, md5)
+_fileserver = {}
+_fileserver_lock = threading.Lock()
+
+
+def get_md5(body):
+    return hashlib.md5(body).hexdigest()
+
+
+def decode_body(body, charset=None):
+    """
+    :param body: bytes
+    :param charset: Charset the server declared for body, None when it did not
+    :return: body decoded with charset, else as UTF-8 and as latin-1 when it is not UTF-8
+    """
+    for encoding in (charset, 'utf-8'):
+        if encoding:
+            try:
+                return body.decode(encoding)
+            except (LookupError, UnicodeDecodeError):
+                pass
+    # Every byte is a latin-1 character, nothing is lost.
+    return body.decode('latin-1')
+
+
+def declared_charset(response):
+    """:return: The charset in the Content-Type header of a requests response, None when there is none"""
+    if 'charset' not in response.headers.get('Content-Type', ''):
+        return None
+    return response.encoding
+
+
+class ContentStore(object):
+    def __init__(self, directory, max_bytes):
+        """
+        :param directory: Directory the bodies are kept in, created when missing
+        :param max_bytes: Total size of the bodies kept
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.size = 0
+        # md5: size, least recently used first. Loaded from the directory on first use.
+        self._index = None
+        self._lock = threading.Lock()
+
+    def _path(self, md5):
+        return os.path.join(self.directory, md5[:2], md5)
+
+    def _charset_path(self, md5):
+        return self._path(md5) + '.charset'
+
+    def _write(self, path, data):
+        # Write to a temporary file first so concurrent requests never read a half written file.
+        handle, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(handle, 'wb') as tmp_file:
+            tmp_file.write(data)
+        os.replace(tmp_path, path)
+
+    def _remove(self, md5):
+        for path in (self._path(md5), self._charset_path(md5)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _load_index(self):
+        if self._index is not None:
+            return
+        entries = []
+        for root, dirs, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith('.tmp') or name.endswith('.charset'):
+                    continue
+                stat = os.stat(os.path.join(root, name))
+                entries.append((stat.st_mtime, name, stat.st_size))
+        self._index = OrderedDict((name, size) for mtime, name, size in sorted(entries))
+        self.size = sum(self._index.values())
+        self._evict()
+
+    def _evict(self):
+        while self.size > self.max_bytes and self._index:
+            md5, size = self._index.popitem(last=False)
+            self.size -= size
+            self._remove(md5)
+
+    def __contains__(self, md5):
+        with self._lock:
+            self._load_index()
+            return md5 in self._index
+
+    def get(self, md5):
+        """:return: The body with this md5, None when it is not kept"""
+        with self._lock:
+            self._load_index()
+            if md5 not in self._index:
+                return None
+            self._index.move_to_end(md5)
+        try:
+            with open(self._path(md5), 'rb') as body_file:
+                body = body_file.read()
+            os.utime(self._path(md5))
+        except FileNotFoundError:
+            with self._lock:
+                self.size -= self._index.pop(md5, 0)
+            return None
+        return body
+
+    def get_charset(self, md5):
+        """:return: The charset declared for the body with this md5, None when none was or it is not kept"""
+        try:
+            with open(self._charset_path(md5), 'rb') as charset_file:
+                return charset_file.read().decode('ascii')
+        except (FileNotFoundError, UnicodeDecodeError):
+            return None
+
+    def put(self, body, md5=None, charset=None):
+        """
+        Keep a body, unless it does not match md5 or is larger than the cache.
+        :param charset: Charset the server declared for body
+        :return: The md5 of body
+        """
+        body_md5 = get_md5(body)
+        if (md5 is not None and md5 != body_md5) or len(body) > self.max_bytes:
+            return body_md5
+        path = self._path(body_md5)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # The charset is written first, a body that is found always has its charset.
+        if charset:
+            self._write(self._charset_path(body_md5), charset.encode('ascii', 'ignore'))
+        else:
+            try:
+                os.remove(self._charset_path(body_md5))
+            except FileNotFoundError:
+                pass
+        self._write(path, body)
+        with self._lock:
+            self._load_index()
+            self.size += len(body) - self._index.pop(body_md5, 0)
+            self._index[body_md5] = len(body)
+            self._evict()
+        return body_md5
+
+
+def get_store():
+    """:return: ContentStore in FILEBUCKET_CACHE_DIR, None when FILEBUCKET_CACHE_SIZE is 0"""
+    global _store
+    if not FILEBUCKET_CACHE_SIZE:
+        return None
+    with _store_lock:
+        if _store is None:
+            directory = FILEBUCKET_CACHE_DIR or os.path.join(tempfile.gettempdir(), 'panopuppet-filebucket')
+            _store = ContentStore(directory, FILEBUCKET_CACHE_SIZE * 1024 * 1024)
+        return _store
+
+
+def filebucket_body(md5, fetch, store=None):
+    """
+    :param fetch: function returning the body from the filebucket and its declared charset, body is None when
+                  it is not there
+    :return: tuple(body with this md5, its charset), body is None when it is not kept and the filebucket does
+             not have it
+    """
+    store = store or get_store()
+    body = store.get(md5) if store else None
+    if body is not None:
+        return body, store.get_charset(md5)
+    body, charset = fetch()
+    if body is not None and store:
+        store.put(body, md5, charset)
+    return body, charset
+
+
+def fileserver_body(fileserver, environment, path, fetch, store=None, ttl=FILESERVER_CACHE_TTL):
+    """
+    :param fetch: function returning the content from the fileserver and its declared charset, content is None
+                  when it is not there
+    :return: tuple(content of path in environment, its charset), fetched at most once every ttl seconds
+    """
+    store = store or get_store()
+    key = (fileserver, environment, path)
+    now = time.time()
+    with _fileserver_lock:
+        fetched, md5 = _fileserver.get(key, (0, None))
+    body = store.get(md5) if store and md5 and fetched + ttl > now else None
+    if body is not None:
+        return body, store.get_charset(md5)
+    body, charset = fetch()
+    if body is not None and store:
+        md5 = store.put(body, charset=charset)
+        with _fileserver_lock:
+            for expired in [item for item, value in _fileserver.items() if value[0] + ttl <= now]:
+                del _fileserver[expired]
+            _fileserver[key] = (now, md5)
+    return body, charset
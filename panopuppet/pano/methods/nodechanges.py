@@ -0,0 +1,107 @@
+"""
+Nodes that changed since a point in time, for clients polling the node list.
+
+A node has changed when its report, facts or catalog timestamp is newer than the given time, or
+when it became unreported in the meantime: its latest report is older than PUPPET_RUN_INTERVAL
+minutes now, but was not at the given time. The timestamp filters are part of the PuppetDB queries
+so only the changed nodes are fetched, together with the event counts of those nodes.
+
+The returned watermark is the newest timestamp seen, pass it as since in the next request. PuppetDB
+stores reports through its command queue and agents send their own timestamps, so a report with an
+earlier timestamp can be stored after a later one was returned. The queries look WATERMARK_OVERLAP
+seconds back from since to find those, nodes can therefore be returned again in the next request.
+"""
+
+import datetime
+
+from django.utils.dateparse import parse_datetime
+from django.utils.timezone import is_naive, make_aware, utc
+
+from panopuppet.pano.methods.nodeexport import node_records
+from panopuppet.pano.puppetdb.mirror import WATERMARK_OVERLAP
+from panopuppet.pano.puppetdb.pdbutils import latest_timestamp, run_puppetdb_jobs, timestamp_before
+from panopuppet.pano.puppetdb.puppetdb import get_server
+
+__author__ = 'etaklar'
+
+WATERMARK_FIELDS = ('report_timestamp', 'facts_timestamp', 'catalog_timestamp', 'deactivated', 'expired')
+
+
+def format_timestamp(date):
+    """
+    :param date: datetime, naive datetimes are taken as UTC
+    :return: PuppetDB timestamp string in UTC with millisecond precision
+    """
+    if is_naive(date):
+        date = make_aware(date, utc)
+    return date.astimezone(utc).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
+
+
+def parse_since(since):
+    """
+    :param since: ISO 8601 timestamp as given by the user
+    :return: PuppetDB timestamp string, None if since is not a valid timestamp
+    """
+    try:
+        date = parse_datetime(since or '')
+    except ValueError:
+        return None
+    if date is None:
+        return None
+    return format_timestamp(date)
+
+
+def changed_nodes(request, since, now=None):
+    """
+    :param since: PuppetDB timestamp string, see parse_since
+    :param now: datetime used to work out which nodes became unreported, defaults to the current time
+    :return: dict with the nodes that changed as node_records dicts, the certnames of the nodes deactivated
+             or expired since then and the new watermark
+    """
+    source_url, source_certs, source_verify = get_server(request)
+    puppet_run_time = get_server(request, type='run_time')
+    now = now or datetime.datetime.utcnow()
+    # Changes stored late with an earlier timestamp are found in the overlap.
+    query_since = timestamp_before(since, WATERMARK_OVERLAP)
+    since_date = parse_datetime(query_since)
+    run_time = datetime.timedelta(minutes=puppet_run_time)
+    timestamps = {
+        'since': query_since,
+        'unreported_from': format_timestamp(since_date - run_time),
+        'unreported_until': format_timestamp(now - run_time),
+    }
+    job = {
+        'url': source_url,
+        'certs': source_certs,
+        'verify': source_verify,
+        'api_version': 'v4',
+        'request': request,
+    }
+    jobs = {
+        'changed': dict(job, id='changed', path='/nodes', params={
+            'query': {
+                1: '["and",["null?","deactivated",true],["or",'
+                   '[">","report_timestamp","%(since)s"],'
+                   '[">","facts_timestamp","%(since)s"],'
+                   '[">","catalog_timestamp","%(since)s"],'
+                   '["and",[">","report_timestamp","%(unreported_from)s"],'
+                   '["<=","report_timestamp","%(unreported_until)s"]]]]' % timestamps,
+            },
+        }),
+        # Mentioning deactivated or expired makes PuppetDB include inactive nodes.
+        'removed': dict(job, id='removed', path='/nodes', params={
+            'query': {
+                'extract': '["extract",["certname","deactivated","expired"],%s]',
+                1: '["or",[">","deactivated","%(since)s"],[">","expired","%(since)s"]]' % timestamps,
+            },
+        }),
+    }
+    results = run_puppetdb_jobs(jobs)
+    changed = results.get('changed', [])
+    removed = results.get('removed', [])
+    return {
+        'since': since,
+        'watermark': latest_timestamp(changed + removed, WATERMARK_FIELDS, since),
+        'nodes': list(node_records(request, changed)),
+        'removed': sorted(node['certname'] for node in removed),
+    }
@@ -0,0 +1,264 @@
+"""
+Page by page export of the node list with status, event counts and selected facts.
+
+The rows are the same as the node list in nodes_json (see dictstatus) with the value of each
+requested fact appended. The order of the nodes is fetched up front, the certnames (or the event counts
+when sorting by them) of all nodes. The nodes are then fetched one page of certnames at a time, the event
+counts and facts for the nodes of a page in parallel and joined by certname. Paging by offset would
+repeat and skip nodes whose report_timestamp changes during the export.
+
+export_records returns the same data ordered by certname as dicts, and can resume after a certname.
+node_records does the same for a list of nodes that was already fetched.
+"""
+
+import bisect
+import json
+
+from panopuppet.pano.methods.dictfuncs import dictstatus
+from panopuppet.pano.puppetdb import admission, puppetdb
+from panopuppet.pano.puppetdb.pdbutils import certname_filter, run_puppetdb_jobs
+from panopuppet.pano.puppetdb.puppetdb import get_server
+
+__author__ = 'etaklar'
+
+CSV_HEADERS = ['Certname',
+               'Latest Catalog',
+               'Latest Report',
+               'Latest Facts',
+               'Success',
+               'Noop',
+               'Failure',
+               'Skipped',
+               'Run Status']
+
+NODE_SORT_FIELDS = ('certname', 'catalog_timestamp', 'report_timestamp', 'facts_timestamp')
+STATUS_SORT_FIELDS = ('successes', 'failures', 'skips', 'noops')
+
+# Keys of the dicts returned by export_records, in the order of the row tuples.
+ROW_FIELDS = ('certname',
+              'catalog_timestamp',
+              'report_timestamp',
+              'facts_timestamp',
+              'successes',
+              'noops',
+              'failures',
+              'skips',
+              'status')
+
+# Number of nodes fetched per PuppetDB request, the certnames of a page are used in an "or" filter
+# for the event counts and facts so it should stay small.
+EXPORT_PAGE_SIZE = 100
+
+
+def parse_facts(include_facts):
+    """
+    :param include_facts: Comma separated fact names as given by the user
+    :return: list of fact names
+    """
+    if not include_facts:
+        return []
+    return [fact.strip() for fact in include_facts.split(',') if fact.strip()]
+
+
+def export_rows(request, search=None, sort_field='report_timestamp', sort_order='desc', include_facts=None,
+                page_size=EXPORT_PAGE_SIZE):
+    """
+    Generator of node rows, one tuple per node:
+    (certname, catalog_timestamp, report_timestamp, facts_timestamp, successes, noops, failures, skips, status,
+     fact values...)
+    :param search: PuppetDB query to filter the nodes with
+    :param sort_field: Node field or event count field to sort by
+    :param sort_order: asc or desc
+    :param include_facts: list of fact names to add to each row
+    :param page_size: Number of nodes fetched per request
+    """
+    include_facts = include_facts or []
+    if sort_field in STATUS_SORT_FIELDS:
+        pages = _status_sorted_pages(request, search, sort_field, sort_order, page_size)
+    else:
+        if sort_field not in NODE_SORT_FIELDS:
+            sort_field = 'report_timestamp'
+        pages = _node_sorted_pages(request, search, sort_field, sort_order, page_size)
+    # Pages for other users go first.
+    with admission.priority(admission.EXPORT):
+        for node_list, report_list in pages:
+            for row in _page_rows(request, node_list, report_list, sort_field, sort_order, include_facts):
+                yield row
+
+
+def export_certnames(request, search=None):
+    """
+    Sorted certnames of the active nodes.
+    :param search: PuppetDB query to filter the nodes with
+    :return: list
+    """
+    query = '["null?","deactivated",true]'
+    if search:
+        query = '["and",%s,%s]' % (query, search)
+    node_params = {
+        'query': {
+            'extract': '["extract",["certname"],%s]',
+            1: query,
+        },
+    }
+    return sorted(node['certname'] for node in _api_get(request, '/nodes', node_params))
+
+
+def export_records(request, search=None, include_facts=None, after=None, limit=None, page_size=EXPORT_PAGE_SIZE):
+    """
+    Generator of nodes as dicts with the ROW_FIELDS keys and a facts dict, ordered by certname.
+    Only the certnames are loaded up front, the nodes, event counts and facts are fetched a page at a time.
+    :param search: PuppetDB query to filter the nodes with
+    :param include_facts: list of fact names to add to each node
+    :param after: Only return nodes with a certname sorting after this certname, used to resume an export
+    :param limit: Maximum number of nodes to return
+    """
+    include_facts = include_facts or []
+    with admission.priority(admission.EXPORT):
+        certnames = export_certnames(request, search)
+        start = bisect.bisect_right(certnames, after) if after else 0
+        end = len(certnames) if limit is None else min(start + limit, len(certnames))
+        for page_start in range(start, end, page_size):
+            page = certnames[page_start:min(page_start + page_size, end)]
+            node_list = _api_get(request, '/nodes', {'query': {1: certname_filter(page)}})
+            for record in node_records(request, node_list, include_facts, page_size):
+                yield record
+
+
+def node_records(request, node_list, include_facts=None, page_size=EXPORT_PAGE_SIZE):
+    """
+    Generator of the nodes in node_list as dicts with the ROW_FIELDS keys and a facts dict, ordered by certname.
+    The event counts and facts are fetched for page_size nodes at a time.
+    :param node_list: Node records as returned by /nodes
+    :param include_facts: list of fact names to add to each node
+    """
+    include_facts = include_facts or []
+    node_list = sorted(node_list, key=lambda node: node['certname'])
+    for page_start in range(0, len(node_list), page_size):
+        page = node_list[page_start:page_start + page_size]
+        rows = _page_rows(request, page, None, 'certname', 'asc', include_facts, missing_fact=None)
+        for row in sorted(rows, key=lambda row: row[0]):
+            record = dict(zip(ROW_FIELDS, row))
+            if include_facts:
+                record['facts'] = dict(zip(include_facts, row[len(ROW_FIELDS):]))
+            yield record
+
+
+def _api_get(request, path, params):
+    source_url, source_certs, source_verify = get_server(request)
+    return puppetdb.api_get(
+        api_url=source_url,
+        cert=source_certs,
+        verify=source_verify,
+        path=path,
+        api_version='v4',
+        params=puppetdb.mk_puppetdb_query(params, request),
+    )
+
+
+def _order_by(field, order):
+    return {
+        'order_field':
+            {
+                'field': field,
+                'order': order,
+            },
+    }
+
+
+def _nodes_in_order(request, certnames, search=None):
+    """
+    The nodes of certnames in the order of certnames, nodes removed in the meantime are left out.
+    :param search: PuppetDB query the nodes must match as well
+    """
+    node_query = certname_filter(certnames)
+    if search:
+        node_query = '["and",%s,%s]' % (search, node_query)
+    nodes = dict((node['certname'], node) for node in _api_get(request, '/nodes', {'query': {1: node_query}}))
+    return [nodes[certname] for certname in certnames if certname in nodes]
+
+
+def _node_sorted_pages(request, search, sort_field, sort_order, page_size):
+    """Pages of nodes in PuppetDB order, the event counts are fetched together with the facts."""
+    query = '["null?","deactivated",true]'
+    if search:
+        query = '["and",%s,%s]' % (query, search)
+    node_params = {
+        'query': {
+            'extract': '["extract",%s,%%s]' % json.dumps(sorted({'certname', sort_field})),
+            1: query,
+        },
+        'order_by': _order_by(sort_field, sort_order),
+    }
+    certnames = [node['certname'] for node in _api_get(request, '/nodes', node_params)]
+    for page_start in range(0, len(certnames), page_size):
+        node_list = _nodes_in_order(request, certnames[page_start:page_start + page_size])
+        if node_list:
+            yield node_list, None
+
+
+def _status_sorted_pages(request, search, sort_field, sort_order, page_size):
+    """Pages of event counts in PuppetDB order and the nodes they belong to."""
+    report_params = {
+        'query':
+            {
+                1: '["and",["=","latest_report?",true],["in", "certname",["extract", "certname",'
+                   '["select_nodes",["null?","deactivated",true]]]]]',
+            },
+        'summarize_by': 'certname',
+        'order_by': _order_by(sort_field, sort_order),
+    }
+    report_list = _api_get(request, '/event-counts', report_params)
+    for page_start in range(0, len(report_list), page_size):
+        page = report_list[page_start:page_start + page_size]
+        yield _nodes_in_order(request, [item['subject']['title'] for item in page], search), page
+
+
+def _page_rows(request, node_list, report_list, sort_field, sort_order, include_facts, missing_fact=''):
+    if not node_list:
+        return []
+    source_url, source_certs, source_verify = get_server(request)
+    puppet_run_time = get_server(request, type='run_time')
+    page_filter = certname_filter([node['certname'] for node in node_list])
+    job = {
+        'url': source_url,
+        'certs': source_certs,
+        'verify': source_verify,
+        'api_version': 'v4',
+        'request': request,
+    }
+    jobs = {}
+    if report_list is None:
+        jobs['events'] = dict(job, id='events', path='/event-counts', params={
+            'query': {1: '["and",%s,["=","latest_report?",true]]' % page_filter},
+            'summarize_by': 'certname',
+        })
+    if include_facts:
+        jobs['facts'] = dict(job, id='facts', path='/facts', params={
+            'query': {
+                'extract': '["extract",["certname","name","value"],%s]',
+                1: '["and",%s,["or",%s]]' % (
+                    page_filter, ','.join('["=","name",%s]' % json.dumps(fact) for fact in include_facts)),
+            },
+        })
+    results = run_puppetdb_jobs(jobs) if jobs else {}
+    if report_list is None:
+        report_list = results.get('events', [])
+
+    facts = {}
+    for fact in results.get('facts', []):
+        facts.setdefault(fact['certname'], {})[fact['name']] = fact['value']
+
+    report_dict = {item['subject']['title']: item for item in report_list}
+    rows = dictstatus(node_list,
+                      None,
+                      report_dict,
+                      sortby=sort_field,
+                      # dictstatus sorts descending when asc is True.
+                      asc=sort_order == 'desc',
+                      sort=False,
+                      puppet_run_time=puppet_run_time,
+                      format_time=False)
+    if not include_facts:
+        return rows
+    return [row + tuple(facts.get(row[0], {}).get(fact, missing_fact) for fact in include_facts) for row in rows]
@@ -0,0 +1,191 @@
+"""
+Fleet wide search for the nodes with a resource, Type[title], in their catalogue.
+
+PuppetDB is asked for as little as possible: the number of nodes with the resource per environment is
+a single grouped count, and the node list is an extract of certname and environment, the type and
+title are the query itself. The count says how many pages of RESOURCE_SEARCH_PAGE_SIZE nodes, ordered by
+certname, there are and the pages are fetched RESOURCE_SEARCH_THREADS at a time.
+
+Results are kept per catalogue generation: the number of active nodes with a catalogue and the newest
+catalog_timestamp.
+A new catalogue or a node coming or going changes the generation, until then a search is answered
+from memory after one small /nodes query. The results of the RESOURCE_SEARCH_CACHE_SIZE searches used
+last are kept, per source and permission filter.
+"""
+
+import json
+import re
+import threading
+from collections import OrderedDict
+
+from panopuppet.pano.puppetdb import puppetdb
+from panopuppet.pano.puppetdb.pdbutils import run_puppetdb_jobs
+from panopuppet.pano.puppetdb.puppetdb import get_permission_filter, get_server
+from panopuppet.pano.settings import RESOURCE_SEARCH_CACHE_SIZE, RESOURCE_SEARCH_PAGE_SIZE, \
+    RESOURCE_SEARCH_THREADS
+
+__author__ = 'etaklar'
+
+RESOURCE_REFERENCE = re.compile(r'^([\w:]+)\[(.+)\]$', re.DOTALL)
+
+# (source, permission filter, type, title): {'generation': ..., 'environments': ..., 'nodes': ...}
+_results = OrderedDict()
+_results_lock = threading.Lock()
+
+
+def parse_resource(reference):
+    """
+    :param reference: Puppet resource reference, Type[title]
+    :return: tuple(type, title) with the type capitalized the way PuppetDB stores it, None when the
+             reference is not valid
+    """
+    match = RESOURCE_REFERENCE.match(reference.strip())
+    if not match:
+        return None
+    resource_type = '::'.join(part.capitalize() for part in match.group(1).split('::'))
+    return resource_type, match.group(2)
+
+
+def resource_query(resource_type, title):
+    return '["and",["=","type",%s],["=","title",%s]]' % (json.dumps(resource_type), json.dumps(title))
+
+
+class ResourceSearch(object):
+    def __init__(self, request, resource_type, title, page_size=RESOURCE_SEARCH_PAGE_SIZE,
+                 threads=RESOURCE_SEARCH_THREADS):
+        """
+        :param request: Request the source and the permission filter are taken from
+        """
+        self.request = request
+        self.resource_type = resource_type
+        self.title = title
+        self.page_size = page_size
+        self.threads = threads
+        self.source_url, self.source_certs, self.source_verify = get_server(request)
+        self.key = (self.source_url, get_permission_filter(request)[1], resource_type, title)
+        # PuppetDB leaves the resources of deactivated nodes out.
+        self.query = resource_query(resource_type, title)
+        self._generation = None
+
+    def _job(self, path, params):
+        return {
+            'id': path,
+            'path': path,
+            'url': self.source_url,
+            'certs': self.source_certs,
+            'verify': self.source_verify,
+            'api_version': 'v4',
+            'params': params,
+            'request': self.request,
+        }
+
+    def _api_get(self, path, params):
+        return puppetdb.api_get(
+            api_url=self.source_url,
+            cert=self.source_certs,
+            verify=self.source_verify,
+            path=path,
+            api_version='v4',
+            params=puppetdb.mk_puppetdb_query(params, self.request),
+        )
+
+    def generation(self):
+        """:return: tuple(number of active nodes with a catalogue, newest catalog_timestamp), looked up once"""
+        if self._generation is None:
+            newest = self._api_get('/nodes', {
+                'query': {
+                    'extract': '["extract",["catalog_timestamp"],%s]',
+                    1: '["and",["null?","deactivated",true],["null?","catalog_timestamp",false]]',
+                },
+                'order_by': {'order_field': {'field': 'catalog_timestamp', 'order': 'desc'}},
+                'limit': 1,
+                'include_total': 'true',
+            })
+            if isinstance(newest, tuple):
+                newest, headers = newest
+                count = int(headers['X-records'])
+            else:
+                count = len(newest)
+            self._generation = (count, newest[0]['catalog_timestamp'] if newest else None)
+        return self._generation
+
+    def _cached(self):
+        with _results_lock:
+            cached = _results.get(self.key)
+            if cached is None or cached['generation'] != self.generation():
+                return None
+            _results.move_to_end(self.key)
+            return cached
+
+    def _store(self, **values):
+        with _results_lock:
+            cached = _results.get(self.key)
+            if cached is None or cached['generation'] != self.generation():
+                cached = _results[self.key] = {'generation': self.generation(), 'environments': None,
+                                               'nodes': None}
+            cached.update(values)
+            _results.move_to_end(self.key)
+            while len(_results) > RESOURCE_SEARCH_CACHE_SIZE:
+                _results.popitem(last=False)
+
+    def environments(self):
+        """:return: dict of environment to the number of active nodes with the resource"""
+        cached = self._cached()
+        if cached is not None and cached['environments'] is not None:
+            return cached['environments']
+        counts = self._api_get('/resources', {
+            'query': {
+                'extract': '["extract",[["function","count"],"environment"],%s,["group_by","environment"]]',
+                1: self.query,
+            },
+        })
+        environments = dict((count['environment'], count['count']) for count in counts)
+        self._store(environments=environments)
+        return environments
+
+    def _page_params(self, page):
+        return {
+            'query': {
+                'extract': '["extract",["certname","environment"],%s]',
+                1: self.query,
+            },
+            'order_by': {'order_field': {'field': 'certname', 'order': 'asc'}},
+            'limit': self.page_size,
+            'offset': page * self.page_size,
+        }
+
+    def _pages(self):
+        """Generator of the pages of the node list in order."""
+        pages = max(1, -(-sum(self.environments().values()) // self.page_size))
+        page = 0
+        while True:
+            batch = list(range(page, min(page + self.threads, pages))) or [page]
+            results = run_puppetdb_jobs(
+                dict((number, dict(self._job('/resources', self._page_params(number)), id=number))
+                     for number in batch), threads=self.threads)
+            for number in batch:
+                yield results[number]
+            page = batch[-1] + 1
+            # Nodes that got the resource since the count are on pages after the counted ones.
+            if page >= pages and len(results[batch[-1]]) < self.page_size:
+                return
+
+    def nodes(self):
+        """
+        Generator of the active nodes with the resource as dicts with certname and environment, ordered
+        by certname. Pages are returned as they arrive, the complete list is kept for the next search.
+        """
+        cached = self._cached()
+        if cached is not None and cached['nodes'] is not None:
+            for node in cached['nodes']:
+                yield node
+            return
+        nodes = []
+        for page in self._pages():
+            nodes.extend(page)
+            for node in page:
+                yield node
+        environments = {}
+        for node in nodes:
+            environments[node['environment']] = environments.get(node['environment'], 0) + 1
+        self._store(environments=environments, nodes=nodes)
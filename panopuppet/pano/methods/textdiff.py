@@ -0,0 +1,271 @@
+"""
+Unified diff of two files for the filebucket page.
+
+The lines both files have exactly once are matched first (patience diff), in the order that matches the
+most of them, and the lines around these anchors the same way. The parts without such lines are
+compared with Myers' algorithm, which finds the fewest changes, up to MYERS_MAX_EDITS changes; beyond
+that the part is shown as replaced. Time and memory grow with the size of the files instead of with
+the product of the sizes as with difflib, so large files do not time out the request.
+
+Files larger than FILEBUCKET_DIFF_MAX_SIZE megabytes or FILEBUCKET_DIFF_MAX_LINES lines and binary files
+are not compared. Hunks are returned as they are found, and the diff of two files is kept in the Django
+cache by the md5 of both files, as the filebucket knows them: the same two files always give the same diff.
+"""
+
+import bisect
+import itertools
+
+from django.core.cache import cache
+
+from panopuppet.pano.settings import FILEBUCKET_DIFF_MAX_LINES, FILEBUCKET_DIFF_MAX_SIZE
+
+__author__ = 'etaklar'
+
+# Unchanged lines shown around the changes.
+CONTEXT_LINES = 3
+# Changes Myers' algorithm looks for in a part of the files without anchors before giving up.
+MYERS_MAX_EDITS = 1000
+# A file with a NUL character in its first BINARY_CHECK_SIZE characters is binary, as git decides.
+BINARY_CHECK_SIZE = 8000
+
+
+def is_binary(text):
+    return '\x00' in text[:BINARY_CHECK_SIZE]
+
+
+def _unique_anchors(a, b, a_lo, a_hi, b_lo, b_hi):
+    """
+    :return: list of (i, j) of the lines found once in a[a_lo:a_hi] and once in b[b_lo:b_hi], the longest
+             sequence of them in the same order in both
+    """
+    counts = {}
+    for i in range(a_lo, a_hi):
+        count = counts.get(a[i])
+        counts[a[i]] = [i, None, 1, 0] if count is None else [count[0], None, count[2] + 1, 0]
+    for j in range(b_lo, b_hi):
+        count = counts.get(b[j])
+        if count is not None:
+            count[1] = j
+            count[3] += 1
+    unique = sorted((count[0], count[1]) for count in counts.values() if count[2] == 1 and count[3] == 1)
+    # Longest increasing subsequence of the b positions, patience sorting.
+    tops = []
+    top_items = []
+    previous = []
+    for number, (i, j) in enumerate(unique):
+        pile = bisect.bisect_left(tops, j)
+        previous.append(top_items[pile - 1] if pile else None)
+        if pile == len(tops):
+            tops.append(j)
+            top_items.append(number)
+        else:
+            tops[pile] = j
+            top_items[pile] = number
+    anchors = []
+    number = top_items[-1] if top_items else None
+    while number is not None:
+        anchors.append(unique[number])
+        number = previous[number]
+    anchors.reverse()
+    return anchors
+
+
+def _myers(a, b, a_lo, a_hi, b_lo, b_hi, max_edits=MYERS_MAX_EDITS):
+    """
+    :return: list of (i, j) of the lines a[a_lo:a_hi] and b[b_lo:b_hi] have in common with the fewest changes,
+             None when more than max_edits changes are needed
+    """
+    n = a_hi - a_lo
+    m = b_hi - b_lo
+    max_edits = min(n + m, max_edits)
+    # Furthest x reached on every diagonal k = x - y, at index k + offset.
+    offset = max_edits + 1
+    furthest = [0] * (2 * max_edits + 3)
+    # Per number of edits the diagonals -edits - 1 up to edits + 1 before that step, to find the way back.
+    trace = []
+    for edits in range(max_edits + 1):
+        trace.append(furthest[offset - edits - 1:offset + edits + 2])
+        for k in range(-edits, edits + 1, 2):
+            if k == -edits or (k != edits and furthest[offset + k - 1] < furthest[offset + k + 1]):
+                x = furthest[offset + k + 1]
+            else:
+                x = furthest[offset + k - 1] + 1
+            y = x - k
+            while x < n and y < m and a[a_lo + x] == b[b_lo + y]:
+                x += 1
+                y += 1
+            furthest[offset + k] = x
+            if x >= n and y >= m:
+                return _myers_matches(trace, n, m, a_lo, b_lo)
+    return None
+
+
+def _myers_matches(trace, x, y, a_lo, b_lo):
+    matches = []
+    for edits in range(len(trace) - 1, -1, -1):
+        furthest = trace[edits]
+        k = x - y
+        if k == -edits or (k != edits and furthest[k + edits] < furthest[k + edits + 2]):
+            previous_k = k + 1
+        else:
+            previous_k = k - 1
+        previous_x = furthest[previous_k + edits + 1]
+        previous_y = previous_x - previous_k
+        while x > previous_x and y > previous_y:
+            x -= 1
+            y -= 1
+            matches.append((a_lo + x, b_lo + y))
+        x, y = previous_x, previous_y
+    matches.reverse()
+    return matches
+
+
+def matching_lines(a, b):
+    """
+    :param a: list of lines
+    :param b: list of lines
+    :return: list of (i, j) of the lines a and b have in common, in order
+    """
+    matches = []
+    regions = [(0, len(a), 0, len(b))]
+    while regions:
+        a_lo, a_hi, b_lo, b_hi = regions.pop()
+        while a_lo < a_hi and b_lo < b_hi and a[a_lo] == b[b_lo]:
+            matches.append((a_lo, b_lo))
+            a_lo += 1
+            b_lo += 1
+        while a_lo < a_hi and b_lo < b_hi and a[a_hi - 1] == b[b_hi - 1]:
+            a_hi -= 1
+            b_hi -= 1
+            matches.append((a_hi, b_hi))
+        if a_lo == a_hi or b_lo == b_hi:
+            continue
+        anchors = _unique_anchors(a, b, a_lo, a_hi, b_lo, b_hi)
+        if anchors:
+            matches.extend(anchors)
+            for i, j in anchors:
+                regions.append((a_lo, i, b_lo, j))
+                a_lo, b_lo = i + 1, j + 1
+            regions.append((a_lo, a_hi, b_lo, b_hi))
+        else:
+            matches.extend(_myers(a, b, a_lo, a_hi, b_lo, b_hi) or [])
+    matches.sort()
+    return matches
+
+
+def grouped_opcodes(matches, n, m, context=CONTEXT_LINES):
+    """
+    Generator of the hunks as lists of difflib style opcodes (tag, i1, i2, j1, j2), with context unchanged lines
+    around the changes.
+    :param matches: list of (i, j) as returned by matching_lines
+    :param n: Number of lines in a
+    :param m: Number of lines in b
+    """
+    opcodes = []
+    i = j = 0
+    for match_i, match_j in matches + [(n, m)]:
+        if i < match_i or j < match_j:
+            tag = 'replace' if i < match_i and j < match_j else 'delete' if i < match_i else 'insert'
+            opcodes.append((tag, i, match_i, j, match_j))
+        if match_i < n:
+            if opcodes and opcodes[-1][0] == 'equal' and opcodes[-1][2] == match_i:
+                opcodes[-1] = ('equal', opcodes[-1][1], match_i + 1, opcodes[-1][3], match_j + 1)
+            else:
+                opcodes.append(('equal', match_i, match_i + 1, match_j, match_j + 1))
+        i, j = match_i + 1, match_j + 1
+    if all(opcode[0] == 'equal' for opcode in opcodes):
+        return
+    # Grouped the way difflib.SequenceMatcher.get_grouped_opcodes groups them.
+    tag, i1, i2, j1, j2 = opcodes[0]
+    if tag == 'equal':
+        opcodes[0] = tag, max(i1, i2 - context), i2, max(j1, j2 - context), j2
+    tag, i1, i2, j1, j2 = opcodes[-1]
+    if tag == 'equal':
+        opcodes[-1] = tag, i1, min(i2, i1 + context), j1, min(j2, j1 + context)
+    hunk = []
+    for tag, i1, i2, j1, j2 in opcodes:
+        if tag == 'equal' and i2 - i1 > 2 * context:
+            hunk.append((tag, i1, min(i2, i1 + context), j1, min(j2, j1 + context)))
+            yield hunk
+            hunk = []
+            i1, j1 = max(i1, i2 - context), max(j1, j2 - context)
+        hunk.append((tag, i1, i2, j1, j2))
+    if hunk and not (len(hunk) == 1 and hunk[0][0] == 'equal'):
+        yield hunk
+
+
+def _format_range(start, stop):
+    beginning = start + 1
+    length = stop - start
+    if length == 1:
+        return '%d' % beginning
+    if not length:
+        beginning -= 1
+    return '%d,%d' % (beginning, length)
+
+
+def unified_diff(a, b, from_name='', to_name='', context=CONTEXT_LINES):
+    """
+    Generator of the lines of the unified diff of a and b, as difflib.unified_diff without line endings.
+    :param a: list of lines
+    :param b: list of lines
+    """
+    # Lines are compared as numbers, the same text gets the same number.
+    numbers = {}
+    a_numbers = [numbers.setdefault(line, len(numbers)) for line in a]
+    b_numbers = [numbers.setdefault(line, len(numbers)) for line in b]
+    started = False
+    for hunk in grouped_opcodes(matching_lines(a_numbers, b_numbers), len(a), len(b), context):
+        if not started:
+            started = True
+            yield '--- %s' % from_name
+            yield '+++ %s' % to_name
+        yield '@@ -%s +%s @@' % (_format_range(hunk[0][1], hunk[-1][2]), _format_range(hunk[0][3], hunk[-1][4]))
+        for tag, i1, i2, j1, j2 in hunk:
+            if tag == 'equal':
+                for line in a[i1:i2]:
+                    yield ' ' + line
+                continue
+            for line in a[i1:i2]:
+                yield '-' + line
+            for line in b[j1:j2]:
+                yield '+' + line
+
+
+def _cached_diff(key, lines):
+    kept = []
+    for line in lines:
+        kept.append(line)
+        yield line
+    cache.set(key, kept, None)
+
+
+def diff_files(from_text, to_text, from_name='', to_name='', from_md5=None, to_md5=None):
+    """
+    :param from_md5: md5 of from_text, the diff is only kept when the md5 of both files is given
+    :param to_md5: md5 of to_text
+    :return: iterable of the lines of the unified diff of from_text and to_text, or of a single line saying why
+             the files were not compared. Empty list when the files are the same.
+    """
+    if is_binary(from_text) or is_binary(to_text):
+        return ['Binary files %s and %s differ' % (from_name, to_name)]
+    max_size = FILEBUCKET_DIFF_MAX_SIZE * 1024 * 1024
+    if len(from_text) > max_size or len(to_text) > max_size:
+        return ['Files larger than %d MB are not compared.' % FILEBUCKET_DIFF_MAX_SIZE]
+    key = 'filebucket_diff_%s_%s' % (from_md5, to_md5) if from_md5 and to_md5 else None
+    lines = cache.get(key) if key else None
+    if lines is not None:
+        return lines
+    from_lines = from_text.split('\n')
+    to_lines = to_text.split('\n')
+    if len(from_lines) > FILEBUCKET_DIFF_MAX_LINES or len(to_lines) > FILEBUCKET_DIFF_MAX_LINES:
+        return ['Files with more than %d lines are not compared.' % FILEBUCKET_DIFF_MAX_LINES]
+    lines = unified_diff(from_lines, to_lines, from_name, to_name)
+    # The files are compared before the first line, identical files give no lines at all.
+    first = next(lines, None)
+    if first is None:
+        if key:
+            cache.set(key, [], None)
+        return []
+    lines = itertools.chain([first], lines)
+    return _cached_diff(key, lines) if key else lines
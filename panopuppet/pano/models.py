@@ -22,6 +22,17 @@ class SavedQueries(models.Model):
     filter = models.TextField()
 
 
+@python_2_unicode_compatible
+class CatalogBlob(models.Model):
+    # sha256 of the uncompressed json, identical content is stored once.
+    digest = models.CharField(max_length=64, primary_key=True)
+    data = models.BinaryField()
+    size = models.IntegerField()
+
+    def __str__(self):
+        return self.digest
+
+
 @python_2_unicode_compatible
 class SavedCatalogs(models.Model):
     id = models.AutoField(primary_key=True)
@@ -29,4 +40,21 @@ class SavedCatalogs(models.Model):
     catalogue_id = models.CharField(max_length=50)
     linked_report = models.CharField(max_length=50)
     timestamp = models.DateTimeField()
-    catalogue = models.TextField()
+    # Full catalogue json of catalogues saved before the blobs were used.
+    catalogue = models.TextField(blank=True, default='')
+    meta_blob = models.ForeignKey(CatalogBlob, null=True, related_name='+', on_delete=models.PROTECT)
+    resources_blob = models.ForeignKey(CatalogBlob, null=True, related_name='+', on_delete=models.PROTECT)
+    edges_blob = models.ForeignKey(CatalogBlob, null=True, related_name='+', on_delete=models.PROTECT)
+    # Saved catalogue the resources and edges blobs are the changes against, None when they are complete.
+    base = models.ForeignKey('self', null=True, related_name='+', on_delete=models.PROTECT)
+    # Number of saved catalogues between this one and the one with complete resources and edges.
+    depth = models.IntegerField(default=0)
+
+    class Meta:
+        index_together = [
+            ('hostname', 'catalogue_id'),
+            ('hostname', 'timestamp'),
+        ]
+
+    def __str__(self):
+        return '%s %s' % (self.hostname, self.catalogue_id)
@@ -0,0 +1,168 @@
+"""
+Limits the number of PuppetDB queries running at the same time per source.
+
+PuppetDB answers fastest with a limited number of concurrent queries. A query waits for a free slot
+when PUPPETDB_MAX_IN_FLIGHT queries of the source are running, waiting queries are let through by
+priority and then in order of arrival: queries for pages and API calls first, then exports, then
+background refreshes. The limit is per process, divide the limit PuppetDB can handle by the number
+of processes serving PanoPuppet.
+
+The priority is stored thread locally like the trace, threads doing work for the request (see
+run_puppetdb_jobs) must attach the priority of the calling thread. The time queries waited is kept
+per source and priority, see state.
+"""
+
+import heapq
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+
+from panopuppet.pano.settings import PUPPETDB_MAX_IN_FLIGHT
+
+__author__ = 'etaklar'
+
+INTERACTIVE = 0
+EXPORT = 1
+BACKGROUND = 2
+PRIORITY_NAMES = {
+    INTERACTIVE: 'interactive',
+    EXPORT: 'export',
+    BACKGROUND: 'background',
+}
+
+_local = threading.local()
+_controllers = {}
+_controllers_lock = threading.Lock()
+
+
+@contextmanager
+def priority(level):
+    """Queries made in the block wait for a slot with the given priority."""
+    previous = current_priority()
+    _local.priority = level
+    try:
+        yield
+    finally:
+        _local.priority = previous
+
+
+def current_priority():
+    return getattr(_local, 'priority', INTERACTIVE)
+
+
+def attach_priority(level):
+    _local.priority = level
+
+
+class AdmissionTimeout(requests.RequestException):
+    """No query slot became free in time."""
+
+
+class _Waiter(object):
+    def __init__(self):
+        self.event = threading.Event()
+        self.admitted = False
+
+
+class AdmissionController(object):
+    def __init__(self, max_in_flight=PUPPETDB_MAX_IN_FLIGHT):
+        # None or 0 for no limit
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        # Heap of (priority, arrival, waiter)
+        self.waiting = []
+        self.arrivals = itertools.count()
+        self.lock = threading.Lock()
+        self.stats = {level: {'admitted': 0, 'timed_out': 0, 'wait_total': 0.0, 'wait_max': 0.0}
+                      for level in PRIORITY_NAMES}
+
+    def _record(self, level, wait):
+        stats = self.stats[level]
+        stats['admitted'] += 1
+        stats['wait_total'] += wait
+        stats['wait_max'] = max(stats['wait_max'], wait)
+
+    def acquire(self, level=INTERACTIVE, timeout=None):
+        """
+        Wait for a slot, release it when the query is done.
+        :param level: INTERACTIVE, EXPORT or BACKGROUND
+        :param timeout: Seconds to wait at most, None to wait as long as it takes
+        :return: Seconds waited
+        """
+        started = time.perf_counter()
+        with self.lock:
+            if not self.max_in_flight or (self.in_flight < self.max_in_flight and not self.waiting):
+                self.in_flight += 1
+                self._record(level, 0.0)
+                return 0.0
+            waiter = _Waiter()
+            heapq.heappush(self.waiting, (level, next(self.arrivals), waiter))
+        waiter.event.wait(None if timeout is None else max(0, timeout))
+        with self.lock:
+            # The slot can be handed over between the end of the wait and taking the lock.
+            if not waiter.admitted:
+                self.waiting = [entry for entry in self.waiting if entry[2] is not waiter]
+                heapq.heapify(self.waiting)
+                self.stats[level]['timed_out'] += 1
+                raise AdmissionTimeout('No free slot for a PuppetDB query in time.')
+            wait = time.perf_counter() - started
+            self._record(level, wait)
+        return wait
+
+    def release(self):
+        with self.lock:
+            self.in_flight -= 1
+            # The slot goes straight to the first waiting query.
+            while self.waiting and self.in_flight < self.max_in_flight:
+                waiter = heapq.heappop(self.waiting)[2]
+                waiter.admitted = True
+                self.in_flight += 1
+                waiter.event.set()
+
+    def state(self):
+        with self.lock:
+            return {
+                'max_in_flight': self.max_in_flight,
+                'in_flight': self.in_flight,
+                'queued': len(self.waiting),
+                'wait': {
+                    PRIORITY_NAMES[level]: {
+                        'admitted': stats['admitted'],
+                        'timed_out': stats['timed_out'],
+                        'wait_average': stats['wait_total'] / stats['admitted'] if stats['admitted'] else 0.0,
+                        'wait_max': stats['wait_max'],
+                    } for level, stats in self.stats.items()
+                },
+            }
+
+
+def get_controller(source_url):
+    with _controllers_lock:
+        controller = _controllers.get(source_url)
+        if controller is None:
+            controller = _controllers[source_url] = AdmissionController()
+    return controller
+
+
+@contextmanager
+def admit(source_url, timeout=None):
+    """
+    Run the block in a query slot of source_url, with the priority of the thread.
+    :param timeout: Seconds to wait for a slot at most, None to wait as long as it takes
+    """
+    controller = get_controller(source_url)
+    controller.acquire(current_priority(), timeout)
+    try:
+        yield
+    finally:
+        controller.release()
+
+
+def state():
+    """Slots in use, queued queries and wait times of every source queried so far."""
+    with _controllers_lock:
+        controllers = dict(_controllers)
+    return {source_url: controller.state() for source_url, controller in controllers.items()}
@@ -0,0 +1,126 @@
+"""
+Record and replay of PuppetDB traffic.
+
+In record mode api_get saves every PuppetDB response in the cassette directory, one gzipped json file per
+source, request path and query. In replay mode api_get serves the responses from the cassette directory instead
+of sending the request, after sleeping for the latency the request originally had.
+
+Cassette files contain:
+{
+    "source": "http://puppetdb.local:8080/",
+    "method": "get",
+    "path": "pdb/query/v4/nodes",
+    "query": {"query": ["[\"=\",\"certname\",\"foo.local\"]"]},
+    "status": 200,
+    "headers": {"X-Records": "10"},
+    "latency": 0.0131,
+    "recorded": "2016-01-01T00:00:00Z",
+    "body": "[...]"
+}
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import time
+import urllib.parse as urlparse
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from panopuppet.pano.settings import PUPPETDB_CASSETTE_MODE, PUPPETDB_CASSETTE_DIR, PUPPETDB_CASSETTE_LATENCY
+
+__author__ = 'etaklar'
+
+# Response headers worth keeping, api_get only looks at X-Records.
+RECORDED_HEADERS = ('X-Records', 'Content-Type')
+
+
+class CassetteNotFound(requests.RequestException):
+    """Raised in replay mode when no response was recorded for a request."""
+
+
+class ReplayedResponse(object):
+    """The parts of a requests.Response that api_get uses."""
+
+    def __init__(self, status_code, headers, text):
+        self.status_code = status_code
+        self.headers = CaseInsensitiveDict(headers)
+        self.text = text
+
+
+def cassette_name(api_url, method, path):
+    """
+    File name of the cassette for a request.
+    :param api_url: PUPPETDB_HOST of the source queried
+    :param method: HTTP method
+    :param path: Request path including the urlencoded query string
+    :return: str
+    """
+    return hashlib.sha1(('%s %s %s' % (api_url, method.lower(), path)).encode('utf-8')).hexdigest() + '.json.gz'
+
+
+def record(api_url, method, path, response, latency, cassette_dir=None):
+    """
+    Save a response in the cassette directory.
+    :param response: requests.Response
+    :param latency: Seconds the request took
+    """
+    cassette_dir = cassette_dir or PUPPETDB_CASSETTE_DIR
+    base, _, query = path.partition('?')
+    cassette = {
+        'source': api_url,
+        'method': method.lower(),
+        'path': base,
+        'query': urlparse.parse_qs(query),
+        'status': response.status_code,
+        'headers': {header: response.headers[header] for header in RECORDED_HEADERS if header in response.headers},
+        'latency': latency,
+        'recorded': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'body': response.text,
+    }
+    if not os.path.isdir(cassette_dir):
+        os.makedirs(cassette_dir, exist_ok=True)
+    # Write to a temporary file first so concurrent requests never replay a half written cassette.
+    handle, tmp_path = tempfile.mkstemp(dir=cassette_dir, suffix='.tmp')
+    with os.fdopen(handle, 'wb') as tmp_file:
+        with gzip.GzipFile(fileobj=tmp_file, mode='wb') as cassette_file:
+            cassette_file.write(json.dumps(cassette).encode('utf-8'))
+    os.replace(tmp_path, os.path.join(cassette_dir, cassette_name(api_url, method, path)))
+
+
+def load(api_url, method, path, cassette_dir=None):
+    """Read the cassette for a request, None if it was not recorded."""
+    cassette_dir = cassette_dir or PUPPETDB_CASSETTE_DIR
+    try:
+        with gzip.open(os.path.join(cassette_dir, cassette_name(api_url, method, path)), 'rb') as cassette_file:
+            return json.loads(cassette_file.read().decode('utf-8'))
+    except FileNotFoundError:
+        return None
+
+
+def replay(api_url, method, path, cassette_dir=None, latency=None):
+    """
+    Serve a recorded response.
+    :param latency: Multiplier for the recorded latency, 0 replays without delay. Defaults to PUPPETDB_CASSETTE_LATENCY
+    :return: ReplayedResponse
+    """
+    cassette = load(api_url, method, path, cassette_dir)
+    if cassette is None:
+        raise CassetteNotFound('No recorded response for %s %s%s' % (method.upper(), api_url,
+                                                                      urlparse.unquote(path)))
+    if latency is None:
+        latency = PUPPETDB_CASSETTE_LATENCY
+    if latency and cassette['latency']:
+        time.sleep(cassette['latency'] * latency)
+    return ReplayedResponse(cassette['status'], cassette['headers'], cassette['body'])
+
+
+def recording():
+    return PUPPETDB_CASSETTE_MODE == 'record'
+
+
+def replaying():
+    return PUPPETDB_CASSETTE_MODE == 'replay'
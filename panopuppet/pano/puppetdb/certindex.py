@@ -0,0 +1,169 @@
+"""
+In-process certname index for the node search.
+
+One index is kept per PuppetDB source and permission filter. The first lookup loads all active
+certnames, after that lookups are answered from memory and the index is refreshed in a background
+thread when it is older than CERTNAME_INDEX_REFRESH seconds. A refresh only asks PuppetDB for the
+nodes that changed or were deactivated since the newest timestamp seen, every
+CERTNAME_INDEX_FULL_REFRESH seconds all certnames are reloaded.
+"""
+
+import bisect
+import threading
+
+from panopuppet.pano.puppetdb import puppetdb
+from panopuppet.pano.puppetdb.pdbutils import BackgroundRefresh, latest_timestamp, timestamp_before
+from panopuppet.pano.puppetdb.puppetdb import get_permission_filter, get_server
+from panopuppet.pano.settings import CERTNAME_INDEX_REFRESH, CERTNAME_INDEX_FULL_REFRESH
+
+__author__ = 'etaklar'
+
+# Seconds to look back from the newest timestamp seen when asking for changed nodes.
+WATERMARK_OVERLAP = 600
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+class CertnameIndex(object):
+    """
+    Sorted certnames with prefix and substring lookups, case insensitive.
+    Substring lookups search one string with all certnames separated by newlines.
+    """
+
+    def __init__(self, certnames=()):
+        self.replace(certnames)
+
+    def replace(self, certnames):
+        certnames = sorted(set(certnames), key=lambda certname: (certname.lower(), certname))
+        lower = [certname.lower() for certname in certnames]
+        offsets = []
+        position = 0
+        for certname in lower:
+            offsets.append(position)
+            position += len(certname) + 1
+        # Swap everything at once so concurrent lookups see either the old or the new index.
+        self._state = (certnames, lower, '\n'.join(lower) + '\n', offsets)
+
+    def update(self, added=(), removed=()):
+        certnames = set(self._state[0])
+        certnames.difference_update(removed)
+        certnames.update(added)
+        self.replace(certnames)
+
+    def __len__(self):
+        return len(self._state[0])
+
+    @property
+    def certnames(self):
+        return list(self._state[0])
+
+    def prefix(self, prefix, limit=50):
+        """Certnames starting with prefix, in sorted order."""
+        certnames, lower, text, offsets = self._state
+        prefix = prefix.lower()
+        start = bisect.bisect_left(lower, prefix)
+        results = []
+        for i in range(start, len(lower)):
+            if not lower[i].startswith(prefix) or (limit is not None and len(results) >= limit):
+                break
+            results.append(certnames[i])
+        return results
+
+    def substring(self, search, limit=50):
+        """Certnames containing search, in sorted order."""
+        certnames, lower, text, offsets = self._state
+        search = search.lower()
+        if not search:
+            return certnames[:limit]
+        if '\n' in search:
+            return []
+        results = []
+        position = text.find(search)
+        while position != -1 and (limit is None or len(results) < limit):
+            i = bisect.bisect_right(offsets, position) - 1
+            results.append(certnames[i])
+            # Continue after this certname so it is returned only once.
+            position = text.find(search, offsets[i] + len(lower[i]) + 1)
+        return results
+
+    def search(self, search, limit=50):
+        """Prefix matches first, followed by the other certnames containing search."""
+        results = self.prefix(search, limit)
+        if limit is None or len(results) < limit:
+            found = set(results)
+            for certname in self.substring(search, None if limit is None else limit + len(results)):
+                if certname not in found:
+                    results.append(certname)
+                    if limit is not None and len(results) >= limit:
+                        break
+        return results
+
+
+class SourceIndex(BackgroundRefresh):
+    """CertnameIndex of one source and permission filter, kept up to date from PuppetDB."""
+    refresh_interval = CERTNAME_INDEX_REFRESH
+    full_refresh_interval = CERTNAME_INDEX_FULL_REFRESH
+    timestamp_fields = ('report_timestamp', 'facts_timestamp', 'catalog_timestamp', 'deactivated', 'expired')
+
+    def __init__(self, source_url, source_certs, source_verify, permission_filter=None):
+        super(SourceIndex, self).__init__()
+        self.source_url = source_url
+        self.source_certs = source_certs
+        self.source_verify = source_verify
+        self.permission_filter = permission_filter
+        self.index = CertnameIndex()
+        self.watermark = None
+
+    def _query(self, query, fields):
+        if self.permission_filter:
+            query = '["and",%s,%s]' % (self.permission_filter, query)
+        return puppetdb.api_get(
+            api_url=self.source_url,
+            cert=self.source_certs,
+            verify=self.source_verify,
+            path='/nodes',
+            api_version='v4',
+            params={'query': '["extract",%s,%s]' % (fields, query)},
+        )
+
+    def full_refresh(self):
+        nodes = self._query('["null?","deactivated",true]',
+                            '["certname","report_timestamp","facts_timestamp","catalog_timestamp"]')
+        self.index.replace(node['certname'] for node in nodes)
+        self.watermark = latest_timestamp(nodes, self.timestamp_fields, self.watermark)
+
+    def incremental_refresh(self):
+        if self.watermark is None:
+            return self.full_refresh()
+        # Agents send their own timestamps, look back a while to catch nodes that submitted late.
+        since = timestamp_before(self.watermark, WATERMARK_OVERLAP)
+        changed = self._query(
+            '["or",[">","report_timestamp","%(w)s"],[">","facts_timestamp","%(w)s"],'
+            '[">","catalog_timestamp","%(w)s"]]' % {'w': since},
+            '["certname","report_timestamp","facts_timestamp","catalog_timestamp"]')
+        # Mentioning deactivated or expired makes PuppetDB include inactive nodes.
+        removed = self._query('["or",[">","deactivated","%(w)s"],[">","expired","%(w)s"]]' % {'w': since},
+                              '["certname","deactivated","expired"]')
+        removed_certnames = set(node['certname'] for node in removed)
+        self.index.update(added=[node['certname'] for node in changed if node['certname'] not in removed_certnames],
+                          removed=removed_certnames)
+        self.watermark = latest_timestamp(changed + removed, self.timestamp_fields, self.watermark)
+
+
+def get_index(request):
+    """
+    The certname index of the request's source and permission filter, None if the user may not see any nodes.
+    :return: CertnameIndex
+    """
+    allowed, permission_filter = get_permission_filter(request)
+    if not allowed:
+        return None
+    source_url, source_certs, source_verify = get_server(request)
+    key = (source_url, permission_filter)
+    with _indexes_lock:
+        source_index = _indexes.get(key)
+        if source_index is None:
+            source_index = _indexes[key] = SourceIndex(source_url, source_certs, source_verify, permission_filter)
+    source_index.ensure_fresh()
+    return source_index.index
@@ -0,0 +1,264 @@
+"""
+In-memory mirror of the node list and latest event counts of each PuppetDB source.
+
+The first use loads all active nodes and the event counts of their latest reports. After that the
+mirror is synchronized in a background thread when it is older than FLEET_MIRROR_REFRESH seconds:
+only the nodes with a report, facts or catalog newer than the newest timestamp seen are fetched,
+together with the event counts of those nodes, and deactivated nodes are removed. Every
+FLEET_MIRROR_FULL_REFRESH seconds everything is reloaded.
+
+With FLEET_MIRROR_SQLITE_DIR set the mirror is also stored in a SQLite database per source, so a
+restarted PanoPuppet only needs the changes since it last synchronized.
+
+The mirror contains all nodes, it is only used for users without a permission filter.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from panopuppet.pano.puppetdb import puppetdb
+from panopuppet.pano.puppetdb.pdbutils import BackgroundRefresh, certname_filter, latest_timestamp, \
+    timestamp_before
+from panopuppet.pano.puppetdb.puppetdb import get_permission_filter, get_server
+from panopuppet.pano.settings import ENABLE_FLEET_MIRROR, FLEET_MIRROR_REFRESH, FLEET_MIRROR_FULL_REFRESH, \
+    FLEET_MIRROR_SQLITE_DIR
+
+__author__ = 'etaklar'
+
+# Seconds to look back from the newest timestamp seen when asking for changed nodes,
+# agents send their own timestamps and may submit late.
+WATERMARK_OVERLAP = 600
+# Number of certnames per event-counts query in an incremental sync.
+EVENT_COUNTS_BATCH = 100
+TIMESTAMP_FIELDS = ('report_timestamp', 'facts_timestamp', 'catalog_timestamp')
+
+_mirrors = {}
+_mirrors_lock = threading.Lock()
+
+
+class FleetMirror(BackgroundRefresh):
+    refresh_interval = FLEET_MIRROR_REFRESH
+    full_refresh_interval = FLEET_MIRROR_FULL_REFRESH
+
+    def __init__(self, source_url, source_certs, source_verify, sqlite_path=None):
+        super(FleetMirror, self).__init__()
+        self.source_url = source_url
+        self.source_certs = source_certs
+        self.source_verify = source_verify
+        self.sqlite_path = sqlite_path
+        # certname: node record as returned by /nodes
+        self.nodes = {}
+        # certname: event-counts item of the latest report
+        self.events = {}
+        self.watermark = None
+        # Certnames changed by the last sync, None after a full sync.
+        self.last_changed = None
+        if sqlite_path:
+            self.load()
+
+    def _api_get(self, path, params):
+        return puppetdb.api_get(
+            api_url=self.source_url,
+            cert=self.source_certs,
+            verify=self.source_verify,
+            path=path,
+            api_version='v4',
+            params=params,
+        )
+
+    def _event_counts(self, query):
+        return self._api_get('/event-counts', {
+            'query': '["and",["=","latest_report?",true],%s]' % query,
+            'summarize_by': 'certname',
+        })
+
+    def full_refresh(self):
+        nodes = self._api_get('/nodes', {'query': '["null?","deactivated",true]'})
+        events = self._event_counts(
+            '["in","certname",["extract","certname",["select_nodes",["null?","deactivated",true]]]]')
+        self.nodes = {node['certname']: node for node in nodes}
+        self.events = {item['subject']['title']: item for item in events if item['subject']['title'] in self.nodes}
+        self.watermark = latest_timestamp(nodes, TIMESTAMP_FIELDS, None)
+        self.last_changed = None
+        self.save(full=True)
+
+    def incremental_refresh(self):
+        if self.watermark is None:
+            return self.full_refresh()
+        since = timestamp_before(self.watermark, WATERMARK_OVERLAP)
+        changed = self._api_get('/nodes', {
+            'query': '["and",["null?","deactivated",true],["or",[">","report_timestamp","%(w)s"],'
+                     '[">","facts_timestamp","%(w)s"],[">","catalog_timestamp","%(w)s"]]]' % {'w': since}})
+        # Mentioning deactivated or expired makes PuppetDB include inactive nodes.
+        removed = self._api_get('/nodes', {
+            'query': '["extract",["certname"],["or",[">","deactivated","%(w)s"],[">","expired","%(w)s"]]]' % {
+                'w': since}})
+
+        # Copy before changing so readers never see a half applied sync.
+        nodes = dict(self.nodes)
+        events = dict(self.events)
+        updated = []
+        for node in changed:
+            if nodes.get(node['certname']) != node:
+                updated.append(node['certname'])
+            nodes[node['certname']] = node
+        # Event counts only change with a new report.
+        reported = [node['certname'] for node in changed if node.get('report_timestamp') and
+                    node['report_timestamp'] > since]
+        for start in range(0, len(reported), EVENT_COUNTS_BATCH):
+            batch = reported[start:start + EVENT_COUNTS_BATCH]
+            counts = {item['subject']['title']: item for item in self._event_counts(certname_filter(batch))}
+            for certname in batch:
+                if certname in counts:
+                    if events.get(certname) != counts[certname]:
+                        updated.append(certname)
+                    events[certname] = counts[certname]
+                elif events.pop(certname, None) is not None:
+                    updated.append(certname)
+        deleted = []
+        for node in removed:
+            if nodes.pop(node['certname'], None) is not None:
+                deleted.append(node['certname'])
+            events.pop(node['certname'], None)
+
+        self.nodes = nodes
+        self.events = events
+        self.watermark = latest_timestamp(changed, TIMESTAMP_FIELDS, self.watermark)
+        self.last_changed = set(updated) | set(deleted)
+        self.save(updated=set(updated), deleted=deleted)
+
+    def state(self):
+        """
+        Snapshot of the mirror in the shape of the PuppetDB responses the dashboard and node views use.
+        :return: dict with all_nodes, event_counts and reports lists
+        """
+        nodes = self.nodes
+        events = self.events
+        return {
+            'all_nodes': list(nodes.values()),
+            'event_counts': list(events.values()),
+            'reports': [{'certname': certname, 'status': node['latest_report_status']}
+                        for certname, node in nodes.items() if node.get('latest_report_status')],
+        }
+
+    def _connect(self):
+        connection = sqlite3.connect(self.sqlite_path)
+        connection.execute('CREATE TABLE IF NOT EXISTS nodes (certname TEXT PRIMARY KEY, node TEXT, events TEXT)')
+        connection.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+        return connection
+
+    def load(self):
+        """Load the mirror from SQLite, the next sync will only fetch the changes since it was saved."""
+        if not os.path.exists(self.sqlite_path):
+            return
+        connection = self._connect()
+        try:
+            nodes = {}
+            events = {}
+            for certname, node, node_events in connection.execute('SELECT certname, node, events FROM nodes'):
+                nodes[certname] = json.loads(node)
+                if node_events:
+                    events[certname] = json.loads(node_events)
+            meta = dict(connection.execute('SELECT key, value FROM meta'))
+        finally:
+            connection.close()
+        if 'watermark' not in meta:
+            return
+        self.nodes = nodes
+        self.events = events
+        self.watermark = meta['watermark'] or None
+        self.full_refreshed = float(meta['full_refreshed'])
+        # Loaded data is stale, the first use syncs the changes in the calling thread.
+        self.refreshed = None
+
+    def save(self, full=False, updated=(), deleted=()):
+        if not self.sqlite_path:
+            return
+        connection = self._connect()
+        try:
+            with connection:
+                if full:
+                    connection.execute('DELETE FROM nodes')
+                    updated = self.nodes.keys()
+                connection.executemany('DELETE FROM nodes WHERE certname = ?', [(c,) for c in deleted])
+                connection.executemany(
+                    'INSERT OR REPLACE INTO nodes (certname, node, events) VALUES (?, ?, ?)',
+                    [(certname, json.dumps(self.nodes[certname]),
+                      json.dumps(self.events[certname]) if certname in self.events else None)
+                     for certname in updated if certname in self.nodes])
+                connection.executemany('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', [
+                    ('watermark', self.watermark or ''),
+                    ('full_refreshed', str(self.full_refreshed if not full else time.time())),
+                ])
+        finally:
+            connection.close()
+
+
+def sqlite_path(source_url):
+    if not FLEET_MIRROR_SQLITE_DIR:
+        return None
+    name = hashlib.sha1(source_url.encode('utf-8')).hexdigest()[:16]
+    return os.path.join(FLEET_MIRROR_SQLITE_DIR, 'mirror-%s.sqlite3' % name)
+
+
+def get_mirror(request):
+    """
+    The mirror of the request's source, None if the mirror is disabled or the user has a permission filter.
+    :return: FleetMirror
+    """
+    if not ENABLE_FLEET_MIRROR:
+        return None
+    allowed, permission_filter = get_permission_filter(request)
+    if not allowed or permission_filter is not None:
+        return None
+    source_url, source_certs, source_verify = get_server(request)
+    with _mirrors_lock:
+        mirror = _mirrors.get(source_url)
+        if mirror is None:
+            mirror = _mirrors[source_url] = FleetMirror(source_url, source_certs, source_verify,
+                                                        sqlite_path(source_url))
+    mirror.ensure_fresh()
+    return mirror
+
+
+def get_fleet_state(request):
+    """
+    The all_nodes, event_counts and reports results from the mirror, None when the mirror can not be used.
+    """
+    mirror = get_mirror(request)
+    if mirror is None:
+        return None
+    return mirror.state()
+
+
+def take_mirrored_jobs(request, jobs):
+    """
+    Remove the run_puppetdb_jobs jobs the mirror can answer: all_nodes, event_counts, reports
+    and nodes (the most recent nodes).
+    :return: dict of results to add to the run_puppetdb_jobs results
+    """
+    state = get_fleet_state(request)
+    if state is None:
+        return {}
+    results = {}
+    for name, job in list(jobs.items()):
+        if job['id'] in state:
+            results[job['id']] = state[job['id']]
+        elif job['id'] == 'nodes':
+            limit = job.get('params', {}).get('limit')
+            results['nodes'] = sort_nodes(state['all_nodes'], 'report_timestamp', 'desc')[:limit]
+        else:
+            continue
+        del jobs[name]
+    return results
+
+
+def sort_nodes(node_list, sort_field, order):
+    """Sort node records like PuppetDB order_by, nodes without a value last."""
+    present = [node for node in node_list if node.get(sort_field) is not None]
+    missing = [node for node in node_list if node.get(sort_field) is None]
+    return sorted(present, key=lambda node: node[sort_field], reverse=order == 'desc') + missing
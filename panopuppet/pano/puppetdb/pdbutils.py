@@ -1,9 +1,11 @@
 import datetime
+import json
 import queue
+import time
 
-from threading import Thread
+from threading import Lock, Thread
 
-from panopuppet.pano.puppetdb import puppetdb
+from panopuppet.pano.puppetdb import admission, puppetdb, resilience, tracing
 
 
 class UTC(datetime.tzinfo):
@@ -42,6 +44,87 @@ def json_to_datetime(date):
         tzinfo=UTC())
 
 
+def certname_filter(certnames):
+    """PuppetDB query matching any of the certnames."""
+    return '["or",%s]' % ','.join('["=","certname",%s]' % json.dumps(certname) for certname in certnames)
+
+
+def timestamp_before(date, seconds):
+    """
+    :param date: PuppetDB timestamp string
+    :param seconds: Seconds to subtract
+    :return: PuppetDB timestamp string
+    """
+    earlier = datetime.datetime.strptime(date, '%Y-%m-%dT%H:%M:%S.%fZ') - datetime.timedelta(seconds=seconds)
+    return earlier.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+
+def latest_timestamp(records, fields, latest=None):
+    """
+    The newest value of the timestamp fields in the records.
+    PuppetDB timestamps all have the same format so they are compared as strings.
+    """
+    for record in records:
+        for field in fields:
+            if record.get(field) and (latest is None or record[field] > latest):
+                latest = record[field]
+    return latest
+
+
+class BackgroundRefresh(object):
+    """
+    Data loaded from PuppetDB on first use and refreshed in a background thread afterwards.
+    Subclasses implement full_refresh and incremental_refresh and set the two intervals in seconds.
+    """
+    refresh_interval = 60
+    full_refresh_interval = 3600
+
+    def __init__(self):
+        self.refreshed = None
+        self.full_refreshed = None
+        self.refreshing = False
+        self.refresh_lock = Lock()
+
+    def full_refresh(self):
+        raise NotImplementedError
+
+    def incremental_refresh(self):
+        raise NotImplementedError
+
+    def refresh(self):
+        if self.full_refreshed is None or time.time() - self.full_refreshed >= self.full_refresh_interval:
+            self.full_refresh()
+            self.full_refreshed = time.time()
+        else:
+            self.incremental_refresh()
+        self.refreshed = time.time()
+
+    def _background_refresh(self):
+        admission.attach_priority(admission.BACKGROUND)
+        try:
+            self.refresh()
+        finally:
+            with self.refresh_lock:
+                self.refreshing = False
+
+    def ensure_fresh(self):
+        """Refresh in the calling thread on first use, afterwards in the background when the data is stale."""
+        if self.refreshed is None:
+            with self.refresh_lock:
+                if self.refreshed is None:
+                    self.refresh()
+            return
+        if time.time() - self.refreshed < self.refresh_interval:
+            return
+        with self.refresh_lock:
+            if self.refreshing:
+                return
+            self.refreshing = True
+        worker = Thread(target=self._background_refresh, name='%s-refresh' % self.__class__.__name__)
+        worker.setDaemon(True)
+        worker.start()
+
+
 def is_unreported(node_report_timestamp, unreported=120):
     # If node has no report timestamp
     # it has probably failed so return True.
@@ -58,6 +141,28 @@ def is_unreported(node_report_timestamp, unreported=120):
     return False
 
 
+def in_context(function, until=None):
+    """
+    Lets another thread do work for the request of the calling thread: add its PuppetDB requests to the
+    timeline of the caller, within the caller's deadline and with the caller's priority.
+    :param until: Deadline to use instead of the caller's when it is sooner
+    :return: function that runs function within the trace, deadline and priority of the calling thread
+    """
+    trace = tracing.current_trace()
+    deadline = resilience.current_deadline()
+    if until is not None and (deadline is None or until < deadline):
+        deadline = until
+    priority = admission.current_priority()
+
+    def run(*args, **kwargs):
+        tracing.attach_trace(trace)
+        resilience.attach_deadline(deadline)
+        admission.attach_priority(priority)
+        return function(*args, **kwargs)
+
+    return run
+
+
 def run_puppetdb_jobs(jobs, threads=6):
     if type(threads) != int:
         threads = 6
@@ -65,10 +170,15 @@ def run_puppetdb_jobs(jobs, threads=6):
         threads = len(jobs)
     jobs_q = queue.Queue()
     out_q = queue.Queue()
+    errors = []
 
     def db_threaded_requests(i, q):
         while True:
             t_job = q.get()
+            # None tells the thread that all jobs are done.
+            if t_job is None:
+                q.task_done()
+                break
             t_path = t_job['path']
             t_url = t_job.get('url')
             t_certs = t_job.get('certs')
@@ -76,25 +186,35 @@ def db_threaded_requests(i, q):
             t_params = t_job.get('params', {})
             t_api_v = t_job.get('api_version', 'v3')
             t_request = t_job.get('request')
-            results = puppetdb.api_get(
-                api_url=t_url,
-                verify=t_verify,
-                cert=t_certs,
-                path=t_path,
-                params=puppetdb.mk_puppetdb_query(t_params, t_request),
-                api_version=t_api_v,
-            )
-            out_q.put({t_job['id']: results})
-            q.task_done()
+            try:
+                results = puppetdb.api_get(
+                    api_url=t_url,
+                    verify=t_verify,
+                    cert=t_certs,
+                    path=t_path,
+                    params=puppetdb.mk_puppetdb_query(t_params, t_request),
+                    api_version=t_api_v,
+                )
+            except Exception as e:
+                # Keep the thread alive to mark the job done, the caller raises the error.
+                errors.append(e)
+            else:
+                out_q.put({t_job['id']: results})
+            finally:
+                q.task_done()
 
     for i in range(threads):
-        worker = Thread(target=db_threaded_requests, args=(i, jobs_q))
+        worker = Thread(target=in_context(db_threaded_requests), args=(i, jobs_q))
         worker.setDaemon(True)
         worker.start()
 
     for job in jobs:
         jobs_q.put(jobs[job])
+    for i in range(threads):
+        jobs_q.put(None)
     jobs_q.join()
+    if errors:
+        raise errors[0]
     job_results = {}
     while True:
         try:
@@ -143,7 +263,7 @@ def db_threaded_requests(i, q):
             q.task_done()
 
     for i in range(threads):
-        worker = Thread(target=db_threaded_requests, args=(i, jobs_q))
+        worker = Thread(target=in_context(db_threaded_requests), args=(i, jobs_q))
         worker.setDaemon(True)
         worker.start()
 
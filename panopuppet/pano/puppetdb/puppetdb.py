@@ -14,9 +14,12 @@
 """
 
 import json
+import time
 import requests
 import urllib.parse as urlparse
 
+from panopuppet.pano.puppetdb import cassettes, replicas, resilience, tracing
+
 from panopuppet.pano.settings import PUPPETDB_HOST, PUPPETDB_VERIFY_SSL, PUPPETDB_CERTIFICATES, AVAILABLE_SOURCES, \
     PUPPETMASTER_CLIENTBUCKET_CERTIFICATES, PUPPETMASTER_CLIENTBUCKET_HOST, PUPPETMASTER_CLIENTBUCKET_SHOW, \
     PUPPETMASTER_CLIENTBUCKET_VERIFY_SSL, PUPPETMASTER_FILESERVER_CERTIFICATES, PUPPETMASTER_FILESERVER_HOST, \
@@ -85,7 +88,7 @@ def set_server(request, source):
             return False
     else:
         return False
-    request.session['PUPPETDB_HOST'] = source.get('PUPPETDB_HOST', None)
+    request.session['PUPPETDB_HOST'] = replicas.register(source.get('PUPPETDB_HOST', None))
     request.session['PUPPETDB_CERTIFICATES'] = tuple(source.get('PUPPETDB_CERTIFICATES', [None, None]))
     request.session['PUPPETDB_VERIFY_SSL'] = source.get('PUPPETDB_VERIFY_SSL', False)
     # Clientbucket Settings
@@ -100,10 +103,24 @@ def set_server(request, source):
     request.session['PUPPETMASTER_FILESERVER_CERTIFICATES'] = tuple(
         source.get('PUPPETMASTER_FILESERVER_CERTIFICATES', [None, None]))
     request.session['PUPPETMASTER_FILESERVER_VERIFY_SSL'] = source.get('PUPPETMASTER_FILESERVER_VERIFY_SSL', False)
-    request.session['PUPPET_RUN_INTERVAL'] = source.get('PUPPET_RUN_INTERVAL', False)
+    request.session['PUPPET_RUN_INTERVAL'] = source.get('PUPPET_RUN_INTERVAL', 30)
     request.session['PUPPETDB_VERS'] = ident_pdb_vers(request)
 
 
+def get_permission_filter(request):
+    """
+    The PuppetDB query limiting the nodes the user may see, as applied by mk_puppetdb_query.
+    :return: tuple(allowed, query) query is None when the user may see all nodes
+    """
+    if AUTH_METHOD == 'ldap' and ENABLE_PERMISSIONS:
+        permission_filter = request.session.get('permission_filter', False)
+        if permission_filter is None:
+            return False, None
+        elif permission_filter and isinstance(permission_filter, str):
+            return True, permission_filter
+    return True, None
+
+
 def ident_pdb_vers(request=None, source_url=None, source_verify=None, source_certs=None):
     if request:
         source_url, source_certs, source_verify = get_server(request)
@@ -170,18 +187,37 @@ def api_get(api_url=PUPPETDB_HOST,
     if params is None:
         return list(), list()
 
-    url = '{0}{1}'.format(api_url, path)
-    resp = methods[method](url,
-                           headers=headers,
-                           verify=verify,
-                           cert=cert)
+    def send(timeout):
+        def send_to(base_url):
+            return methods[method]('{0}{1}'.format(base_url, path),
+                                   headers=headers,
+                                   verify=verify,
+                                   cert=cert,
+                                   timeout=timeout)
+
+        # Picks one of the source's replicas if it has them.
+        return replicas.send_request(api_url, send_to)
+
+    started = time.perf_counter()
+    try:
+        if cassettes.replaying():
+            resp = cassettes.replay(api_url, method, path)
+        else:
+            # Only queries are retried, they do not change anything.
+            resp = resilience.call(api_url, send, retries=None if method == 'get' else 0)
+            if cassettes.recording():
+                cassettes.record(api_url, method, path, resp, time.perf_counter() - started)
+    except requests.RequestException as e:
+        tracing.record_call(path=urlparse.unquote(path), started=started, error=str(e))
+        raise
+    tracing.record_call(path=urlparse.unquote(path), started=started, status=resp.status_code)
+    try:
+        data = json.loads(resp.text)
+    except ValueError:
+        raise resilience.PuppetDBResponseError(resp.status_code, resp.text)
     if 'X-records' in resp.headers:
-        return json.loads(resp.text), resp.headers
-    else:
-        try:
-            return json.loads(resp.text)
-        except:
-            return []
+        return data, resp.headers
+    return data
 
 
 def mk_puppetdb_query(params, request=None):
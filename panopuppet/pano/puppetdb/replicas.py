@@ -0,0 +1,171 @@
+"""
+Routing of PuppetDB queries over a primary and its read replicas.
+
+A source's PUPPETDB_HOST can be a list of urls, the first one is the primary. The primary url is used
+as the PUPPETDB_HOST of the source everywhere else, api_get asks send_request to pick the endpoint.
+
+Each query goes to the endpoint with the lowest recent latency weighted by the number of queries it is
+answering at that moment, endpoints that did not answer yet count with the median latency of the others.
+Endpoints failing PUPPETDB_REPLICA_MAX_FAILURES times in a row are left out for PUPPETDB_REPLICA_EJECT_TIME
+seconds, after that they get another query. A query that fails with a connection error or a server error
+is sent to the next endpoint.
+"""
+
+import random
+import statistics
+import threading
+import time
+
+import requests
+
+from panopuppet.pano.settings import PUPPETDB_REPLICA_MAX_FAILURES, PUPPETDB_REPLICA_EJECT_TIME
+
+__author__ = 'etaklar'
+
+# Weight of the latest latency in the moving average.
+LATENCY_WEIGHT = 0.3
+
+_replica_sets = {}
+_replica_sets_lock = threading.Lock()
+
+
+def normalize_url(url):
+    if url[-1] != '/':
+        url = '{0}/'.format(url)
+    return url
+
+
+class Endpoint(object):
+    def __init__(self, url):
+        self.url = url
+        # Moving average of the response time in seconds, None until the first response.
+        self.latency = None
+        self.in_flight = 0
+        self.failures = 0
+        self.ejected_until = None
+
+    def available(self, now):
+        return self.ejected_until is None or self.ejected_until <= now
+
+    def score(self, default_latency):
+        """:param default_latency: Latency to assume when the endpoint did not answer yet"""
+        latency = default_latency if self.latency is None else self.latency
+        return latency * (self.in_flight + 1)
+
+    def state(self):
+        return {
+            'url': self.url,
+            'latency': self.latency,
+            'in_flight': self.in_flight,
+            'failures': self.failures,
+            'ejected': not self.available(time.time()),
+        }
+
+
+class ReplicaSet(object):
+    def __init__(self, urls, max_failures=PUPPETDB_REPLICA_MAX_FAILURES, eject_time=PUPPETDB_REPLICA_EJECT_TIME):
+        self.endpoints = [Endpoint(normalize_url(url)) for url in urls]
+        self.max_failures = max_failures
+        self.eject_time = eject_time
+        self.lock = threading.Lock()
+
+    def default_latency(self):
+        """:return: Median latency of the endpoints that answered, 1 when none did so only in flight queries count"""
+        latencies = [endpoint.latency for endpoint in self.endpoints if endpoint.latency is not None]
+        return statistics.median(latencies) if latencies else 1.0
+
+    def candidates(self, begin_first=False):
+        """
+        The endpoints in the order to try them: available endpoints by score, then the ejected ones
+        ordered by when they come back, so a query is still attempted when every endpoint is ejected.
+        :param begin_first: Count a query in flight on the first endpoint, at once so queries starting at the
+                            same time see each other
+        """
+        now = time.time()
+        with self.lock:
+            available = [endpoint for endpoint in self.endpoints if endpoint.available(now)]
+            ejected = [endpoint for endpoint in self.endpoints if not endpoint.available(now)]
+            # Shuffle first so endpoints with the same score share the queries.
+            random.shuffle(available)
+            default_latency = self.default_latency()
+            available.sort(key=lambda endpoint: endpoint.score(default_latency))
+            ejected.sort(key=lambda endpoint: endpoint.ejected_until)
+            candidates = available + ejected
+            if begin_first:
+                candidates[0].in_flight += 1
+        return candidates
+
+    def begin(self, endpoint):
+        with self.lock:
+            endpoint.in_flight += 1
+
+    def succeeded(self, endpoint, latency):
+        with self.lock:
+            endpoint.in_flight -= 1
+            endpoint.failures = 0
+            endpoint.ejected_until = None
+            if endpoint.latency is None:
+                endpoint.latency = latency
+            else:
+                endpoint.latency = LATENCY_WEIGHT * latency + (1 - LATENCY_WEIGHT) * endpoint.latency
+
+    def failed(self, endpoint):
+        with self.lock:
+            endpoint.in_flight -= 1
+            endpoint.failures += 1
+            if endpoint.failures >= self.max_failures:
+                endpoint.ejected_until = time.time() + self.eject_time
+
+    def state(self):
+        with self.lock:
+            return [endpoint.state() for endpoint in self.endpoints]
+
+
+def register(host):
+    """
+    :param host: PUPPETDB_HOST of a source, a url or a list of urls with the primary first
+    :return: The url identifying the source, the primary when a list was given
+    """
+    if not isinstance(host, (list, tuple)):
+        return host
+    primary = normalize_url(host[0])
+    with _replica_sets_lock:
+        if primary not in _replica_sets:
+            _replica_sets[primary] = ReplicaSet(host)
+    return primary
+
+
+def get_replica_set(api_url):
+    return _replica_sets.get(normalize_url(api_url))
+
+
+def send_request(api_url, send):
+    """
+    Send a query to the best endpoint of api_url's replica set, falling back to the others.
+    :param api_url: PUPPETDB_HOST of the source
+    :param send: function taking the base url to use and returning a requests response
+    :return: The response
+    """
+    replica_set = get_replica_set(api_url)
+    if replica_set is None:
+        return send(api_url)
+    candidates = replica_set.candidates(begin_first=True)
+    for i, endpoint in enumerate(candidates):
+        last = i == len(candidates) - 1
+        if i:
+            replica_set.begin(endpoint)
+        started = time.perf_counter()
+        try:
+            response = send(endpoint.url)
+        except requests.RequestException:
+            replica_set.failed(endpoint)
+            if last:
+                raise
+            continue
+        if response.status_code >= 500:
+            replica_set.failed(endpoint)
+            if not last:
+                continue
+        else:
+            replica_set.succeeded(endpoint, time.perf_counter() - started)
+        return response
@@ -0,0 +1,202 @@
+"""
+Timeouts, retries, a circuit breaker per source and request deadlines for the PuppetDB queries.
+
+Every query gets a connect and read timeout. Queries failing with a connection error, a timeout or a
+502/503/504 response are retried PUPPETDB_RETRIES times with exponential backoff and jitter. After
+PUPPETDB_BREAKER_FAILURES failed queries in a row the circuit breaker of the source opens and queries
+fail at once with PuppetDBUnavailable, after PUPPETDB_BREAKER_RESET seconds one query is let through
+to find out if PuppetDB is back.
+
+Queries wait for a free query slot of the source first, see admission.
+
+A deadline limits the total time spent on the PuppetDB queries of a request. It is stored thread
+locally like the trace, threads doing work for the request (see run_puppetdb_jobs) must attach the
+deadline of the calling thread. Read timeouts and retries are shortened to stay within the deadline.
+"""
+
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+
+from panopuppet.pano.puppetdb import admission
+from panopuppet.pano.settings import PUPPETDB_CONNECT_TIMEOUT, PUPPETDB_READ_TIMEOUT, PUPPETDB_RETRIES, \
+    PUPPETDB_RETRY_BACKOFF, PUPPETDB_BREAKER_FAILURES, PUPPETDB_BREAKER_RESET
+
+__author__ = 'etaklar'
+
+# Responses worth retrying, PuppetDB or a proxy in front of it is temporarily unable to answer.
+RETRY_STATUS = (502, 503, 504)
+
+_local = threading.local()
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+class PuppetDBUnavailable(requests.RequestException):
+    """The source's circuit breaker is open."""
+
+
+class DeadlineExceeded(requests.RequestException):
+    """The time available for the PuppetDB queries of the request is used up."""
+
+
+class PuppetDBResponseError(requests.RequestException):
+    """PuppetDB answered with something that is not JSON."""
+
+    def __init__(self, status_code, text):
+        super(PuppetDBResponseError, self).__init__(
+            'PuppetDB returned status %s and no JSON: %s' % (status_code, text[:200]))
+        self.status_code = status_code
+
+
+class CircuitBreaker(object):
+    def __init__(self, max_failures=PUPPETDB_BREAKER_FAILURES, reset_time=PUPPETDB_BREAKER_RESET):
+        self.max_failures = max_failures
+        self.reset_time = reset_time
+        self.failures = 0
+        self.opened = None
+        self.trial = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened is None:
+            return 'closed'
+        if time.time() - self.opened < self.reset_time:
+            return 'open'
+        return 'half-open'
+
+    def allow(self):
+        """True if a query may be sent, once the breaker is half open only a single trial query is allowed."""
+        with self.lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half-open' and not self.trial:
+                self.trial = True
+                return True
+            return False
+
+    def succeeded(self):
+        with self.lock:
+            self.failures = 0
+            self.opened = None
+            self.trial = False
+
+    def release(self):
+        """Give back the trial of a half open breaker without a result."""
+        with self.lock:
+            self.trial = False
+
+    def failed(self):
+        with self.lock:
+            self.failures += 1
+            if self.trial or self.failures >= self.max_failures:
+                self.opened = time.time()
+            self.trial = False
+
+
+def get_breaker(source_url):
+    with _breakers_lock:
+        breaker = _breakers.get(source_url)
+        if breaker is None:
+            breaker = _breakers[source_url] = CircuitBreaker()
+    return breaker
+
+
+def state():
+    """Circuit breaker state and failures in a row of every source queried so far."""
+    with _breakers_lock:
+        breakers = dict(_breakers)
+    return {source_url: {'state': breaker.state, 'failures': breaker.failures}
+            for source_url, breaker in breakers.items()}
+
+
+@contextmanager
+def deadline(seconds):
+    """Limit the PuppetDB queries made in the block to seconds in total, None for no limit."""
+    previous = current_deadline()
+    _local.deadline = None if seconds is None else time.time() + seconds
+    try:
+        yield
+    finally:
+        _local.deadline = previous
+
+
+def current_deadline():
+    return getattr(_local, 'deadline', None)
+
+
+def attach_deadline(until):
+    _local.deadline = until
+
+
+def remaining():
+    """Seconds left before the deadline, None without a deadline."""
+    until = current_deadline()
+    if until is None:
+        return None
+    return until - time.time()
+
+
+def timeouts():
+    """(connect, read) timeouts for requests, the read timeout ends at the deadline."""
+    left = remaining()
+    if left is not None and left <= 0:
+        raise DeadlineExceeded('The time for the PuppetDB queries of this request is used up.')
+    read_timeout = PUPPETDB_READ_TIMEOUT
+    if left is not None:
+        read_timeout = left if read_timeout is None else min(read_timeout, left)
+    return PUPPETDB_CONNECT_TIMEOUT, read_timeout
+
+
+def backoff(attempt):
+    """Seconds to wait before retry number attempt (starting at 0), doubled each time with +-50% jitter."""
+    return PUPPETDB_RETRY_BACKOFF * (2 ** attempt) * random.uniform(0.5, 1.5)
+
+
+def call(source_url, send, retries=None):
+    """
+    Send a query with retries, guarded by the source's circuit breaker.
+    :param source_url: PUPPETDB_HOST of the source
+    :param send: function sending the query with the given timeouts and returning a requests response
+    :param retries: number of retries, PUPPETDB_RETRIES when None
+    :return: The response, which can still be a 502, 503 or 504 response when the retries ran out
+    """
+    if retries is None:
+        retries = PUPPETDB_RETRIES
+    breaker = get_breaker(source_url)
+    if not breaker.allow():
+        raise PuppetDBUnavailable('PuppetDB at %s failed repeatedly, not querying it for now.' % source_url)
+    attempt = 0
+    while True:
+        error = None
+        response = None
+        try:
+            # Waiting for a query slot uses up part of the deadline.
+            with admission.admit(source_url, remaining()):
+                response = send(timeouts())
+        except (DeadlineExceeded, admission.AdmissionTimeout):
+            # Not the fault of PuppetDB, a trial query is still to be done.
+            breaker.release()
+            raise
+        except (requests.ConnectionError, requests.Timeout) as e:
+            error = e
+        except Exception:
+            breaker.release()
+            raise
+        if error is None and response.status_code not in RETRY_STATUS:
+            breaker.succeeded()
+            return response
+        delay = backoff(attempt)
+        left = remaining()
+        if attempt >= retries or (left is not None and left <= delay):
+            breaker.failed()
+            if error is not None:
+                raise error
+            return response
+        time.sleep(delay)
+        attempt += 1
@@ -0,0 +1,56 @@
+"""
+Keeps a timeline of the PuppetDB requests made while serving a request.
+The trace is stored thread locally, threads doing work for the request
+(see run_puppetdb_jobs) must attach the trace of the calling thread.
+"""
+
+import threading
+import time
+
+__author__ = 'etaklar'
+
+_local = threading.local()
+
+
+def start_trace():
+    trace = {
+        'start': time.perf_counter(),
+        'calls': [],
+    }
+    _local.trace = trace
+    return trace
+
+
+def stop_trace():
+    trace = current_trace()
+    _local.trace = None
+    return trace
+
+
+def current_trace():
+    return getattr(_local, 'trace', None)
+
+
+def attach_trace(trace):
+    _local.trace = trace
+
+
+def record_call(path, started, status=None, error=None):
+    """
+    :param path: Path including the query string that was requested
+    :param started: time.perf_counter() value from when the request was sent
+    :param status: HTTP status code if a response was received
+    :param error: Error message if the request failed
+    """
+    trace = current_trace()
+    if trace is None:
+        return
+    finished = time.perf_counter()
+    trace['calls'].append({
+        'offset': started - trace['start'],
+        'duration': finished - started,
+        'path': path,
+        'thread': threading.current_thread().name,
+        'status': status,
+        'error': error,
+    })
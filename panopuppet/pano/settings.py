@@ -110,6 +110,112 @@
 # Set cache time to 0 to disable caching
 CACHE_TIME = cfg.get('CACHE_TIME', 30)
 
+# Allow staff users to profile a page by adding ?_profile=1 to the url
+ENABLE_PROFILING = cfg.get('ENABLE_PROFILING', True)
+
+# Seconds before the certname index used by the node search is refreshed in the background,
+# and seconds between full reloads of the index.
+CERTNAME_INDEX_REFRESH = cfg.get('CERTNAME_INDEX_REFRESH', 60)
+CERTNAME_INDEX_FULL_REFRESH = cfg.get('CERTNAME_INDEX_FULL_REFRESH', 3600)
+
+# Keep a mirror of the node list and latest event counts in memory for the dashboard and node list,
+# synchronized with PuppetDB every FLEET_MIRROR_REFRESH seconds and fully reloaded every
+# FLEET_MIRROR_FULL_REFRESH seconds. Set FLEET_MIRROR_SQLITE_DIR to keep the mirror across restarts.
+ENABLE_FLEET_MIRROR = cfg.get('ENABLE_FLEET_MIRROR', False)
+FLEET_MIRROR_REFRESH = cfg.get('FLEET_MIRROR_REFRESH', 30)
+FLEET_MIRROR_FULL_REFRESH = cfg.get('FLEET_MIRROR_FULL_REFRESH', 3600)
+FLEET_MIRROR_SQLITE_DIR = cfg.get('FLEET_MIRROR_SQLITE_DIR', None)
+
+# Push dashboard updates to the dashboard and radiator pages, every open page holds a server thread
+DASHBOARD_PUSH = cfg.get('DASHBOARD_PUSH', False)
+
+# Seconds between the dashboard updates pushed to the dashboard and radiator pages
+DASHBOARD_PUSH_INTERVAL = cfg.get('DASHBOARD_PUSH_INTERVAL', 30)
+
+# Seconds the dashboard of all sources waits for the sources to answer
+FEDERATED_DASHBOARD_TIMEOUT = cfg.get('FEDERATED_DASHBOARD_TIMEOUT', 10)
+
+# A PuppetDB host that fails this many times in a row is not queried for PUPPETDB_REPLICA_EJECT_TIME seconds
+# when the source has replicas
+PUPPETDB_REPLICA_MAX_FAILURES = cfg.get('PUPPETDB_REPLICA_MAX_FAILURES', 3)
+PUPPETDB_REPLICA_EJECT_TIME = cfg.get('PUPPETDB_REPLICA_EJECT_TIME', 30)
+
+# Seconds to wait for a connection to and an answer from PuppetDB
+PUPPETDB_CONNECT_TIMEOUT = cfg.get('PUPPETDB_CONNECT_TIMEOUT', 5)
+PUPPETDB_READ_TIMEOUT = cfg.get('PUPPETDB_READ_TIMEOUT', 60)
+# Retries of queries failing with a connection error, a timeout or a 502, 503 or 504 response,
+# waiting PUPPETDB_RETRY_BACKOFF seconds before the first retry and doubling it each time
+PUPPETDB_RETRIES = cfg.get('PUPPETDB_RETRIES', 2)
+PUPPETDB_RETRY_BACKOFF = cfg.get('PUPPETDB_RETRY_BACKOFF', 0.5)
+# After this many failed queries in a row a source is not queried for PUPPETDB_BREAKER_RESET seconds
+PUPPETDB_BREAKER_FAILURES = cfg.get('PUPPETDB_BREAKER_FAILURES', 5)
+PUPPETDB_BREAKER_RESET = cfg.get('PUPPETDB_BREAKER_RESET', 30)
+# Seconds a page or API request may spend on PuppetDB queries in total, None for no limit
+PUPPETDB_REQUEST_DEADLINE = cfg.get('PUPPETDB_REQUEST_DEADLINE', 90)
+# Maximum number of queries this process runs against a PuppetDB source at the same time, 0 for no limit
+PUPPETDB_MAX_IN_FLIGHT = cfg.get('PUPPETDB_MAX_IN_FLIGHT', 40)
+
+# Saved catalogues of a node are stored as the changes against the previous one, every
+# CATALOG_KEYFRAME_INTERVAL saves the complete catalogue is stored again
+CATALOG_KEYFRAME_INTERVAL = cfg.get('CATALOG_KEYFRAME_INTERVAL', 10)
+
+# Catalogues fetched at a time when comparing nodes to a baseline catalogue, and the number of processes
+# fingerprinting and diffing them, None for one per cpu and 0 to use no separate processes
+CATALOG_DRIFT_BATCH_SIZE = cfg.get('CATALOG_DRIFT_BATCH_SIZE', 20)
+CATALOG_DRIFT_PROCESSES = cfg.get('CATALOG_DRIFT_PROCESSES', None)
+
+# Save the catalogue of every node when it changes, see the capture_catalogues command. Only the nodes
+# matching CATALOG_CAPTURE_QUERY are watched, all active nodes when it is not set
+CATALOG_CAPTURE_QUERY = cfg.get('CATALOG_CAPTURE_QUERY', None)
+CATALOG_CAPTURE_INTERVAL = cfg.get('CATALOG_CAPTURE_INTERVAL', 300)
+CATALOG_CAPTURE_FULL_INTERVAL = cfg.get('CATALOG_CAPTURE_FULL_INTERVAL', 86400)
+# Number of catalogues fetched at the same time
+CATALOG_CAPTURE_THREADS = cfg.get('CATALOG_CAPTURE_THREADS', 4)
+# The newest CATALOG_RETENTION_KEEP saved catalogues of a node are kept, of the older ones the newest of
+# each day for CATALOG_RETENTION_DAYS days
+CATALOG_RETENTION_KEEP = cfg.get('CATALOG_RETENTION_KEEP', 30)
+CATALOG_RETENTION_DAYS = cfg.get('CATALOG_RETENTION_DAYS', 90)
+
+# Number of catalogue graphs kept in memory for the catalogue graph API
+CATALOG_GRAPH_CACHE_SIZE = cfg.get('CATALOG_GRAPH_CACHE_SIZE', 20)
+
+# Number of nodes per PuppetDB request for the node list of the resource search API
+RESOURCE_SEARCH_PAGE_SIZE = cfg.get('RESOURCE_SEARCH_PAGE_SIZE', 5000)
+
+# Number of pages of the resource search node list fetched in parallel
+RESOURCE_SEARCH_THREADS = cfg.get('RESOURCE_SEARCH_THREADS', 4)
+
+# Number of resource searches whose results are kept in memory
+RESOURCE_SEARCH_CACHE_SIZE = cfg.get('RESOURCE_SEARCH_CACHE_SIZE', 50)
+
+# Directory and size in megabytes of the cache of filebucket files, 0 disables the cache
+# The directory defaults to panopuppet-filebucket in the temporary directory of the system
+FILEBUCKET_CACHE_DIR = cfg.get('FILEBUCKET_CACHE_DIR', None)
+FILEBUCKET_CACHE_SIZE = cfg.get('FILEBUCKET_CACHE_SIZE', 256)
+
+# Seconds a file fetched from the Puppet fileserver is reused
+FILESERVER_CACHE_TTL = cfg.get('FILESERVER_CACHE_TTL', 300)
+
+# Files larger than FILEBUCKET_DIFF_MAX_SIZE megabytes or with more than FILEBUCKET_DIFF_MAX_LINES lines
+# are not compared on the filebucket page
+FILEBUCKET_DIFF_MAX_SIZE = cfg.get('FILEBUCKET_DIFF_MAX_SIZE', 10)
+FILEBUCKET_DIFF_MAX_LINES = cfg.get('FILEBUCKET_DIFF_MAX_LINES', 200000)
+
+# Record PuppetDB responses to, or replay them from, a cassette directory
+# Mode can be off, record or replay
+PUPPETDB_CASSETTE_MODE = cfg.get('PUPPETDB_CASSETTE_MODE', 'off')
+PUPPETDB_CASSETTE_DIR = cfg.get('PUPPETDB_CASSETTE_DIR', 'cassettes')
+# Multiplier for the recorded latency when replaying, 0 replays without delay
+PUPPETDB_CASSETTE_LATENCY = cfg.get('PUPPETDB_CASSETTE_LATENCY', 1.0)
+
+from panopuppet.pano.puppetdb import replicas
+
+# A list of PuppetDB hosts is a primary followed by read replicas, the source is known by the primary.
+PUPPETDB_HOST = replicas.register(PUPPETDB_HOST)
+if isinstance(AVAILABLE_SOURCES, dict):
+    for source_data in AVAILABLE_SOURCES.values():
+        replicas.register(source_data.get('PUPPETDB_HOST'))
+
 from panopuppet.pano.puppetdb.puppetdb import ident_pdb_vers
 
 PUPPETDB_VERS = ident_pdb_vers(source_url=PUPPETDB_HOST,
@@ -8,12 +8,46 @@ function format(t) {
     }), e += "</table>"
 }
 
+function get_relations(certname, hash, resource, target) {
+    // Only the resources next to this one are fetched, the graph of the catalogue stays on the server.
+    var id = resource.type + '[' + resource.title + ']';
+    var url = '/pano/api/catalogue/graph/' + certname + '/?depth=1&resource=' + encodeURIComponent(id);
+    if (hash && hash != 'false') {
+        url += '&hash=' + hash;
+    }
+    $.get(url, function (json) {
+            var groups = {'Contained in': [], 'Depends on': [], 'Required by': [], 'Contains': []};
+            json['edges'].forEach(function (edge) {
+                if (edge.target == id) {
+                    groups[edge.relationship == 'contains' ? 'Contained in' : 'Depends on'].push(edge.source + ' (' + edge.relationship + ')');
+                }
+                else if (edge.source == id) {
+                    groups[edge.relationship == 'contains' ? 'Contains' : 'Required by'].push(edge.target + ' (' + edge.relationship + ')');
+                }
+            });
+            var e = '<table>';
+            $.each(groups, function (name, resources) {
+                if (resources.length > 0) {
+                    e += '<tr><th>' + name + ': </th><td>' + resources.join('<br>') + '</td></tr>';
+                }
+            });
+            if (json['truncated']) {
+                e += '<tr><th></th><td>More relationships not shown.</td></tr>';
+            }
+            $(target).html(e + '</table>');
+        })
+        .error(function () {
+            $(target).html('Could not load the relationships.');
+        });
+}
+
 function update_tables() {
     var t = $("#node-1"), e = $("#node-2"), a = $(t).val(), r = $(t).attr("certname"), o = $(e).val(), n = $(e).attr("certname");
     a == r && get_catalogue(a, "with"), o == n && get_catalogue(o, "against")
 }
 
 function get_catalogue(t, e) {
+    var certname = t;
     var a = "#compare-" + e + "-table";
     var r = $("#targets a.active").attr("id");
     if ($.fn.dataTable.isDataTable(a)) {
@@ -50,9 +84,11 @@ function get_catalogue(t, e) {
             data_url = '/pano/api/catalogue/saved/fetch/' + t + '/' + certname_against_hash;
         }
     }
+    var catalogue_hash = e == 'with' ? certname_from_hash : certname_against_hash;
     if ('edges' == r)$(a).DataTable({
         ajax: data_url + '?show=edges',
         "autoWidth": false,
+        deferRender: true,
         columnDefs: [{title: "Source Type", targets: 0}, {title: "Source Title", targets: 1}, {
             title: "Relationship",
             targets: 2
@@ -70,7 +106,15 @@ function get_catalogue(t, e) {
         });
         $(a + " tbody").on("click", "tr", function () {
             var t = $(this).closest("tr"), e = n.row(t);
-            e.child.isShown() ? (e.child.hide(), t.removeClass("shown")) : "undefined" != typeof e.data() && (e.child(format(e.data())).show(), t.addClass("shown"))
+            if (e.child.isShown()) {
+                e.child.hide();
+                t.removeClass("shown");
+            }
+            else if ("undefined" != typeof e.data()) {
+                e.child(format(e.data()) + '<div class="catalog-relations">Loading relationships...</div>').show();
+                t.addClass("shown");
+                get_relations(certname, catalogue_hash, e.data(), t.next().find(".catalog-relations"));
+            }
         })
     }
 }
@@ -222,8 +266,67 @@ function get_compare_data(node_1, node1_hash, node_2, node2_hash, catalog_type)
                 });
             }
 
+            function escapeGen(text) {
+                // Catalogue content is text, never markup.
+                return $('<div>').text(text).html();
+            }
+
+            function valueGen(value) {
+                if (value === undefined || value === null) {
+                    return String(value);
+                }
+                var text = type(value) == 'String' ? value : JSON.stringify(value);
+                return escapeGen(text).replace(/(?:\r\n|\r|\n)/g, '<br />');
+            }
+
+            function changeGen(change) {
+                // Only the fields and parameters that changed.
+                var tab = repeat('&nbsp;&nbsp;&nbsp;', 1);
+                var against = change['against'];
+                var parameters = change['parameters'];
+                var tBuffer = '<samp>';
+                tBuffer += '<strong>Type: </strong>' + escapeGen(against.type);
+                tBuffer += '<br>';
+                tBuffer += '<strong>Title: </strong>' + escapeGen(against.title);
+                tBuffer += '<br>';
+                change['fields'].forEach(function (field) {
+                    tBuffer += '<strong>' + field + ': </strong>' + valueGen(change['from'][field]) +
+                        ' &rarr; ' + valueGen(against[field]);
+                    tBuffer += '<br>';
+                });
+                if (Object.keys(parameters['added']).length + Object.keys(parameters['removed']).length +
+                    Object.keys(parameters['changed']).length > 0) {
+                    tBuffer += '<strong>Parameters:</strong>';
+                    tBuffer += '<br>';
+                }
+                Object.keys(parameters['changed']).sort().forEach(function (name) {
+                    tBuffer += tab + '<strong>' + escapeGen(name) + ': </strong>' +
+                        valueGen(parameters['changed'][name]['from']) + ' &rarr; ' +
+                        valueGen(parameters['changed'][name]['against']);
+                    tBuffer += '<br>';
+                });
+                Object.keys(parameters['added']).sort().forEach(function (name) {
+                    tBuffer += tab + '<strong>+ ' + escapeGen(name) + ': </strong>' +
+                        valueGen(parameters['added'][name]);
+                    tBuffer += '<br>';
+                });
+                Object.keys(parameters['removed']).sort().forEach(function (name) {
+                    tBuffer += tab + '<strong>- ' + escapeGen(name) + ': </strong>' +
+                        valueGen(parameters['removed'][name]);
+                    tBuffer += '<br>';
+                });
+                tBuffer += '</samp>';
+                return tBuffer
+            }
+
             if (changed) {
                 changed.forEach(function (change) {
+                    if (change['parameters']) {
+                        changed_data += '<div class="bs-callout bs-callout-info">';
+                        changed_data += changeGen(change);
+                        changed_data += '</div>';
+                        return;
+                    }
                     // From data
                     changed_data += '<div class="row">';
                     changed_data += '<div class="col-md-12">';
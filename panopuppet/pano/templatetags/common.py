@@ -1,6 +1,7 @@
 import json
 
 from django import template
+from django.utils.html import escape
 from urllib import parse
 
 __author__ = 'etaklar'
@@ -151,21 +152,20 @@ def render(self, context):
 
 @register.filter
 def colorizediff(content):
-    color_diff = []
-
-    for line in content:
-        if line.startswith(' '):
-            # Nothing has changed
-            color_diff.append('<br>' + line.rstrip('\n'))
-        elif line.startswith('-'):
-            # Line has been removed
-            color_diff.append('<br>' + '<span style="color:red">' + line.rstrip('\n') + '</span>')
-        elif line.startswith('+'):
-            # Line has been added
-            color_diff.append('<br>' + '<span style="color:green">' + line.rstrip('\n') + '</span>')
-        else:
-            color_diff.append('<br>' + line.rstrip('\n'))
-    return ''.join(color_diff)
+    return ''.join(colorize_diff_line(line) for line in content)
+
+
+def colorize_diff_line(line):
+    """:return: html of a line of a unified diff, removed lines in red and added lines in green"""
+    line = escape(line.rstrip('\n'))
+    if line.startswith('-'):
+        # Line has been removed
+        return '<br><span style="color:red">' + line + '</span>'
+    elif line.startswith('+'):
+        # Line has been added
+        return '<br><span style="color:green">' + line + '</span>'
+    # Nothing has changed
+    return '<br>' + line
 
 
 @register.filter
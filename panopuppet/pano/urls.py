@@ -2,7 +2,7 @@
 
 from panopuppet.pano.views.analytics import analytics
 from panopuppet.pano.views.catalogue import catalog
-from panopuppet.pano.views.dashboard import dashboard
+from panopuppet.pano.views.dashboard import dashboard, dashboard_all
 from panopuppet.pano.views.event_analytics import event_analytics
 from panopuppet.pano.views.filebucket import filebucket
 from panopuppet.pano.views.logout import logout_view
@@ -14,14 +14,18 @@
 from panopuppet.pano.views.reports import reports
 from panopuppet.pano.views.splash import splash
 # API Imports
-from panopuppet.pano.views.api.node_data import nodes_json, search_nodes_json
+from panopuppet.pano.views.api.node_data import nodes_json, search_nodes_json, nodes_changes_json
 from panopuppet.pano.views.api.fact_data import facts_json
-from panopuppet.pano.views.api.dashboard_data import dashboard_status_json, dashboard_nodes_json, dashboard_json
+from panopuppet.pano.views.api.dashboard_data import dashboard_status_json, dashboard_nodes_json, dashboard_json, \
+    dashboard_events, dashboard_all_json
 from panopuppet.pano.views.api.report_data import reports_json, reports_search_json
 from panopuppet.pano.views.api.catalogue_data import catalogue_json, catalogue_compare_json, catalogue_history_list, \
-    catalogue_history_fetch
+    catalogue_history_fetch, catalogue_drift_json, catalogue_graph_json
 from panopuppet.pano.views.api.report_agent_log import report_log_json
 from panopuppet.pano.views.api.query_filters import filter_json
+from panopuppet.pano.views.api.export_data import nodes_ndjson
+from panopuppet.pano.views.api.puppetdb_data import puppetdb_status_json
+from panopuppet.pano.views.api.resource_data import resources_search_json, resources_nodes_ndjson
 
 __author__ = 'etaklar'
 
@@ -30,6 +34,7 @@
                        url(r'^login/$', splash, name='login'),
                        url(r'^logout/$', logout_view, name='logout'),
                        url(r'^dashboard/$', dashboard, name='dashboard'),
+                       url(r'^dashboard/all/$', dashboard_all, name='dashboard_all'),
                        url(r'^filebucket/$', filebucket, name='filebucket'),
                        url(r'^nodes/$', nodes, name='nodes'),
                        url(r'^reports/(?P<certname>[\w\.-]+)/$', reports, name='reports'),
@@ -44,6 +49,7 @@
                        # API URLS
                        url(r'^api/nodes/$', nodes_json, name='api_nodes'),
                        url(r'^api/nodes/search/$', search_nodes_json, name='api_search_nodes'),
+                       url(r'^api/nodes/changes$', nodes_changes_json, name='api_nodes_changes'),
                        url(r'^api/facts/$', facts_json, name='api_facts'),
                        url(r'^api/filters/$', filter_json, name='api_filter'),
                        url(r'^api/reports/(?P<certname>[\w\.-]+)/$', reports_json, name='api_reports'),
@@ -57,6 +63,9 @@
                        url(r'^api/catalogue/compare/(?P<certname1>[\w\.-]+)/(?P<certname2>[\w\.-]+)/$',
                            catalogue_compare_json,
                            name='api_compare_catalogues'),
+                       url(r'^api/catalogue/drift/$', catalogue_drift_json, name='api_catalogue_drift'),
+                       url(r'^api/catalogue/graph/(?P<certname>[\w\.-]+)/$', catalogue_graph_json,
+                           name='api_catalogue_graph'),
                        url(r'^api/report/search/$', reports_search_json, name='api_search_reports'),
                        url(r'^api/reports/(?P<report_hash>[\w]+)/agent_log$', report_log_json, name='api_report_logs'),
                        # url(r'^api/reports/(?P<report_hash>[a-z0-9]+)/metrics$', report_metrics_json, name='api_report_metrics'),
@@ -64,4 +73,10 @@
                        url(r'^api/dashboard/status$', dashboard_status_json, name='api_dashboard_status'),
                        url(r'^api/status$', dashboard_status_json, name='api_dashboard_status'),
                        url(r'^api/dashboard/nodes/$', dashboard_nodes_json, name='api_dashboard_nodes'),
+                       url(r'^api/dashboard/all/$', dashboard_all_json, name='api_dashboard_all'),
+                       url(r'^api/dashboard/events$', dashboard_events, name='api_dashboard_events'),
+                       url(r'^api/export/nodes\.ndjson$', nodes_ndjson, name='api_export_nodes'),
+                       url(r'^api/puppetdb/status$', puppetdb_status_json, name='api_puppetdb_status'),
+                       url(r'^api/resources/search/$', resources_search_json, name='api_resources_search'),
+                       url(r'^api/resources/nodes\.ndjson$', resources_nodes_ndjson, name='api_resources_nodes'),
                        )
@@ -6,13 +6,20 @@
 from django.template import defaultfilters as filters
 from django.utils.timezone import localtime
 
-from panopuppet.pano.methods.dictfuncs import DictDiffer
+from panopuppet.pano.methods.catalogdrift import catalogue_drift
+from panopuppet.pano.methods.cataloggraph import ORDERING, RELATIONSHIPS, cached_graph, get_graph
+from panopuppet.pano.methods.catalogstore import capture_catalogue, diff_saved, load_catalogue, load_section
+from panopuppet.pano.methods.catalogdiff import SECTION_KEYS, describe_change, diff_items
+from panopuppet.pano.methods.nodeexport import export_certnames
 from panopuppet.pano.models import SavedCatalogs
 from panopuppet.pano.puppetdb import puppetdb
-from panopuppet.pano.puppetdb.puppetdb import get_server
+from panopuppet.pano.puppetdb.puppetdb import get_server, set_server
 
 __author__ = 'etaklar'
 
+# Maximum number of resources returned by the catalogue graph API.
+GRAPH_RESOURCE_LIMIT = 500
+
 
 @login_required
 def catalogue_json(request, certname=None):
@@ -60,46 +67,24 @@ def catalogue_json(request, certname=None):
 
         report_hash = latest_report[0]['hash']
         catalogue_hash = catalogue['hash']
-        catalogue_timestamp = catalogue['producer_timestamp']
-
-        try:
-            saved_catalogue = SavedCatalogs.objects.get(hostname=certname, catalogue_id=catalogue_hash)
-
-            if saved_catalogue.linked_report != report_hash:
-                # Grab the linked report from the result set.
-                old_linked_report = saved_catalogue.linked_report
-
-                # Update the data.
-                saved_catalogue.linked_report = report_hash
-                saved_catalogue.timestamp = catalogue_timestamp
-
-                # Save the new data.
-                saved_catalogue.save()
-
-                data['success'] = 'Catalogue hash updated.'
-                data['certname'] = certname
-                data['old_linked_report'] = old_linked_report
-                data['new_linked_report'] = report_hash
-                return HttpResponse(json.dumps(data, indent=2), content_type='application/json')
-            else:
-                data['error'] = 'Catalogue hash already exists.'
-                data['certname'] = certname
-                data['catalogue_hash'] = catalogue_hash
-                data['linked_report'] = saved_catalogue.linked_report
-                return HttpResponseBadRequest(json.dumps(data, indent=2), content_type='application/json')
 
-        except SavedCatalogs.DoesNotExist:
-            # since we couldnt find it in the db its safe to asusme that we can create it!
-            SavedCatalogs.objects.create(hostname=certname,
-                                         catalogue_id=catalogue_hash,
-                                         linked_report=report_hash,
-                                         timestamp=catalogue_timestamp,
-                                         catalogue=json.dumps(catalogue))
+        saved_catalogue, old_linked_report = capture_catalogue(certname, catalogue, report_hash)
+        data['certname'] = certname
+        if old_linked_report is None:
             data['success'] = 'Saved catalogue.'
-            data['certname'] = certname
             data['catalogue_hash'] = catalogue_hash
             data['linked_report'] = report_hash
             return HttpResponse(json.dumps(data, indent=2), content_type='application/json')
+        elif old_linked_report != report_hash:
+            data['success'] = 'Catalogue hash updated.'
+            data['old_linked_report'] = old_linked_report
+            data['new_linked_report'] = report_hash
+            return HttpResponse(json.dumps(data, indent=2), content_type='application/json')
+        else:
+            data['error'] = 'Catalogue hash already exists.'
+            data['catalogue_hash'] = catalogue_hash
+            data['linked_report'] = old_linked_report
+            return HttpResponseBadRequest(json.dumps(data, indent=2), content_type='application/json')
 
     if show == 'edges':
         data['data'] = catalogue['edges']['data']
@@ -121,10 +106,23 @@ def catalogue_compare_json(request, certname1=None, certname2=None):
 
     cata_params = dict()
 
+    if certname1_hash and certname2_hash and certname1 == certname2:
+        # Two saved catalogues of a node, the stored changes between them are the diff.
+        saved1 = SavedCatalogs.objects.filter(hostname=certname1, catalogue_id=certname1_hash).first()
+        saved2 = SavedCatalogs.objects.filter(hostname=certname2, catalogue_id=certname2_hash).first()
+        diff = saved1 and saved2 and diff_saved(saved1, saved2, show)
+        if diff:
+            output = {
+                'added_entries': diff['added'],
+                'deleted_entries': diff['removed'],
+                'changed_entries': [describe_change(old, new) for old, new in diff['changed']],
+            }
+            return HttpResponse(json.dumps(output, indent=2), content_type="application/json")
+
     if certname1_hash:
         try:
             certname1_result = SavedCatalogs.objects.get(hostname=certname1, catalogue_id=certname1_hash)
-            certname1_data = json.loads(certname1_result.catalogue)[show]['data']
+            certname1_data = load_section(certname1_result, show)
         except SavedCatalogs.DoesNotExist:
             data['error'] = 'Catalogue hash not found in DB.'
             data['hash_not_found'] = certname1_hash
@@ -141,7 +139,7 @@ def catalogue_compare_json(request, certname1=None, certname2=None):
     if certname2_hash:
         try:
             certname2_result = SavedCatalogs.objects.get(hostname=certname2, catalogue_id=certname2_hash)
-            certname2_data = json.loads(certname2_result.catalogue)[show]['data']
+            certname2_data = load_section(certname2_result, show)
         except SavedCatalogs.DoesNotExist:
             data['error'] = 'Catalogue hash not found in DB.'
             data['hash_not_found'] = certname2_hash
@@ -156,89 +154,144 @@ def catalogue_compare_json(request, certname1=None, certname2=None):
         )
         certname2_data = certname2_result[show]['data']
 
-    node_for = dict()
-    node_agn = dict()
-
-    if show == "edges":
-        for edge in certname1_data:
-            # remove the certname tag.
-            try:
-                edge.pop('certname')
-            except:
-                pass
-            source_type = edge['source_type']
-            source_title = edge['source_title']
-            relationship = edge['relationship']
-            target_type = edge['target_type']
-            target_title = edge['target_title']
-            node_for['%s-%s-%s-%s-%s' % (source_type, source_title, relationship, target_type, target_title)] = edge
-
-        for edge in certname2_data:
-            # remove the certname tag.
-            try:
-                edge.pop('certname')
-            except:
-                pass
-            source_type = edge['source_type']
-            source_title = edge['source_title']
-            relationship = edge['relationship']
-            target_type = edge['target_type']
-            target_title = edge['target_title']
-            node_agn['%s-%s-%s-%s-%s' % (source_type, source_title, relationship, target_type, target_title)] = edge
-
-    elif show == "resources":
-        for resource in certname1_data:
-            # remove the certname tag.
-            try:
-                resource.pop('certname')
-            except:
-                pass
-            resource_title = resource['title']
-            node_for[resource_title] = resource
-
-        for resource in certname2_data:
-            try:
-                # remove the certname tag.
-                resource.pop('certname')
-            except:
-                pass
-            resource_title = resource['title']
-            node_agn[resource_title] = resource
-
-    diff = DictDiffer(node_agn, node_for)
-
-    new_entries = list()
-    rem_entries = list()
-    cha_entries = list()
-
-    # List of new entries
-    for new_entry in diff.added():
-        new_entries.append(node_agn[new_entry])
-
-    for rem_entry in diff.removed():
-        rem_entries.append(node_for[rem_entry])
-
-    for cha_entry in diff.changed():
-        for_entry = node_for[cha_entry]
-        agn_entry = node_agn[cha_entry]
-        cha_entries.append({
-            'from': for_entry,
-            'against': agn_entry
-        })
-
-    output = {
-        'added_entries': new_entries,
-        'deleted_entries': rem_entries,
-        'changed_entries': cha_entries
-    }
+    if show in SECTION_KEYS:
+        output = diff_items(certname1_data, certname2_data, show)
+    else:
+        output = {'added_entries': [], 'deleted_entries': [], 'changed_entries': []}
 
     return HttpResponse(json.dumps(output, indent=2), content_type="application/json")
 
 
+@login_required
+def catalogue_drift_json(request):
+    """
+    Compares the catalogues of the nodes matching a query to the catalogue of a baseline node, or a saved
+    catalogue of it, and groups the nodes with identical catalogues.
+    """
+    data = dict()
+    if 'source' in request.GET:
+        set_server(request, request.GET.get('source'))
+    baseline = request.GET.get('baseline')
+    baseline_hash = request.GET.get('baseline_hash')
+    if not baseline:
+        data['error'] = 'Must specify baseline certname.'
+        return HttpResponseBadRequest(json.dumps(data, indent=2), content_type="application/json")
+    source_url, source_certs, source_verify = get_server(request)
+
+    if baseline_hash:
+        saved = SavedCatalogs.objects.filter(hostname=baseline, catalogue_id=baseline_hash).first()
+        if saved is None:
+            data['error'] = 'Catalogue hash not found in DB.'
+            data['hash_not_found'] = baseline_hash
+            data['certname'] = baseline
+            return HttpResponseBadRequest(json.dumps(data, indent=2), content_type="application/json")
+        baseline_sections = dict((section, load_section(saved, section)) for section in SECTION_KEYS)
+    else:
+        catalogue = puppetdb.api_get(
+            path='/catalogs/%s' % baseline,
+            api_url=source_url,
+            verify=source_verify,
+            cert=source_certs,
+            api_version='v4',
+            params=puppetdb.mk_puppetdb_query({}, request),
+        )
+        if 'error' in catalogue:
+            data['error'] = catalogue['error']
+            data['certname'] = baseline
+            return HttpResponseBadRequest(json.dumps(data, indent=2), content_type="application/json")
+        baseline_hash = catalogue['hash']
+        baseline_sections = dict((section, catalogue[section]['data']) for section in SECTION_KEYS)
+
+    certnames = export_certnames(request, request.GET.get('query') or None)
+    data = catalogue_drift(request, baseline_sections, certnames)
+    data['baseline'] = {'certname': baseline, 'catalogue_hash': baseline_hash,
+                        'signature': data.pop('baseline_signature')}
+    return HttpResponse(json.dumps(data, indent=2), content_type="application/json")
+
+
+@login_required
+def catalogue_graph_json(request, certname=None):
+    """
+    Dependencies, dependents, cycles or the neighbourhood of a resource in the graph of a node's catalogue,
+    so the browser only receives the part of the graph it shows.
+    """
+    data = dict()
+    source_url, source_certs, source_verify = get_server(request)
+    catalogue_hash = request.GET.get('hash')
+    resource = request.GET.get('resource')
+    query = request.GET.get('query', 'neighbourhood')
+    if query not in ('neighbourhood', 'dependencies', 'dependents', 'cycles'):
+        data['error'] = 'query must be neighbourhood, dependencies, dependents or cycles.'
+        return HttpResponseBadRequest(json.dumps(data, indent=2), content_type="application/json")
+    if request.GET.get('relationships'):
+        relationships = tuple(request.GET.get('relationships').split(','))
+    else:
+        relationships = RELATIONSHIPS if query == 'neighbourhood' else ORDERING
+    try:
+        depth = int(request.GET['depth']) if request.GET.get('depth') else None
+        limit = min(int(request.GET.get('limit', GRAPH_RESOURCE_LIMIT)), GRAPH_RESOURCE_LIMIT)
+    except ValueError:
+        data['error'] = 'depth and limit must be numbers.'
+        return HttpResponseBadRequest(json.dumps(data, indent=2), content_type="application/json")
+
+    if catalogue_hash:
+        saved = SavedCatalogs.objects.filter(hostname=certname, catalogue_id=catalogue_hash).first()
+        if saved is None:
+            data['error'] = 'Catalogue hash not found in DB.'
+            data['hash_not_found'] = catalogue_hash
+            data['certname'] = certname
+            return HttpResponseBadRequest(json.dumps(data, indent=2), content_type="application/json")
+        graph = get_graph(catalogue_hash, lambda: load_section(saved, 'edges'))
+    else:
+        def api_get(path, params):
+            return puppetdb.api_get(
+                path=path,
+                api_url=source_url,
+                verify=source_verify,
+                cert=source_certs,
+                api_version='v4',
+                params=puppetdb.mk_puppetdb_query(params, request),
+            )
+
+        # Only the hash is fetched, the catalogue when the graph of the catalogue is not kept.
+        catalogues = api_get('/catalogs', {'query': {1: '["extract",["hash"],["=","certname","%s"]]' % certname}})
+        if not catalogues:
+            data['error'] = 'No catalogue found.'
+            data['certname'] = certname
+            return HttpResponseBadRequest(json.dumps(data, indent=2), content_type="application/json")
+        catalogue_hash = catalogues[0]['hash']
+        graph = cached_graph(catalogue_hash)
+        if graph is None:
+            # The hash and the edges come from the same request, the node may have sent a new catalogue since
+            # the hash above was fetched and its edges must not be kept under the old hash.
+            catalogue = api_get('/catalogs/%s' % certname, {})
+            catalogue_hash = catalogue['hash']
+            graph = get_graph(catalogue_hash, lambda: catalogue['edges']['data'])
+
+    data['certname'] = certname
+    data['catalogue_hash'] = catalogue_hash
+    data['relationships'] = list(relationships)
+    if query == 'cycles':
+        data['cycles'] = graph.cycles(relationships)
+        return HttpResponse(json.dumps(data, indent=2), content_type="application/json")
+    if resource not in graph:
+        data['error'] = 'Resource not found in the catalogue graph.'
+        data['resource'] = resource
+        return HttpResponseBadRequest(json.dumps(data, indent=2), content_type="application/json")
+    data['resource'] = resource
+    if query == 'neighbourhood':
+        data.update(graph.neighbourhood(resource, relationships, depth=1 if depth is None else depth, limit=limit))
+    else:
+        walk = graph.dependencies if query == 'dependencies' else graph.dependents
+        found, data['truncated'] = walk(resource, relationships, depth=depth, limit=limit)
+        data['resources'] = [{'resource': found_resource, 'distance': distance} for found_resource, distance in found]
+    return HttpResponse(json.dumps(data, indent=2), content_type="application/json")
+
+
 @login_required
 def catalogue_history_list(request, certname=None):
     data = dict()
-    catalogues = SavedCatalogs.objects.filter(hostname=certname)
+    catalogues = SavedCatalogs.objects.filter(hostname=certname).defer('catalogue')
     if not catalogues:
         data['error'] = 'No saved catalogues available'
         data['certname'] = certname
@@ -267,12 +320,10 @@ def catalogue_history_fetch(request, certname=None, catalogue_hash=None):
             'linked_report': catalogue.linked_report,
             'catalogue_timestamp': filters.date(localtime(catalogue.timestamp), 'Y-m-d H:i:s'),
         }
-        if show == 'edges':
-            data['data'] = json.loads(catalogue.catalogue)['edges']['data']
-        elif show == 'resources':
-            data['data'] = json.loads(catalogue.catalogue)['resources']['data']
+        if show in ('edges', 'resources'):
+            data['data'] = load_section(catalogue, show)
         else:
-            data['data'] = json.loads(catalogue.catalogue)
+            data['data'] = load_catalogue(catalogue)
 
     except SavedCatalogs.DoesNotExist:
         data['error'] = "Could not find catalogue with specfied certname and report hash."
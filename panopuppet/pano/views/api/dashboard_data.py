@@ -1,20 +1,23 @@
 import json
 
 from django.contrib.auth.decorators import login_required
+from django.http import StreamingHttpResponse
 from django.shortcuts import HttpResponse, redirect
 from django.views.decorators.cache import cache_page
 
+from panopuppet.pano.methods.dashboard import dashboard_status, federated_dashboard
+from panopuppet.pano.methods.dashboardfeed import get_feed
 from panopuppet.pano.methods.dictfuncs import dictstatus as dictstatus
+from panopuppet.pano.puppetdb.mirror import take_mirrored_jobs
 from panopuppet.pano.puppetdb.pdbutils import run_puppetdb_jobs
 from panopuppet.pano.puppetdb.puppetdb import set_server, get_server
-from panopuppet.pano.settings import CACHE_TIME
+from panopuppet.pano.settings import CACHE_TIME, DASHBOARD_PUSH
 
 __author__ = 'etaklar'
 
 
 @cache_page(CACHE_TIME)
 def dashboard_status_json(request):
-    context = {}
     if request.method == 'GET':
         if 'source' in request.GET:
             source = request.GET.get('source')
@@ -23,130 +26,35 @@ def dashboard_status_json(request):
         request.session['django_timezone'] = request.POST['timezone']
         return redirect(request.POST['return_url'])
 
-    source_url, source_certs, source_verify = get_server(request)
-    pdb_vers = get_server(request, type='puppetdb_vers')
-
-    puppet_run_time = get_server(request, type='run_time')
-
-    events_params = {
-        'query':
-            {
-                1: '["and",["=","latest_report?",true],["in", "certname",["extract", "certname",["select_nodes",["null?","deactivated",true]]]]]'
-            },
-        'summarize_by': 'certname',
-    }
-    reports_params = {
-        'query':
-            {
-                1: '["and",["=","latest_report?",true],["in", "certname",["extract", "certname",["select_nodes",["null?","deactivated",true]]]]]'
-            }
-    }
-
-    if pdb_vers == 4:
-        tot_res_path = 'mbeans/puppetlabs.puppetdb.population:name=num-resources'
-        avg_res_path = 'mbeans/puppetlabs.puppetdb.population:name=avg-resources-per-node'
-    else:
-        tot_res_path = 'mbeans/puppetlabs.puppetdb.query.population:type=default,name=num-resources'
-        avg_res_path = 'mbeans/puppetlabs.puppetdb.query.population:type=default,name=avg-resources-per-node'
-
-    jobs = {
-        'tot_resource': {
-            'url': source_url,
-            'certs': source_certs,
-            'verify': source_verify,
-            'id': 'tot_resource',
-            'path': tot_res_path,
-        },
-        'avg_resource': {
-            'url': source_url,
-            'certs': source_certs,
-            'verify': source_verify,
-            'id': 'avg_resource',
-            'path': avg_res_path,
-        },
-        'all_nodes': {
-            'url': source_url,
-            'certs': source_certs,
-            'verify': source_verify,
-            'api_version': 'v4',
-            'id': 'all_nodes',
-            'path': '/nodes',
-            'request': request
-        },
-        'reports': {
-            'url': source_url,
-            'certs': source_certs,
-            'verify': source_verify,
-            'api_version': 'v4',
-            'id': 'reports',
-            'path': '/reports',
-            'params': reports_params,
-            'request': request
-        },
-        'events': {
-            'url': source_url,
-            'certs': source_certs,
-            'verify': source_verify,
-            'id': 'event_counts',
-            'path': 'event-counts',
-            'api_version': 'v4',
-            'params': events_params,
-            'request': request
-        },
-    }
-    puppetdb_results = run_puppetdb_jobs(jobs)
-
-    # Assign vars from the completed jobs
-    # Number of results from all_nodes is our population.
-    puppet_population = len(puppetdb_results['all_nodes'])
-
-    # Total resources managed by puppet metric
-    total_resources = puppetdb_results['tot_resource'].get('value', puppetdb_results['tot_resource'])
-
-    # Average resource per node metric
-    avg_resource_node = puppetdb_results['avg_resource'].get('value', puppetdb_results['avg_resource'])
-
-    # Information about all active nodes in puppet
-    all_nodes_list = puppetdb_results['all_nodes']
-
-    # All available events for the latest puppet reports
-    event_list = puppetdb_results['event_counts']
-    event_dict = {item['subject']['title']: item for item in event_list}
-    # All of the latest reports
-    reports_list = puppetdb_results['reports']
-    reports_dict = {item['certname']: item for item in reports_list}
-
-    failed_list, changed_list, unreported_list, mismatch_list, pending_list = dictstatus(
-        all_nodes_list,
-        reports_dict,
-        event_dict,
-        sort=True,
-        sortby='latestReport',
-        get_status='notall',
-        puppet_run_time=puppet_run_time)
+    context = dashboard_status(request)[0]
 
-    pending_list = [x for x in pending_list if x not in unreported_list]
-    changed_list = [x for x in changed_list if
-                    x not in unreported_list and x not in failed_list and x not in pending_list]
-    failed_list = [x for x in failed_list if x not in unreported_list]
-    unreported_list = [x for x in unreported_list if x not in failed_list]
-
-    node_unreported_count = len(unreported_list)
-    node_fail_count = len(failed_list)
-    node_change_count = len(changed_list)
-    node_off_timestamps_count = len(mismatch_list)
-    node_pending_count = len(pending_list)
+    return HttpResponse(json.dumps(context, indent=2), content_type="application/json")
 
-    context['population'] = puppet_population
-    context['total_resource'] = total_resources['Value']
-    context['avg_resource'] = "{:.2f}".format(avg_resource_node['Value'])
-    context['failed_nodes'] = node_fail_count
-    context['changed_nodes'] = node_change_count
-    context['unreported_nodes'] = node_unreported_count
-    context['mismatching_timestamps'] = node_off_timestamps_count
-    context['pending_nodes'] = node_pending_count
 
-    return HttpResponse(json.dumps(context, indent=2), content_type="application/json")
+@login_required
+def dashboard_events(request):
+    """
+    Server-sent events with the dashboard counts when they change and the nodes whose status changed.
+    All clients of a source share one producer querying PuppetDB. Only when DASHBOARD_PUSH is enabled.
+    """
+    if not DASHBOARD_PUSH:
+        # EventSource clients do not reconnect after a 204 response.
+        return HttpResponse(status=204)
+    if 'source' in request.GET:
+        set_server(request, request.GET.get('source'))
+    feed = get_feed(request)
+    if feed is None:
+        # EventSource clients do not reconnect after a 204 response.
+        return HttpResponse(status=204)
+    try:
+        last_event_id = int(request.META.get('HTTP_LAST_EVENT_ID', ''))
+    except ValueError:
+        last_event_id = None
+    response = StreamingHttpResponse(feed.stream(last_event_id), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the stream.
+    response['X-Accel-Buffering'] = 'no'
+    return response
 
 
 @login_required
@@ -239,7 +147,10 @@ def dashboard_nodes_json(request):
         },
     }
 
+    # Jobs the fleet mirror can answer are not sent to PuppetDB.
+    mirrored_results = take_mirrored_jobs(request, jobs)
     puppetdb_results = run_puppetdb_jobs(jobs)
+    puppetdb_results.update(mirrored_results)
     # Information about all active nodes in puppet
     all_nodes_list = puppetdb_results['all_nodes']
     # All available events for the latest puppet reports
@@ -292,7 +203,6 @@ def dashboard_nodes_json(request):
 @login_required
 @cache_page(CACHE_TIME)
 def dashboard_json(request):
-    context = {}
     if request.method == 'GET':
         if 'source' in request.GET:
             source = request.GET.get('source')
@@ -301,173 +211,21 @@ def dashboard_json(request):
         request.session['django_timezone'] = request.POST['timezone']
         return redirect(request.POST['return_url'])
 
-    source_url, source_certs, source_verify = get_server(request)
-    pdb_vers = get_server(request, type='puppetdb_vers')
-    puppet_run_time = get_server(request, type='run_time')
     dashboard_show = request.GET.get('show', 'recent')
-    events_params = {
-        'query':
-            {
-                1: '["and",["=","latest_report?",true],["in", "certname",["extract", "certname",["select_nodes",["null?","deactivated",true]]]]]'
-            },
-        'summarize_by': 'certname',
-    }
-    reports_params = {
-        'query':
-            {
-                1: '["and",["=","latest_report?",true],["in", "certname",["extract", "certname",["select_nodes",["null?","deactivated",true]]]]]'
-            }
-    }
-    nodes_params = {
-        'limit': 25,
-        'order_by': {
-            'order_field': {
-                'field': 'report_timestamp',
-                'order': 'desc',
-            },
-            'query_field': {'field': 'certname'},
-        },
-    }
-
-    if pdb_vers == 4:
-        tot_res_path = 'mbeans/puppetlabs.puppetdb.population:name=num-resources'
-        avg_res_path = 'mbeans/puppetlabs.puppetdb.population:name=avg-resources-per-node'
-    else:
-        tot_res_path = 'mbeans/puppetlabs.puppetdb.query.population:type=default,name=num-resources'
-        avg_res_path = 'mbeans/puppetlabs.puppetdb.query.population:type=default,name=avg-resources-per-node'
-
-    jobs = {
-        'tot_resource': {
-            'url': source_url,
-            'certs': source_certs,
-            'verify': source_verify,
-            'id': 'tot_resource',
-            'path': tot_res_path,
-        },
-        'avg_resource': {
-            'url': source_url,
-            'certs': source_certs,
-            'verify': source_verify,
-            'id': 'avg_resource',
-            'path': avg_res_path,
-        },
-        'all_nodes': {
-            'url': source_url,
-            'certs': source_certs,
-            'verify': source_verify,
-            'api_version': 'v4',
-            'id': 'all_nodes',
-            'path': '/nodes',
-            'request': request
-        },
-        'events': {
-            'url': source_url,
-            'certs': source_certs,
-            'verify': source_verify,
-            'id': 'event_counts',
-            'path': '/event-counts',
-            'api_version': 'v4',
-            'params': events_params,
-            'request': request
-        },
-        'reports': {
-            'url': source_url,
-            'certs': source_certs,
-            'verify': source_verify,
-            'api_version': 'v4',
-            'id': 'reports',
-            'path': '/reports',
-            'params': reports_params,
-            'request': request
-        },
-        'nodes': {
-            'url': source_url,
-            'certs': source_certs,
-            'verify': source_verify,
-            'api_version': 'v4',
-            'id': 'nodes',
-            'path': '/nodes',
-            'params': nodes_params,
-            'request': request
-        },
-    }
-    puppetdb_results = run_puppetdb_jobs(jobs)
-
-    # Assign vars from the completed jobs
-    # Number of results from all_nodes is our population.
-    puppet_population = len(puppetdb_results['all_nodes'])
-    # Total resources managed by puppet metric
-    total_resources = puppetdb_results['tot_resource']#.get('value', puppetdb_results['tot_resource'])
-
-    # Average resource per node metric
-    avg_resource_node = puppetdb_results['avg_resource']#.get('value', puppetdb_results['avg_resource'])
-
-    # Information about all active nodes in puppet
-    all_nodes_list = puppetdb_results['all_nodes']
-    # All available events for the latest puppet reports
-    event_list = puppetdb_results['event_counts']
-    event_dict = {item['subject']['title']: item for item in event_list}
-    # All of the latest reports
-    reports_list = puppetdb_results['reports']
-    reports_dict = {item['certname']: item for item in reports_list}
-    # 25 Nodes
-    node_list = puppetdb_results['nodes']
-
-    failed_list, changed_list, unreported_list, mismatch_list, pending_list = dictstatus(
-        all_nodes_list,
-        reports_dict,
-        event_dict,
-        sort=True,
-        sortby='latestReport',
-        get_status='notall',
-        puppet_run_time=puppet_run_time)
-
-    pending_list = [x for x in pending_list if x not in unreported_list]
-    changed_list = [x for x in changed_list if
-                    x not in unreported_list and x not in failed_list and x not in pending_list]
-    failed_list = [x for x in failed_list if x not in unreported_list]
-    unreported_list = [x for x in unreported_list if x not in failed_list]
-
-    node_unreported_count = len(unreported_list)
-    node_fail_count = len(failed_list)
-    node_change_count = len(changed_list)
-    node_off_timestamps_count = len(mismatch_list)
-    node_pending_count = len(pending_list)
-
-    if dashboard_show == 'recent':
-        merged_nodes_list = dictstatus(node_list,
-                                       reports_dict,
-                                       event_dict,
-                                       sort=False,
-                                       get_status="all",
-                                       puppet_run_time=puppet_run_time)
-    elif dashboard_show == 'failed':
-        merged_nodes_list = failed_list
-    elif dashboard_show == 'unreported':
-        merged_nodes_list = unreported_list
-    elif dashboard_show == 'changed':
-        merged_nodes_list = changed_list
-    elif dashboard_show == 'mismatch':
-        merged_nodes_list = mismatch_list
-    elif dashboard_show == 'pending':
-        merged_nodes_list = pending_list
-    else:
-        merged_nodes_list = dictstatus(node_list,
-                                       reports_dict,
-                                       event_dict,
-                                       sort=False,
-                                       get_status="all",
-                                       puppet_run_time=puppet_run_time)
-
+    context, node_status, merged_nodes_list = dashboard_status(request, show=dashboard_show)
     context['node_list'] = merged_nodes_list
     context['selected_view'] = dashboard_show
-    context['population'] = puppet_population
-    context['total_resource'] = total_resources['Value']
-    context['avg_resource'] = "{:.2f}".format(avg_resource_node['Value'])
-    context['failed_nodes'] = node_fail_count
-    context['changed_nodes'] = node_change_count
-    context['unreported_nodes'] = node_unreported_count
-    context['mismatching_timestamps'] = node_off_timestamps_count
-    context['pending_nodes'] = node_pending_count
 
     return HttpResponse(json.dumps(context, indent=2), content_type="application/json")
+
+
+@login_required
+@cache_page(CACHE_TIME)
+def dashboard_all_json(request):
+    """
+    The dashboard of all sources: summed counts, the node list tagged with the source of each node
+    and the state of each source. Sources that do not answer in time are left out.
+    """
+    dashboard_show = request.GET.get('show', 'recent')
+    context = federated_dashboard(request, show=dashboard_show)
+    return HttpResponse(json.dumps(context, indent=2), content_type="application/json")
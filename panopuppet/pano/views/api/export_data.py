@@ -0,0 +1,83 @@
+import json
+import zlib
+
+from django.contrib.auth.decorators import login_required
+from django.http import HttpResponseBadRequest, StreamingHttpResponse
+
+from panopuppet.pano.methods.nodeexport import export_records, parse_facts
+from panopuppet.pano.puppetdb.puppetdb import set_server
+
+__author__ = 'etaklar'
+
+# Flush the gzip stream after this many lines so the client keeps receiving data.
+GZIP_FLUSH_LINES = 100
+
+
+def gzip_stream(lines):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for i, line in enumerate(lines, 1):
+        data = compressor.compress(line)
+        if i % GZIP_FLUSH_LINES == 0:
+            data += compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def accepts_gzip(request):
+    """:return: True when the Accept-Encoding header of request allows gzip, a q value of 0 refuses it"""
+    qualities = {}
+    for coding in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        name, _, params = coding.partition(';')
+        quality = 1.0
+        for param in params.split(';'):
+            key, _, value = param.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[name.strip().lower()] = quality
+    for name in ('gzip', 'x-gzip', '*'):
+        if name in qualities:
+            return qualities[name] > 0
+    return False
+
+
+def ndjson_response(request, records):
+    """
+    :param records: iterable of json serializable records, one line each
+    :return: StreamingHttpResponse with the records, gzipped when the client accepts it or asks for it with gzip=true
+    """
+    lines = ((json.dumps(record) + '\n').encode('utf-8') for record in records)
+    if accepts_gzip(request) or request.GET.get('gzip') == 'true':
+        response = StreamingHttpResponse(gzip_stream(lines), content_type='application/x-ndjson')
+        response['Content-Encoding'] = 'gzip'
+    else:
+        response = StreamingHttpResponse(lines, content_type='application/x-ndjson')
+    response['Vary'] = 'Accept-Encoding'
+    return response
+
+
+@login_required
+def nodes_ndjson(request):
+    """
+    Streams every node with its status, event counts and the requested facts as one json object per line,
+    ordered by certname. Resume an interrupted export with after=<certname of the last line received>.
+    """
+    if 'source' in request.GET:
+        set_server(request, request.GET.get('source'))
+    search = request.GET.get('search') or None
+    after = request.GET.get('after') or None
+    include_facts = parse_facts(request.GET.get('include_facts', False))
+    limit = request.GET.get('limit')
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except ValueError:
+            return HttpResponseBadRequest('limit must be a number.')
+        if limit < 0:
+            return HttpResponseBadRequest('limit must be a positive number.')
+
+    records = export_records(request, search=search, include_facts=include_facts, after=after, limit=limit)
+    return ndjson_response(request, records)
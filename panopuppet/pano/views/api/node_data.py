@@ -1,6 +1,7 @@
 import csv
 import datetime
 import json
+from itertools import chain
 
 from django.contrib.auth.decorators import login_required
 from django.http import HttpResponseBadRequest, HttpResponse, StreamingHttpResponse
@@ -8,8 +9,10 @@
 from django.views.decorators.csrf import ensure_csrf_cookie
 
 from panopuppet.pano.methods.dictfuncs import dictstatus as dictstatus
-from panopuppet.pano.puppetdb import puppetdb
-from panopuppet.pano.puppetdb.pdbutils import generate_csv
+from panopuppet.pano.methods.nodechanges import changed_nodes, parse_since
+from panopuppet.pano.methods.nodeexport import CSV_HEADERS, export_rows, parse_facts
+from panopuppet.pano.puppetdb import certindex, puppetdb
+from panopuppet.pano.puppetdb.mirror import get_fleet_state, sort_nodes
 from panopuppet.pano.puppetdb.puppetdb import set_server, get_server
 from panopuppet.pano.views import Echo
 
@@ -115,6 +118,21 @@ def nodes_json(request):
     sort_field_order = request.session['sortfieldby']
     page_num = request.session['page']
 
+    if dl_csv is True:
+        # Stream the export page by page instead of loading every node first.
+        include_facts = parse_facts(request.GET.get('include_facts', False))
+        rows = export_rows(request,
+                           search=request.session['search'],
+                           sort_field=sort_field,
+                           sort_order=sort_field_order,
+                           include_facts=include_facts)
+        pseudo_buffer = Echo()
+        writer = csv.writer(pseudo_buffer)
+        response = StreamingHttpResponse((writer.writerow(row) for row in chain([CSV_HEADERS + include_facts], rows)),
+                                         content_type="text/csv")
+        response['Content-Disposition'] = 'attachment; filename="puppetdata-%s.csv"' % (datetime.datetime.now())
+        return response
+
     if request.session['search'] is not None:
         node_params = {
             'query':
@@ -136,78 +154,88 @@ def nodes_json(request):
                     'order': sort_field_order,
                 },
         }
-        if dl_csv is False:
-            node_params['limit'] = request.session['limits']
-            node_params['offset'] = request.session['offset']
+        node_params['limit'] = request.session['limits']
+        node_params['offset'] = request.session['offset']
     node_params['include_total'] = 'true'
 
-    node_sort_fields = ['certname', 'catalog_timestamp', 'report_timestamp', 'facts_timestamp']
-    try:
-        node_list, node_headers = puppetdb.api_get(
-            api_url=source_url,
-            cert=source_certs,
-            verify=source_verify,
-            path='/nodes',
-            api_version='v4',
-            params=puppetdb.mk_puppetdb_query(
-                node_params, request),
-        )
-    except:
-        node_list = []
-        node_headers = dict()
-        node_headers['X-Records'] = 0
-
-
     status_sort_fields = ['successes', 'failures', 'skips', 'noops']
-    # Create a filter part to limit the following API requests to data related to the node_list.
-    # Skipt the filter completely if a large number of nodes are shown as the query tends to fail.
-    node_filter = ''
-    if len(node_list) <= 100 and sort_field not in status_sort_fields:
-        node_filter = ', ["or"'
-        for n in node_list:
-            node_filter += ',["=","certname","%s"]' % n['certname']
-        node_filter += ']'
+    fleet_state = None
+    if request.session['search'] is None:
+        fleet_state = get_fleet_state(request)
+    if fleet_state is not None:
+        # Without a search the nodes and event counts come from the fleet mirror.
+        node_list = fleet_state['all_nodes']
+        node_headers = {'X-Records': str(len(node_list))}
+        if sort_field in nodes_sort_fields:
+            node_list = sort_nodes(node_list, sort_field, sort_field_order)
+            node_list = node_list[request.session['offset']:request.session['offset'] + request.session['limits']]
+        report_list = fleet_state['event_counts']
+    else:
+        node_sort_fields = ['certname', 'catalog_timestamp', 'report_timestamp', 'facts_timestamp']
+        try:
+            node_list, node_headers = puppetdb.api_get(
+                api_url=source_url,
+                cert=source_certs,
+                verify=source_verify,
+                path='/nodes',
+                api_version='v4',
+                params=puppetdb.mk_puppetdb_query(
+                    node_params, request),
+            )
+        except:
+            node_list = []
+            node_headers = dict()
+            node_headers['X-Records'] = 0
 
-    # Work out the number of pages from the xrecords response
-    # return fields that you can sort by
-    # for each node in the node_list, find out if the latest run has any failures
-    # v3/event-counts --data-urlencode query='["=","latest-report?",true]'
-    # --data-urlencode summarize-by='certname'
-    report_params = {
-        'query':
-            {
-                1: '["and" %s, ["=","latest_report?",true],["in", "certname",["extract", "certname",["select_nodes",["null?","deactivated",true]]]]]' % node_filter,
-            },
-        'summarize_by': 'certname',
-    }
+        # Create a filter part to limit the following API requests to data related to the node_list.
+        # Skipt the filter completely if a large number of nodes are shown as the query tends to fail.
+        node_filter = ''
+        if len(node_list) <= 100 and sort_field not in status_sort_fields:
+            node_filter = ', ["or"'
+            for n in node_list:
+                node_filter += ',["=","certname","%s"]' % n['certname']
+            node_filter += ']'
 
-    if sort_field in status_sort_fields:
-        report_params['order_by'] = {
-            'order_field':
+        # Work out the number of pages from the xrecords response
+        # return fields that you can sort by
+        # for each node in the node_list, find out if the latest run has any failures
+        # v3/event-counts --data-urlencode query='["=","latest-report?",true]'
+        # --data-urlencode summarize-by='certname'
+        report_params = {
+            'query':
                 {
-                    'field': sort_field,
-                    'order': sort_field_order,
-                }
+                    1: '["and" %s, ["=","latest_report?",true],["in", "certname",["extract", "certname",["select_nodes",["null?","deactivated",true]]]]]' % node_filter,
+                },
+            'summarize_by': 'certname',
         }
-        report_params['include_total'] = 'true'
 
-        report_list, report_headers = puppetdb.api_get(
-            api_url=source_url,
-            cert=source_certs,
-            verify=source_verify,
-            path='/event-counts',
-            params=puppetdb.mk_puppetdb_query(report_params, request),
-            api_version='v4',
-        )
-    else:
-        report_list = puppetdb.api_get(
-            api_url=source_url,
-            cert=source_certs,
-            verify=source_verify,
-            path='event-counts',
-            params=puppetdb.mk_puppetdb_query(report_params, request),
-            api_version='v4',
-        )
+        if sort_field in status_sort_fields:
+            report_params['order_by'] = {
+                'order_field':
+                    {
+                        'field': sort_field,
+                        'order': sort_field_order,
+                    }
+            }
+            report_params['include_total'] = 'true'
+
+            report_list, report_headers = puppetdb.api_get(
+                api_url=source_url,
+                cert=source_certs,
+                verify=source_verify,
+                path='/event-counts',
+                params=puppetdb.mk_puppetdb_query(report_params, request),
+                api_version='v4',
+            )
+        else:
+            report_list = puppetdb.api_get(
+                api_url=source_url,
+                cert=source_certs,
+                verify=source_verify,
+                path='event-counts',
+                params=puppetdb.mk_puppetdb_query(report_params, request),
+                api_version='v4',
+            )
     # number of results not depending on sort field.
     xrecords = node_headers['X-Records']
     total_results = xrecords
@@ -242,82 +270,6 @@ def nodes_json(request):
                           format_time=False)
         sort_field_order_opposite = 'desc'
 
-    if dl_csv is True:
-        if rows is []:
-            pass
-        else:
-            # Generate a sequence of rows. The range is based on the maximum number of
-            # rows that can be handled by a single sheet in most spreadsheet
-            # applications.
-            include_facts = request.GET.get('include_facts', False)
-            csv_headers = ['Certname',
-                           'Latest Catalog',
-                           'Latest Report',
-                           'Latest Facts',
-                           'Success',
-                           'Noop',
-                           'Failure',
-                           'Skipped',
-                           'Run Status']
-            if include_facts is not False:
-                merged_list_facts = []
-                facts = {}
-                for fact in include_facts.split(','):
-                    # Sanitize the fact input from the user
-                    fact = fact.strip()
-                    # Add the fact name to the headers list
-                    csv_headers.append(fact)
-
-                    # build the params for each fact.
-                    facts_params = {
-                        'query':
-                            {
-                                1: '["=","name","' + fact + '"]'
-                            },
-                    }
-                    fact_list = puppetdb.api_get(
-                        api_url=source_url,
-                        cert=source_certs,
-                        verify=source_verify,
-                        path='facts',
-                        params=puppetdb.mk_puppetdb_query(facts_params),
-                        api_version='v4',
-                    )
-                    # Populate the facts dict with the facts we have retrieved
-                    # Convert the fact list into a fact dict!
-                    facts[fact] = {item['certname']: item for item in fact_list}
-
-                i = 1
-                jobs = {}
-                # Add ID to each job so that it can be assembled in
-                # the same order after we recieve the job results
-                # We do this via jobs so that we can get faster results.
-                for node in rows:
-                    jobs[i] = {
-                        'id': i,
-                        'include_facts': include_facts.split(','),
-                        'node': node,
-                        'facts': facts,
-                    }
-                    i += 1
-
-                csv_results = generate_csv(jobs)
-                rows = []
-                i = 1
-                # with the job results we can now recreate merged_list
-                # in the order we sent them.
-                while i <= len(csv_results):
-                    rows.append(csv_results[i])
-                    i += 1
-            # Insert the csv header to the top of the list.
-            rows.insert(0, csv_headers)
-            pseudo_buffer = Echo()
-            writer = csv.writer(pseudo_buffer)
-            response = StreamingHttpResponse((writer.writerow(row) for row in rows),
-                                             content_type="text/csv")
-            response['Content-Disposition'] = 'attachment; filename="puppetdata-%s.csv"' % (datetime.datetime.now())
-            return response
-
     if sort_field in status_sort_fields:
         rows = rows[request.session['offset']:(request.session['limits']+request.session['offset'])]
     """
@@ -340,35 +292,35 @@ def nodes_json(request):
     return HttpResponse(json.dumps(context), content_type="application/json")
 
 
+@login_required
 def search_nodes_json(request):
-    source_url, source_certs, source_verify = get_server(request)
-    if request.method == 'GET':
-        if 'search' in request.GET:
-            search = request.GET.get('search')
-
-    # Create a search regex for certname spelt with below.
-    nodes_params = {
-        'query':
-            {
-                1: '["~","certname","' + search + '"]'
-            },
-        'order_by':
-            {
-                'order_field':
-                    {
-                        'field': 'certname',
-                        'order': 'desc',
-                    },
-            },
-        # 'limit': 25,
-    }
-    nodes_list = puppetdb.api_get(
-        api_url=source_url,
-        cert=source_certs,
-        verify=source_verify,
-        path='/nodes',
-        api_version='v4',
-        params=puppetdb.mk_puppetdb_query(
-            nodes_params, request),
-    )
+    """
+    Certnames matching the search for the node search boxes, answered from the certname index.
+    Certnames starting with the search are listed first, followed by certnames containing it.
+    """
+    search = request.GET.get('search', '')
+    try:
+        limit = int(request.GET.get('limit', 50))
+    except ValueError:
+        return HttpResponseBadRequest('limit must be a number.')
+    index = certindex.get_index(request)
+    if index is None:
+        nodes_list = []
+    else:
+        nodes_list = [{'certname': certname} for certname in index.search(search, limit=limit)]
     return HttpResponse(json.dumps(nodes_list, indent=2), content_type="application/json")
+
+
+@login_required
+def nodes_changes_json(request):
+    """
+    Nodes whose report, facts or catalog timestamp or status changed since the given time,
+    and the watermark to pass as since in the next request.
+    """
+    if 'source' in request.GET:
+        set_server(request, request.GET.get('source'))
+    since = parse_since(request.GET.get('since'))
+    if since is None:
+        data = {'error': 'since must be an ISO 8601 timestamp.'}
+        return HttpResponseBadRequest(json.dumps(data, indent=2), content_type="application/json")
+    return HttpResponse(json.dumps(changed_nodes(request, since)), content_type="application/json")
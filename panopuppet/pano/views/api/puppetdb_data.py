@@ -0,0 +1,27 @@
+import json
+
+from django.contrib.auth.decorators import login_required
+from django.shortcuts import HttpResponse
+
+from panopuppet.pano.puppetdb import admission, replicas, resilience
+
+__author__ = 'etaklar'
+
+
+@login_required
+def puppetdb_status_json(request):
+    """
+    Per PuppetDB source queried by this process: the query slots in use, the queries waiting for a slot and
+    how long queries waited per priority, the circuit breaker state and the state of the replicas.
+    """
+    admission_state = admission.state()
+    breaker_state = resilience.state()
+    sources = {}
+    for source_url in set(admission_state) | set(breaker_state):
+        replica_set = replicas.get_replica_set(source_url)
+        sources[source_url] = {
+            'admission': admission_state.get(source_url),
+            'breaker': breaker_state.get(source_url),
+            'replicas': replica_set.state() if replica_set else None,
+        }
+    return HttpResponse(json.dumps(sources, indent=2), content_type="application/json")
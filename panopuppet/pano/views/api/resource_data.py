@@ -0,0 +1,51 @@
+import json
+
+from django.contrib.auth.decorators import login_required
+from django.http import HttpResponse, HttpResponseBadRequest
+
+from panopuppet.pano.methods.resourcesearch import ResourceSearch, parse_resource
+from panopuppet.pano.puppetdb.puppetdb import set_server
+from panopuppet.pano.views.api.export_data import ndjson_response
+
+__author__ = 'etaklar'
+
+
+def _resource_search(request):
+    """:return: tuple(ResourceSearch, None) or tuple(None, error response)"""
+    if 'source' in request.GET:
+        set_server(request, request.GET.get('source'))
+    if request.GET.get('resource'):
+        resource = parse_resource(request.GET['resource'])
+    elif request.GET.get('type') and request.GET.get('title'):
+        resource = parse_resource('%s[%s]' % (request.GET['type'], request.GET['title']))
+    else:
+        resource = None
+    if resource is None:
+        data = {'error': 'Give the resource as resource=Type[title] or with type and title.'}
+        return None, HttpResponseBadRequest(json.dumps(data, indent=2), content_type="application/json")
+    return ResourceSearch(request, *resource), None
+
+
+@login_required
+def resources_search_json(request):
+    """Number of active nodes with a resource in their catalogue, in total and per environment."""
+    search, error = _resource_search(request)
+    if error:
+        return error
+    environments = search.environments()
+    data = {
+        'type': search.resource_type,
+        'title': search.title,
+        'total': sum(environments.values()),
+        'environments': environments,
+    }
+    return HttpResponse(json.dumps(data, indent=2), content_type="application/json")
+
+
+@login_required
+def resources_nodes_ndjson(request):
+    """Streams the active nodes with a resource in their catalogue as one json object per line, ordered by certname."""
+    search, error = _resource_search(request)
+    if error:
+        return error
+    return ndjson_response(request, search.nodes())
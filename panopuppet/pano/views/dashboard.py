@@ -5,7 +5,7 @@
 from django.views.decorators.cache import cache_page
 
 from panopuppet.pano.puppetdb.puppetdb import set_server
-from panopuppet.pano.settings import AVAILABLE_SOURCES, CACHE_TIME
+from panopuppet.pano.settings import AVAILABLE_SOURCES, CACHE_TIME, DASHBOARD_PUSH
 
 __author__ = 'etaklar'
 
@@ -14,7 +14,8 @@
 @cache_page(CACHE_TIME)
 def dashboard(request):
     context = {'timezones': pytz.common_timezones,
-               'SOURCES': AVAILABLE_SOURCES}
+               'SOURCES': AVAILABLE_SOURCES,
+               'dashboard_push': DASHBOARD_PUSH}
     if request.method == 'GET':
         if 'source' in request.GET:
             source = request.GET.get('source')
@@ -24,3 +25,10 @@ def dashboard(request):
         return redirect(request.POST['url'])
 
     return render(request, 'pano/dashboard.html', context)
+
+
+@login_required
+def dashboard_all(request):
+    context = {'timezones': pytz.common_timezones,
+               'SOURCES': AVAILABLE_SOURCES}
+    return render(request, 'pano/dashboard_all.html', context)
@@ -1,13 +1,34 @@
 import pytz
 
 from django.contrib.auth.decorators import login_required
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import render
+from django.template.loader import render_to_string
 
 from panopuppet.pano.methods.filebucket import get_file as get_filebucket
+from panopuppet.pano.templatetags.common import colorize_diff_line
 
 __author__ = 'etaklar'
 
+# Stands in for the diff when pano/filebucket.html is rendered to get the markup around it.
+DIFF_MARKER = 'panopuppet-filebucket-diff'
+# Number of diff lines per chunk of the response.
+DIFF_CHUNK_LINES = 500
+
+
+def stream_diff(request, lines):
+    # The page is rendered with the marker as content, the diff goes in the same <pre> as in a rendered diff.
+    header, footer = render_to_string('pano/filebucket.html', {'content': DIFF_MARKER, 'isdiff': False},
+                                      request).split(DIFF_MARKER)
+    yield header
+    chunk = []
+    for line in lines:
+        chunk.append(colorize_diff_line(line))
+        if len(chunk) >= DIFF_CHUNK_LINES:
+            yield ''.join(chunk)
+            chunk = []
+    yield ''.join(chunk) + footer
+
 
 @login_required
 def filebucket(request):
@@ -62,12 +83,14 @@ def filebucket(request):
                                          md5sum_to=md5_sum_to,
                                          md5sum_from=md5_sum_from,
                                          diff=diff_files)
-        context = {
-            'certname': certname,
-            'content': filebucket_file,
-            'isdiff': diff_files
-        }
-
-        return render(request, 'pano/filebucket.html', context)
+        if not filebucket_file:
+            context = {
+                'certname': certname,
+                'content': filebucket_file,
+                'isdiff': diff_files
+            }
+            return render(request, 'pano/filebucket.html', context)
+        # Large diffs are sent as they are made instead of after rendering all of them.
+        return StreamingHttpResponse(stream_diff(request, filebucket_file))
     else:
         return HttpResponse('No valid GET params was sent.')
@@ -6,7 +6,7 @@
 
 from panopuppet.pano.puppetdb import puppetdb
 from panopuppet.pano.puppetdb.puppetdb import set_server, get_server
-from panopuppet.pano.settings import AVAILABLE_SOURCES, CACHE_TIME, NODES_DEFAULT_FACTS
+from panopuppet.pano.settings import AVAILABLE_SOURCES, CACHE_TIME, DASHBOARD_PUSH, NODES_DEFAULT_FACTS
 
 __author__ = 'etaklar'
 
@@ -15,7 +15,8 @@
 @cache_page(CACHE_TIME)
 def radiator(request, certname=None):
     context = {'timezones': pytz.common_timezones,
-               'SOURCES': AVAILABLE_SOURCES}
+               'SOURCES': AVAILABLE_SOURCES,
+               'dashboard_push': DASHBOARD_PUSH}
     if request.method == 'GET':
         if 'source' in request.GET:
             source = request.GET.get('source')
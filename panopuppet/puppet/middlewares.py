@@ -1,13 +1,132 @@
 __author__ = 'etaklar'
 
+import cProfile
+import io
+import json
+import pstats
+import time
+
 import pytz
+import requests
+from django.http import HttpResponse
 from django.utils import timezone
+from django.utils.html import escape
+from django.utils.deprecation import MiddlewareMixin
+
+from panopuppet.pano.puppetdb import resilience, tracing
+from panopuppet.pano.settings import ENABLE_PROFILING, PUPPETDB_REQUEST_DEADLINE, PUPPETDB_BREAKER_RESET
 
 
-class TimezoneMiddleware(object):
+class TimezoneMiddleware(MiddlewareMixin):
     def process_request(self, request):
         tzname = request.session.get('django_timezone')
         if tzname:
             timezone.activate(pytz.timezone(tzname))
         else:
             timezone.deactivate()
+
+
+class DeadlineMiddleware(MiddlewareMixin):
+    """
+    Limits the time the PuppetDB queries of a request may take to PUPPETDB_REQUEST_DEADLINE seconds.
+    Streamed responses (csv exports) are consumed after the deadline is removed and are not limited.
+    """
+
+    def process_request(self, request):
+        if PUPPETDB_REQUEST_DEADLINE is None:
+            resilience.attach_deadline(None)
+        else:
+            resilience.attach_deadline(time.time() + PUPPETDB_REQUEST_DEADLINE)
+
+    def process_response(self, request, response):
+        resilience.attach_deadline(None)
+        return response
+
+
+class PuppetDBErrorMiddleware(MiddlewareMixin):
+    """
+    Answers 503 Service Unavailable when a view fails because PuppetDB could not be queried: it is down,
+    its circuit breaker is open, it did not answer with JSON or the deadline of the request passed.
+    API urls get a JSON body with the error, pages a short HTML page.
+    """
+
+    def process_exception(self, request, exception):
+        if not isinstance(exception, requests.RequestException):
+            return None
+        message = 'PuppetDB is unavailable: %s' % exception
+        if '/api/' in request.path or request.is_ajax():
+            response = HttpResponse(json.dumps({'error': message}, indent=2), content_type='application/json',
+                                    status=503)
+        else:
+            response = HttpResponse('<html><head><title>PuppetDB unavailable</title></head>'
+                                    '<body><h1>PuppetDB unavailable</h1><p>%s</p></body></html>' % escape(message),
+                                    status=503)
+        if isinstance(exception, resilience.PuppetDBUnavailable):
+            response['Retry-After'] = str(int(PUPPETDB_BREAKER_RESET))
+        return response
+
+
+class ProfilerMiddleware(MiddlewareMixin):
+    """
+    Staff users can add ?_profile=1 (or true) to any url to get a cProfile breakdown
+    of the view instead of the normal response, together with a timeline
+    of every PuppetDB request made while serving it.
+    Optional GET params:
+    _profile_sort: pstats sort key, default cumulative
+    _profile_limit: number of functions to list, default 60
+    Note that cProfile only profiles the thread running the view, the
+    PuppetDB job threads are only visible in the timeline.
+    """
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not ENABLE_PROFILING or request.GET.get('_profile', '').lower() not in ('1', 'true'):
+            return None
+        if not request.user.is_staff:
+            return None
+        sort_by = request.GET.get('_profile_sort', 'cumulative')
+        try:
+            limit = int(request.GET.get('_profile_limit', 60))
+        except ValueError:
+            limit = 60
+
+        def run_view():
+            response = view_func(request, *view_args, **view_kwargs)
+            # Streamed responses (csv exports) do their work while being consumed.
+            if getattr(response, 'streaming', False):
+                for chunk in response.streaming_content:
+                    pass
+            return response
+
+        profiler = cProfile.Profile()
+        trace = tracing.start_trace()
+        started = time.perf_counter()
+        try:
+            response = profiler.runcall(run_view)
+        finally:
+            tracing.stop_trace()
+        elapsed = time.perf_counter() - started
+
+        output = io.StringIO()
+        output.write('%s %s\n' % (request.method, request.get_full_path()))
+        output.write('Response status: %s\n' % response.status_code)
+        output.write('Total time: %.3fs\n\n' % elapsed)
+
+        calls = sorted(trace['calls'], key=lambda call: call['offset'])
+        output.write('PuppetDB requests: %d (%.3fs spent in requests)\n' % (
+            len(calls), sum(call['duration'] for call in calls)))
+        output.write('%10s %10s  %-20s %-6s %s\n' % ('offset', 'duration', 'thread', 'status', 'path'))
+        for call in calls:
+            output.write('%+9.3fs %9.3fs  %-20s %-6s %s\n' % (
+                call['offset'],
+                call['duration'],
+                call['thread'],
+                call['status'] if call['error'] is None else 'error',
+                call['path'] if call['error'] is None else '%s (%s)' % (call['path'], call['error'])))
+        output.write('\n')
+
+        try:
+            stats = pstats.Stats(profiler, stream=output).sort_stats(sort_by)
+        except KeyError:
+            stats = pstats.Stats(profiler, stream=output).sort_stats('cumulative')
+        stats.print_stats(limit)
+        return HttpResponse(output.getvalue(), content_type='text/plain')
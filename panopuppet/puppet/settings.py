@@ -48,16 +48,21 @@
     'panopuppet.pano',
 )
 
-MIDDLEWARE_CLASSES = (
+MIDDLEWARE = (
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
-    'django.contrib.auth.middleware.SessionAuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     # timezone awareness
     'panopuppet.puppet.middlewares.TimezoneMiddleware',
+    # limit the time spent on PuppetDB queries per request
+    'panopuppet.puppet.middlewares.DeadlineMiddleware',
+    # 503 instead of 500 when PuppetDB can not be queried
+    'panopuppet.puppet.middlewares.PuppetDBErrorMiddleware',
+    # ?_profile=1 for staff users
+    'panopuppet.puppet.middlewares.ProfilerMiddleware',
 )
 
 ROOT_URLCONF = 'panopuppet.puppet.urls'
@@ -1 +1,28 @@
+import importlib
+import importlib.abc
+import importlib.util
+import sys
 
+__author__ = 'etaklar'
+
+
+class PanoAlias(importlib.abc.MetaPathFinder, importlib.abc.Loader):
+    """
+    The tests import pano.*, the code imports panopuppet.pano.*. Both names give the same modules, so
+    patches, thread locals and caches are shared with the code under test instead of living in a second copy.
+    """
+
+    def find_spec(self, fullname, path=None, target=None):
+        if fullname == 'pano' or fullname.startswith('pano.'):
+            return importlib.util.spec_from_loader(fullname, self)
+        return None
+
+    def create_module(self, spec):
+        return None
+
+    def exec_module(self, module):
+        # The import system takes the module from sys.modules once this returns.
+        sys.modules[module.__name__] = importlib.import_module('panopuppet.' + module.__name__)
+
+
+sys.meta_path.insert(0, PanoAlias())
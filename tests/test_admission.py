@@ -0,0 +1,66 @@
+import threading
+import time
+from unittest import TestCase
+
+from pano.puppetdb.admission import AdmissionController, AdmissionTimeout, BACKGROUND, EXPORT, INTERACTIVE, \
+    admit, current_priority, priority, state
+
+__author__ = 'etaklar'
+
+
+class TestAdmissionController(TestCase):
+    def setUp(self):
+        self.controller = AdmissionController(max_in_flight=1)
+
+    def queue(self, level, admitted):
+        def run():
+            self.controller.acquire(level)
+            admitted.append(level)
+            self.controller.release()
+
+        queued = len(self.controller.waiting)
+        worker = threading.Thread(target=run)
+        worker.start()
+        while len(self.controller.waiting) == queued:
+            time.sleep(0.001)
+        return worker
+
+    def test_priority_order(self):
+        self.controller.acquire(INTERACTIVE)
+        admitted = []
+        workers = [self.queue(level, admitted) for level in (BACKGROUND, EXPORT, INTERACTIVE, EXPORT)]
+        self.assertEqual(self.controller.state()['queued'], 4)
+        self.controller.release()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(admitted, [INTERACTIVE, EXPORT, EXPORT, BACKGROUND])
+        self.assertEqual(self.controller.in_flight, 0)
+        wait = self.controller.state()['wait']
+        self.assertEqual(wait['export']['admitted'], 2)
+        self.assertGreater(wait['background']['wait_max'], 0)
+
+    def test_timeout(self):
+        self.controller.acquire(INTERACTIVE)
+        self.assertRaises(AdmissionTimeout, self.controller.acquire, BACKGROUND, 0.01)
+        self.assertEqual(self.controller.waiting, [])
+        self.assertEqual(self.controller.state()['wait']['background']['timed_out'], 1)
+        self.controller.release()
+        self.assertEqual(self.controller.in_flight, 0)
+
+    def test_unlimited(self):
+        controller = AdmissionController(max_in_flight=0)
+        for i in range(100):
+            controller.acquire(EXPORT)
+        self.assertEqual(controller.in_flight, 100)
+
+
+class TestAdmit(TestCase):
+    def test_priority(self):
+        self.assertEqual(current_priority(), INTERACTIVE)
+        with priority(EXPORT):
+            with admit('http://limited:8080/'):
+                self.assertEqual(state()['http://limited:8080/']['in_flight'], 1)
+        self.assertEqual(current_priority(), INTERACTIVE)
+        source_state = state()['http://limited:8080/']
+        self.assertEqual(source_state['in_flight'], 0)
+        self.assertEqual(source_state['wait']['export']['admitted'], 1)
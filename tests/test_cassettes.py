@@ -0,0 +1,70 @@
+import shutil
+import tempfile
+import time
+
+from django.test import TestCase
+from requests.structures import CaseInsensitiveDict
+
+from pano.puppetdb import cassettes
+
+__author__ = 'etaklar'
+
+SOURCE = 'http://puppetdb1.local:8080/'
+
+
+class FakeResponse(object):
+    def __init__(self, status_code, headers, text):
+        self.status_code = status_code
+        self.headers = CaseInsensitiveDict(headers)
+        self.text = text
+
+
+class RecordReplay(TestCase):
+    def setUp(self):
+        self.cassette_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cassette_dir)
+
+    def test_replay_recorded_response(self):
+        path = 'pdb/query/v4/nodes?query=%5B%22%3D%22%2C%22certname%22%2C%22foo.local%22%5D'
+        response = FakeResponse(200, {'X-Records': '1', 'Server': 'Jetty'}, '[{"certname": "foo.local"}]')
+        cassettes.record(SOURCE, 'get', path, response, 0.01, cassette_dir=self.cassette_dir)
+
+        replayed = cassettes.replay(SOURCE, 'get', path, cassette_dir=self.cassette_dir, latency=0)
+        self.assertEqual(replayed.status_code, 200)
+        self.assertEqual(replayed.text, '[{"certname": "foo.local"}]')
+        self.assertEqual(replayed.headers['x-records'], '1')
+        self.assertNotIn('Server', replayed.headers)
+
+    def test_cassette_contains_query(self):
+        path = 'pdb/query/v4/facts?query=%5B%22%3D%22%2C%22name%22%2C%22kernel%22%5D'
+        cassettes.record(SOURCE, 'get', path, FakeResponse(200, {}, '[]'), 0.01, cassette_dir=self.cassette_dir)
+        cassette = cassettes.load(SOURCE, 'get', path, cassette_dir=self.cassette_dir)
+        self.assertEqual(cassette['source'], SOURCE)
+        self.assertEqual(cassette['path'], 'pdb/query/v4/facts')
+        self.assertEqual(cassette['query'], {'query': ['["=","name","kernel"]']})
+
+    def test_replay_latency(self):
+        path = 'pdb/meta/v1/version'
+        cassettes.record(SOURCE, 'get', path, FakeResponse(200, {}, '{"version": "4.1.0"}'), 0.2,
+                         cassette_dir=self.cassette_dir)
+        started = time.perf_counter()
+        cassettes.replay(SOURCE, 'get', path, cassette_dir=self.cassette_dir, latency=0.5)
+        self.assertGreaterEqual(time.perf_counter() - started, 0.1)
+
+    def test_replay_not_recorded(self):
+        self.assertRaises(cassettes.CassetteNotFound, cassettes.replay, SOURCE, 'get', 'pdb/query/v4/nodes',
+                          cassette_dir=self.cassette_dir, latency=0)
+
+    def test_sources_kept_apart(self):
+        path = 'pdb/query/v4/nodes'
+        other = 'http://puppetdb2.local:8080/'
+        cassettes.record(SOURCE, 'get', path, FakeResponse(200, {}, '["first"]'), 0, cassette_dir=self.cassette_dir)
+        cassettes.record(other, 'get', path, FakeResponse(200, {}, '["second"]'), 0, cassette_dir=self.cassette_dir)
+        self.assertEqual(cassettes.replay(SOURCE, 'get', path, cassette_dir=self.cassette_dir, latency=0).text,
+                         '["first"]')
+        self.assertEqual(cassettes.replay(other, 'get', path, cassette_dir=self.cassette_dir, latency=0).text,
+                         '["second"]')
+        self.assertRaises(cassettes.CassetteNotFound, cassettes.replay, 'http://puppetdb3.local:8080/', 'get', path,
+                          cassette_dir=self.cassette_dir, latency=0)
@@ -0,0 +1,51 @@
+from unittest import TestCase
+
+from pano.methods.catalogdiff import diff_items, diff_parameters, resource_hash
+
+__author__ = 'etaklar'
+
+
+def resource(resource_type, title, certname='node1.example.com', **parameters):
+    return {'certname': certname, 'type': resource_type, 'title': title, 'tags': ['class'], 'file': '/site.pp',
+            'line': 1, 'exported': False, 'parameters': parameters}
+
+
+class TestCatalogDiff(TestCase):
+    def test_type_and_title(self):
+        # A File and an Exec with the same title are different resources.
+        old = [resource('File', '/tmp/x', ensure='file')]
+        new = [resource('File', '/tmp/x', ensure='file'), resource('Exec', '/tmp/x', command='/tmp/x')]
+        diff = diff_items(old, new, 'resources')
+        self.assertEqual([(entry['type'], entry['title']) for entry in diff['added_entries']], [('Exec', '/tmp/x')])
+        self.assertEqual(diff['changed_entries'], [])
+
+    def test_parameters(self):
+        old = [resource('File', '/etc/motd', ensure='file', content='hello', mode='0644')]
+        new = [resource('File', '/etc/motd', ensure='file', content='bye', owner='root')]
+        new[0]['line'] = 2
+        change = diff_items(old, new, 'resources')['changed_entries'][0]
+        self.assertEqual(change['fields'], ['line'])
+        self.assertEqual(change['parameters'], {
+            'added': {'owner': 'root'},
+            'removed': {'mode': '0644'},
+            'changed': {'content': {'from': 'hello', 'against': 'bye'}},
+        })
+        self.assertNotIn('certname', change['from'])
+
+    def test_other_node(self):
+        # The certname does not make resources differ.
+        old = [resource('Package', 'ntp', ensure='installed')]
+        new = [resource('Package', 'ntp', certname='node2.example.com', ensure='installed')]
+        self.assertEqual(resource_hash(old[0]), resource_hash(new[0]))
+        diff = diff_items(old, new, 'resources')
+        self.assertEqual(diff, {'added_entries': [], 'deleted_entries': [], 'changed_entries': []})
+
+    def test_edges(self):
+        edge = {'source_type': 'Class', 'source_title': 'Main', 'relationship': 'contains', 'target_type': 'File',
+                'target_title': '/etc/motd'}
+        diff = diff_items([edge], [dict(edge, relationship='before')], 'edges')
+        self.assertEqual(diff['added_entries'], [dict(edge, relationship='before')])
+        self.assertEqual(diff['deleted_entries'], [edge])
+
+    def test_diff_parameters(self):
+        self.assertEqual(diff_parameters({'a': [1, 2]}, {'a': [1, 2]}), {'added': {}, 'removed': {}, 'changed': {}})
@@ -0,0 +1,72 @@
+from unittest import TestCase, mock
+
+from pano.methods.catalogdrift import InlineExecutor, catalogue_drift, compare_batch, fingerprint_catalogue, \
+    get_executor, make_executor
+
+__author__ = 'etaklar'
+
+
+def sections(certname, content='hello', packages=('ntp',)):
+    resources = [{'certname': certname, 'type': 'File', 'title': '/etc/motd', 'parameters': {'content': content}}]
+    resources.extend({'certname': certname, 'type': 'Package', 'title': package, 'parameters': {}}
+                     for package in packages)
+    edges = [{'certname': certname, 'source_type': 'Class', 'source_title': 'Main', 'relationship': 'contains',
+              'target_type': 'File', 'target_title': '/etc/motd'}]
+    return {'resources': resources, 'edges': edges}
+
+
+class TestCatalogDrift(TestCase):
+    def test_signature(self):
+        signature, indexes = fingerprint_catalogue(sections('node1.example.com'))
+        # Same catalogue on another node, resources in another order.
+        other = sections('node2.example.com', packages=('ntp',))
+        other['resources'].reverse()
+        self.assertEqual(fingerprint_catalogue(other)[0], signature)
+        self.assertNotEqual(fingerprint_catalogue(sections('node1.example.com', content='bye'))[0], signature)
+
+    def test_compare(self):
+        baseline = fingerprint_catalogue(sections('baseline.example.com'))[1]
+        (signature, diff), same = compare_batch(baseline, [sections('node1.example.com', packages=('ntp', 'vim')),
+                                                           sections('node2.example.com', packages=('ntp', 'vim'))])
+        self.assertEqual([entry['title'] for entry in diff['resources']['added_entries']], ['vim'])
+        self.assertEqual(diff['edges'], {'added_entries': [], 'deleted_entries': [], 'changed_entries': []})
+        # The diff of a signature is returned once per batch.
+        self.assertEqual(same, (signature, None))
+
+    def test_process_pool(self):
+        executor = make_executor(processes=2)
+        try:
+            # Two requests with different baselines on the same processes.
+            for content in ('hello', 'bye'):
+                baseline = fingerprint_catalogue(sections('baseline.example.com', content=content))[1]
+                futures = [executor.submit(compare_batch, baseline,
+                                           [sections('node%d.example.com' % i, content=str(i % 2)) for i in range(3)])
+                           for batch in range(2)]
+                results = [result for future in futures for result in future.result()]
+                self.assertEqual(len(set(signature for signature, diff in results)), 2)
+                change = [diff for signature, diff in results if diff][0]['resources']['changed_entries'][0]
+                self.assertEqual(change['parameters']['changed']['content']['from'], content)
+        finally:
+            executor.shutdown()
+
+    def test_shared_pool(self):
+        self.assertIs(get_executor(), get_executor())
+
+    def test_catalogue_drift(self):
+        def fetch_catalogues(request, certnames):
+            return dict((certname, {'error': 'No catalogue.'} if certname == 'node4.example.com' else
+                         dict((section, {'data': data}) for section, data in
+                              sections(certname, content='bye' if certname == 'node3.example.com' else 'hello').items()))
+                        for certname in certnames)
+
+        certnames = ['node%d.example.com' % i for i in range(5)]
+        with mock.patch('pano.methods.catalogdrift.fetch_catalogues', side_effect=fetch_catalogues):
+            drift = catalogue_drift(None, sections('baseline.example.com'), certnames, batch_size=2,
+                                    executor=InlineExecutor())
+        self.assertEqual(drift['nodes'], 4)
+        self.assertEqual(drift['errors'], {'node4.example.com': 'No catalogue.'})
+        baseline, changed = drift['clusters']
+        self.assertTrue(baseline['baseline'])
+        self.assertEqual(baseline['certnames'], ['node0.example.com', 'node1.example.com', 'node2.example.com'])
+        self.assertEqual(changed['certnames'], ['node3.example.com'])
+        self.assertEqual(len(changed['resources']['changed_entries']), 1)
@@ -0,0 +1,93 @@
+import json
+from unittest import TestCase, mock
+
+from django.contrib.auth.models import User
+from django.test import RequestFactory
+
+from pano.methods.cataloggraph import CatalogGraph, get_graph
+from pano.views.api.catalogue_data import catalogue_graph_json
+
+__author__ = 'etaklar'
+
+
+def edge(source, relationship, target):
+    source_type, source_title = source.rstrip(']').split('[')
+    target_type, target_title = target.rstrip(']').split('[')
+    return {'source_type': source_type, 'source_title': source_title, 'relationship': relationship,
+            'target_type': target_type, 'target_title': target_title}
+
+
+EDGES = [
+    edge('Class[Ntp]', 'contains', 'Package[ntp]'),
+    edge('Class[Ntp]', 'contains', 'File[/etc/ntp.conf]'),
+    edge('Class[Ntp]', 'contains', 'Service[ntpd]'),
+    edge('Package[ntp]', 'before', 'File[/etc/ntp.conf]'),
+    edge('File[/etc/ntp.conf]', 'notifies', 'Service[ntpd]'),
+    edge('Exec[a]', 'before', 'Exec[b]'),
+    edge('Exec[b]', 'required-by', 'Exec[a]'),
+]
+
+
+class TestCatalogGraph(TestCase):
+    def setUp(self):
+        self.graph = CatalogGraph(EDGES)
+
+    def test_dependencies(self):
+        found, truncated = self.graph.dependencies('Service[ntpd]')
+        self.assertEqual(found, [('File[/etc/ntp.conf]', 1), ('Package[ntp]', 2)])
+        self.assertFalse(truncated)
+        # Containment is not a dependency unless asked for.
+        found, truncated = self.graph.dependents('Class[Ntp]')
+        self.assertEqual(found, [])
+        found, truncated = self.graph.dependents('Package[ntp]', depth=1)
+        self.assertEqual(found, [('File[/etc/ntp.conf]', 1)])
+        self.assertEqual(self.graph.dependents('Package[ntp]', limit=1), ([('File[/etc/ntp.conf]', 1)], True))
+
+    def test_cycles(self):
+        self.assertEqual(self.graph.cycles(), [['Exec[a]', 'Exec[b]']])
+        self.assertEqual(CatalogGraph([edge('Exec[a]', 'before', 'Exec[a]')]).cycles(), [['Exec[a]']])
+
+    def test_neighbourhood(self):
+        neighbourhood = self.graph.neighbourhood('Package[ntp]', depth=1)
+        resources = dict((item['resource'], item) for item in neighbourhood['resources'])
+        self.assertEqual(sorted(resources), ['Class[Ntp]', 'File[/etc/ntp.conf]', 'Package[ntp]'])
+        self.assertEqual([resources[name]['layer'] for name in ('Class[Ntp]', 'Package[ntp]', 'File[/etc/ntp.conf]')],
+                         [0, 1, 2])
+        self.assertNotIn('Service[ntpd]', resources)
+        self.assertEqual(len(neighbourhood['edges']), 3)
+        self.assertEqual(self.graph.layout(['Exec[a]'])['Exec[a]'], {'layer': 0, 'cycle': 0})
+
+    def test_cache(self):
+        graph = get_graph('a' * 40, lambda: EDGES)
+        self.assertIs(get_graph('a' * 40, lambda: self.fail('edges loaded twice')), graph)
+
+
+class TestCatalogueGraphJson(TestCase):
+    def graph_json(self, current_hash, catalogue):
+        paths = []
+
+        def api_get(path, **kwargs):
+            paths.append(path)
+            return [{'hash': current_hash}] if path == '/catalogs' else catalogue
+
+        request = RequestFactory().get('/pano/api/catalogue/graph/node', {'resource': 'Package[ntp]'})
+        request.user = User(username='user')
+        with mock.patch('pano.views.api.catalogue_data.get_server', return_value=('http://puppetdb', None, False)), \
+                mock.patch('pano.views.api.catalogue_data.puppetdb') as puppetdb:
+            puppetdb.api_get.side_effect = api_get
+            response = catalogue_graph_json(request, 'node')
+        return json.loads(response.content.decode('utf-8')), paths
+
+    def test_new_catalogue(self):
+        # The node sent a new catalogue after its hash was fetched, the edges are kept under the new hash.
+        catalogue = {'hash': 'c' * 40, 'edges': {'data': EDGES}}
+        data, paths = self.graph_json('b' * 40, catalogue)
+        self.assertEqual(paths, ['/catalogs', '/catalogs/node'])
+        self.assertEqual(data['catalogue_hash'], 'c' * 40)
+        self.assertEqual(data['resource'], 'Package[ntp]')
+        data, paths = self.graph_json('c' * 40, None)
+        self.assertEqual(paths, ['/catalogs'])
+        self.assertEqual(data['catalogue_hash'], 'c' * 40)
+        data, paths = self.graph_json('b' * 40, {'hash': 'b' * 40, 'edges': {'data': []}})
+        self.assertEqual(paths, ['/catalogs', '/catalogs/node'])
+        self.assertEqual(data['error'], 'Resource not found in the catalogue graph.')
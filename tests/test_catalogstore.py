@@ -0,0 +1,144 @@
+import copy
+import datetime
+import json
+
+from django.test import TestCase
+
+from pano.methods import catalogstore
+from pano.methods.catalogstore import capture_catalogue, compact_catalogues, delete_saved_catalogues, \
+    delete_unused_blobs, diff_saved, load_catalogue, load_section, save_catalogue, thin_out
+from pano.models import CatalogBlob, SavedCatalogs
+
+__author__ = 'etaklar'
+
+
+def make_catalogue(certname, catalogue_hash, content='x'):
+    return {
+        'certname': certname,
+        'hash': catalogue_hash,
+        'producer_timestamp': '2016-01-01T10:00:00.000Z',
+        'environment': 'production',
+        'resources': {
+            'href': '/pdb/query/v4/catalogs/%s/resources' % certname,
+            'data': [
+                {'certname': certname, 'type': 'File', 'title': '/etc/motd', 'parameters': {'content': content}},
+                {'certname': certname, 'type': 'Class', 'title': 'Main', 'parameters': {}},
+            ],
+        },
+        'edges': {
+            'href': '/pdb/query/v4/catalogs/%s/edges' % certname,
+            'data': [
+                {'certname': certname, 'source_type': 'Class', 'source_title': 'Main', 'relationship': 'contains',
+                 'target_type': 'File', 'target_title': '/etc/motd'},
+            ],
+        },
+    }
+
+
+class TestCatalogStore(TestCase):
+    def test_round_trip(self):
+        catalogue = make_catalogue('node1.example.com', 'a' * 40)
+        saved = save_catalogue('node1.example.com', copy.deepcopy(catalogue), 'b' * 40)
+        saved = SavedCatalogs.objects.get(id=saved.id)
+        self.assertEqual(saved.catalogue, '')
+        self.assertEqual(load_catalogue(saved), catalogue)
+        self.assertEqual(load_section(saved, 'edges'), catalogue['edges']['data'])
+
+    def test_deduplication(self):
+        save_catalogue('node1.example.com', make_catalogue('node1.example.com', 'a' * 40), 'r1')
+        save_catalogue('node2.example.com', make_catalogue('node2.example.com', 'a' * 40), 'r2')
+        # Same resources and edges, the meta blobs differ by certname.
+        self.assertEqual(CatalogBlob.objects.count(), 4)
+        save_catalogue('node1.example.com', make_catalogue('node1.example.com', 'c' * 40, content='y'), 'r3')
+        # The meta and the changes of the resources and edges against the previous catalogue of node1.
+        self.assertEqual(CatalogBlob.objects.count(), 7)
+
+    def test_unused_blobs(self):
+        saved = save_catalogue('node1.example.com', make_catalogue('node1.example.com', 'a' * 40), 'r1')
+        save_catalogue('node2.example.com', make_catalogue('node2.example.com', 'a' * 40), 'r2')
+        saved.delete()
+        self.assertEqual(delete_unused_blobs(), 1)
+        self.assertEqual(CatalogBlob.objects.count(), 3)
+
+    def test_compact(self):
+        catalogue = make_catalogue('node1.example.com', 'a' * 40)
+        saved = SavedCatalogs.objects.create(hostname='node1.example.com',
+                                             catalogue_id='a' * 40,
+                                             linked_report='r1',
+                                             timestamp=catalogue['producer_timestamp'],
+                                             catalogue=json.dumps(catalogue))
+        self.assertEqual(load_section(saved, 'resources'), catalogue['resources']['data'])
+        self.assertEqual(compact_catalogues(), 1)
+        saved = SavedCatalogs.objects.get(id=saved.id)
+        self.assertEqual(saved.catalogue, '')
+        self.assertEqual(load_catalogue(saved), catalogue)
+
+    def test_capture(self):
+        catalogue = make_catalogue('node1.example.com', 'a' * 40)
+        saved, old_linked_report = capture_catalogue('node1.example.com', copy.deepcopy(catalogue), 'r1')
+        self.assertIsNone(old_linked_report)
+        self.assertEqual(capture_catalogue('node1.example.com', copy.deepcopy(catalogue), 'r1'), (saved, 'r1'))
+        self.assertEqual(capture_catalogue('node1.example.com', copy.deepcopy(catalogue), 'r2')[1], 'r1')
+        self.assertEqual(SavedCatalogs.objects.get().linked_report, 'r2')
+
+
+class TestCatalogHistory(TestCase):
+    def setUp(self):
+        self.interval = catalogstore.CATALOG_KEYFRAME_INTERVAL
+        catalogstore.CATALOG_KEYFRAME_INTERVAL = 3
+        self.saved = []
+        for version in range(5):
+            catalogue = make_catalogue('node1.example.com', '%040d' % version, content=str(version))
+            # Every version adds a resource.
+            catalogue['resources']['data'].extend({'certname': 'node1.example.com', 'type': 'Package',
+                                                   'title': 'pkg%d' % i, 'parameters': {}} for i in range(version))
+            self.saved.append((catalogue, save_catalogue('node1.example.com', copy.deepcopy(catalogue), 'r')))
+
+    def tearDown(self):
+        catalogstore.CATALOG_KEYFRAME_INTERVAL = self.interval
+
+    def test_keyframes(self):
+        self.assertEqual([saved.depth for catalogue, saved in self.saved], [0, 1, 2, 0, 1])
+        self.assertEqual(self.saved[2][1].base_id, self.saved[1][1].id)
+        self.assertIsNone(self.saved[3][1].base_id)
+
+    def test_load(self):
+        key = lambda resource: (resource['type'], resource['title'])
+        for catalogue, saved in self.saved:
+            saved = SavedCatalogs.objects.get(id=saved.id)
+            self.assertEqual(sorted(load_section(saved, 'resources'), key=key),
+                             sorted(catalogue['resources']['data'], key=key))
+            self.assertEqual(load_section(saved, 'edges'), catalogue['edges']['data'])
+
+    def test_diff(self):
+        first, third = self.saved[0][1], self.saved[2][1]
+        diff = diff_saved(first, third, 'resources')
+        self.assertEqual(sorted(resource['title'] for resource in diff['added']), ['pkg0', 'pkg1'])
+        self.assertEqual(diff['removed'], [])
+        self.assertEqual(diff['changed'], [[{'type': 'File', 'title': '/etc/motd', 'parameters': {'content': '0'}},
+                                            {'type': 'File', 'title': '/etc/motd', 'parameters': {'content': '2'}}]])
+        reverse = diff_saved(third, first, 'resources')
+        self.assertEqual(reverse['removed'], diff['added'])
+        # Not in the same chain of changes.
+        self.assertIsNone(diff_saved(first, self.saved[4][1], 'resources'))
+
+    def test_delete(self):
+        # The second catalogue is the base of the third, the first the base of the second.
+        delete_saved_catalogues('node1.example.com', [self.saved[0][1].id, self.saved[1][1].id])
+        key = lambda resource: (resource['type'], resource['title'])
+        third = SavedCatalogs.objects.get(id=self.saved[2][1].id)
+        self.assertIsNone(third.base_id)
+        self.assertEqual(sorted(load_catalogue(third)['resources']['data'], key=key),
+                         sorted(self.saved[2][0]['resources']['data'], key=key))
+        self.assertEqual(SavedCatalogs.objects.count(), 3)
+
+
+class TestRetention(TestCase):
+    def test_thin_out(self):
+        now = datetime.datetime(2016, 3, 1, 12, tzinfo=datetime.timezone.utc)
+        timestamps = [(i, now - datetime.timedelta(hours=8 * i)) for i in range(20)]
+        doomed = thin_out(timestamps, keep=3, days=4, now=now)
+        kept = sorted(set(range(20)) - doomed)
+        # The three newest, then the newest of each day back to four days ago.
+        self.assertEqual(kept, [0, 1, 2, 3, 5, 8, 11])
+        self.assertEqual(thin_out(timestamps[:3], keep=3, days=0, now=now), set())
@@ -0,0 +1,35 @@
+from unittest import TestCase
+
+from pano.puppetdb.certindex import CertnameIndex
+
+__author__ = 'etaklar'
+
+
+class TestCertnameIndex(TestCase):
+    def setUp(self):
+        self.index = CertnameIndex(['web02.dc1.example.com', 'web01.dc1.example.com', 'db01.dc2.example.com',
+                                    'Mail01.dc1.example.com', 'lb01.dc2.example.com'])
+
+    def test_prefix(self):
+        self.assertEqual(self.index.prefix('web'), ['web01.dc1.example.com', 'web02.dc1.example.com'])
+        self.assertEqual(self.index.prefix('web', limit=1), ['web01.dc1.example.com'])
+        self.assertEqual(self.index.prefix('x'), [])
+
+    def test_prefix_case_insensitive(self):
+        self.assertEqual(self.index.prefix('mail'), ['Mail01.dc1.example.com'])
+
+    def test_substring(self):
+        self.assertEqual(self.index.substring('dc2'), ['db01.dc2.example.com', 'lb01.dc2.example.com'])
+        # A certname matching several times is returned once.
+        self.assertEqual(self.index.substring('e'), self.index.certnames)
+        self.assertEqual(self.index.substring('nomatch'), [])
+
+    def test_search_prefix_first(self):
+        index = CertnameIndex(['a-db01.example.com', 'db02.example.com', 'db01.example.com'])
+        self.assertEqual(index.search('db'), ['db01.example.com', 'db02.example.com', 'a-db01.example.com'])
+        self.assertEqual(index.search('db', limit=2), ['db01.example.com', 'db02.example.com'])
+
+    def test_update(self):
+        self.index.update(added=['web03.dc1.example.com'], removed=['web01.dc1.example.com'])
+        self.assertEqual(self.index.prefix('web'), ['web02.dc1.example.com', 'web03.dc1.example.com'])
+        self.assertEqual(len(self.index), 5)
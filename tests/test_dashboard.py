@@ -0,0 +1,42 @@
+from unittest import TestCase
+from unittest.mock import Mock, patch
+
+from pano.methods.dashboard import federated_dashboard, merge_counts
+
+__author__ = 'etaklar'
+
+
+class TestMergeCounts(TestCase):
+    def test_merge_counts(self):
+        merged = merge_counts([
+            {'population': 10, 'total_resource': 1000, 'avg_resource': '100.00', 'failed_nodes': 1},
+            {'population': 30, 'total_resource': 1000, 'avg_resource': '33.33', 'failed_nodes': 2},
+        ])
+        self.assertEqual(merged, {'population': 40, 'total_resource': 2000, 'avg_resource': '50.00',
+                                  'failed_nodes': 3})
+
+    def test_merge_no_counts(self):
+        self.assertEqual(merge_counts([]), {'avg_resource': '0.00'})
+
+
+class TestFederatedDashboard(TestCase):
+    def _federated(self, sources):
+        request = Mock(session={})
+        counts = {'population': 2, 'total_resource': 20, 'avg_resource': '10.00', 'failed_nodes': 0}
+        with patch('pano.methods.dashboard.AVAILABLE_SOURCES', sources), \
+                patch('pano.methods.dashboard.set_server') as set_server, \
+                patch('pano.methods.dashboard.dashboard_status', return_value=(counts, {}, [])):
+            return federated_dashboard(request, timeout=5), set_server
+
+    def test_replica_list_source(self):
+        context, set_server = self._federated([['http://puppetdb1:8080', 'http://puppetdb2:8080']])
+        self.assertEqual(list(context['sources']), ['default'])
+        self.assertEqual(context['sources']['default']['state'], 'ok')
+        self.assertEqual(context['population'], 2)
+        self.assertFalse(set_server.called)
+
+    def test_named_sources(self):
+        context, set_server = self._federated({'prod': {}, 'test': {}})
+        self.assertEqual(sorted(context['sources']), ['prod', 'test'])
+        self.assertEqual(context['population'], 4)
+        self.assertEqual(set_server.call_count, 2)
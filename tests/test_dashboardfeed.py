@@ -0,0 +1,60 @@
+import json
+from unittest import TestCase
+
+from django.contrib.auth.models import User
+from django.test import RequestFactory, TestCase as DjangoTestCase
+
+from pano.methods.dashboardfeed import DashboardFeed, format_event
+from pano.views.api.dashboard_data import dashboard_events
+
+__author__ = 'etaklar'
+
+
+class FakeRequest(object):
+    def __init__(self):
+        self.session = {}
+
+
+class TestDashboardFeed(TestCase):
+    def setUp(self):
+        self.feed = DashboardFeed(FakeRequest())
+        self.counts = {'population': 2, 'failed_nodes': 0}
+        self.feed.publish(self.counts, {'a.example.com': 'unchanged', 'b.example.com': 'changed'})
+
+    def test_first_publish(self):
+        self.assertEqual([event[1] for event in self.feed.events], ['dashboard'])
+        self.assertEqual(json.loads(self.feed.events[0][2]), self.counts)
+
+    def test_transitions(self):
+        counts = {'population': 2, 'failed_nodes': 1}
+        self.feed.publish(counts, {'a.example.com': 'failed', 'c.example.com': 'unchanged'})
+        event_id, name, data = self.feed.events[-1]
+        self.assertEqual((event_id, name), (3, 'nodes'))
+        self.assertEqual(json.loads(data), [
+            {'certname': 'a.example.com', 'status': 'failed', 'previous': 'unchanged'},
+            {'certname': 'b.example.com', 'status': None, 'previous': 'changed'},
+            {'certname': 'c.example.com', 'status': 'unchanged', 'previous': None},
+        ])
+
+    def test_unchanged_publish(self):
+        self.feed.publish(dict(self.counts), {'a.example.com': 'unchanged', 'b.example.com': 'changed'})
+        self.assertEqual(self.feed.event_id, 1)
+
+    def test_resume(self):
+        self.feed.publish(self.counts, {'a.example.com': 'failed', 'b.example.com': 'changed'})
+        self.assertEqual([event[0] for event in self.feed._pending(1)], [2])
+        self.assertEqual(self.feed._pending(2), [])
+        # Unknown ids get the current counts.
+        self.assertEqual([event[:2] for event in self.feed._pending(50)], [(2, 'dashboard')])
+        self.assertEqual([event[:2] for event in self.feed._pending(None)], [(2, 'dashboard')])
+
+    def test_format_event(self):
+        self.assertEqual(format_event(1, 'dashboard', '{}'), 'id: 1\nevent: dashboard\ndata: {}\n\n')
+
+
+class TestDashboardEvents(DjangoTestCase):
+    def test_disabled(self):
+        # Without DASHBOARD_PUSH the pages do not stream and the events url does not hold a thread.
+        request = RequestFactory().get('/pano/api/dashboard/events')
+        request.user = User(username='user')
+        self.assertEqual(dashboard_events(request).status_code, 204)
@@ -0,0 +1,41 @@
+import gzip
+from unittest import TestCase
+
+from django.test import RequestFactory
+
+from pano.views.api.export_data import accepts_gzip, gzip_stream, ndjson_response
+
+__author__ = 'etaklar'
+
+
+class TestGzipStream(TestCase):
+    def test_gzip_stream(self):
+        lines = [('{"certname": "node%d.example.com"}\n' % i).encode('utf-8') for i in range(250)]
+        chunks = list(gzip_stream(iter(lines)))
+        # Flushed every 100 lines plus the end of the stream.
+        self.assertGreaterEqual(len(chunks), 3)
+        self.assertEqual(gzip.decompress(b''.join(chunks)), b''.join(lines))
+
+    def test_gzip_stream_empty(self):
+        self.assertEqual(gzip.decompress(b''.join(gzip_stream(iter([])))), b'')
+
+
+
+class TestNdjsonResponse(TestCase):
+    def test_accepts_gzip(self):
+        for header, accepted in (('gzip, deflate', True), ('deflate, gzip;q=0.5', True), ('GZIP', True),
+                                 ('*', True), ('gzip;q=0', False), ('gzip; q=0.0, *', False),
+                                 ('*;q=0', False), ('identity', False), ('', False)):
+            request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING=header)
+            self.assertEqual(accepts_gzip(request), accepted, header)
+
+    def test_ndjson_response(self):
+        records = [{'certname': 'node1.example.com'}, {'certname': 'node2.example.com'}]
+        expected = b'{"certname": "node1.example.com"}\n{"certname": "node2.example.com"}\n'
+        response = ndjson_response(RequestFactory().get('/', HTTP_ACCEPT_ENCODING='gzip;q=0'), records)
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(b''.join(response.streaming_content), expected)
+        response = ndjson_response(RequestFactory().get('/', {'gzip': 'true'}), records)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), expected)
@@ -0,0 +1,112 @@
+import hashlib
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from django.conf.urls import url
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+
+from pano.methods.filebucket import get_file
+from pano.methods.filecache import ContentStore
+from pano.methods.textdiff import diff_files
+from pano.views.filebucket import filebucket
+
+__author__ = 'etaklar'
+
+urlpatterns = [
+    url(r'^filebucket/$', filebucket),
+]
+
+DIFF_PARAMS = {'certname': 'node1.example.com', 'environment': 'production', 'rtype': 'File', 'rtitle': '/etc/motd',
+               'md5_from': '{md5}d41d8cd98f00b204e9800998ecf8427e', 'md5_to': '{md5}d41d8cd98f00b204e9800998ecf8427e',
+               'file_status': 'both', 'diff': 'true'}
+
+
+@override_settings(ROOT_URLCONF='tests.test_filebucket')
+class TestFilebucketView(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('user', password='secret'))
+
+    def test_diff_identical_files(self):
+        text = 'Welcome to node1\nManaged by Puppet\n'
+        with mock.patch('pano.views.filebucket.get_filebucket',
+                        side_effect=lambda **kwargs: diff_files(text, text, from_md5='1' * 32, to_md5='1' * 32)):
+            # The second time the diff is kept.
+            for i in range(2):
+                response = self.client.get('/filebucket/', DIFF_PARAMS)
+                self.assertIn(b'No diff is available.', response.content)
+
+    def test_diff(self):
+        with mock.patch('pano.views.filebucket.get_filebucket',
+                        side_effect=lambda **kwargs: diff_files('Welcome\n', 'Welcome to node1\n')):
+            response = self.client.get('/filebucket/', DIFF_PARAMS)
+            content = b''.join(response.streaming_content)
+        self.assertNotIn(b'No diff is available.', content)
+        self.assertIn(b'Welcome to node1', content)
+        # The markup around the diff is that of the filebucket page.
+        self.assertTrue(content.startswith(b'<!DOCTYPE html>'))
+        self.assertIn(b'<pre><br>', content)
+        self.assertTrue(content.rstrip().endswith(b'</pre>\n\n</body>\n</html>'))
+
+
+OLD_FILE = b'Welcome to node1\n'
+NEW_FILE = b'Welcome to node1\nManaged by Puppet\n'
+OLD_MD5 = hashlib.md5(OLD_FILE).hexdigest()
+NEW_MD5 = hashlib.md5(NEW_FILE).hexdigest()
+
+
+def get_server(request, type='puppetdb'):
+    if type == 'puppetdb':
+        return 'http://puppetdb.local:8080/', None, False
+    return 'https://puppet.local:8140/puppet/v3/', None, False, True
+
+
+class TestGetFile(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.store = ContentStore(directory, 1024 * 1024)
+        # md5: body the filebucket has
+        self.filebucket = {OLD_MD5: OLD_FILE, NEW_MD5: NEW_FILE}
+        self.resources = [{'parameters': {'content': NEW_FILE.decode('utf-8')}}]
+        for target, replacement in (('pano.methods.filebucket.get_server', get_server),
+                                    ('pano.methods.filebucket.get_store', lambda: self.store),
+                                    ('pano.methods.filecache.get_store', lambda: self.store)):
+            patcher = mock.patch(target, replacement)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch('pano.methods.filebucket.requests.get', side_effect=self.requests_get)
+        self.requests_get_mock = patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch('pano.methods.filebucket.pdb_api_get',
+                             side_effect=lambda **kwargs: self.resources)
+        self.pdb_api_get = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def requests_get(self, url, **kwargs):
+        body = self.filebucket.get(url.rsplit('/', 1)[-1])
+        return mock.Mock(status_code=404 if body is None else 200, content=body, headers={}, encoding=None)
+
+    def get_diff(self):
+        return get_file(request=None, certname='node1.example.com', environment='production', rtitle='/etc/motd',
+                        rtype='File', md5sum_from='{md5}' + OLD_MD5, md5sum_to='{md5}' + NEW_MD5, diff=True,
+                        file_status='both')
+
+    def test_from_missing(self):
+        del self.filebucket[OLD_MD5]
+        self.assertIs(self.get_diff(), False)
+
+    def test_to_from_resource(self):
+        del self.filebucket[NEW_MD5]
+        self.assertIn('+Managed by Puppet', list(self.get_diff()))
+        # The resource was looked up alongside the filebucket.
+        self.assertEqual(self.pdb_api_get.call_count, 1)
+
+    def test_to_cached(self):
+        self.store.put(NEW_FILE)
+        self.assertIn('+Managed by Puppet', list(self.get_diff()))
+        self.assertEqual(self.pdb_api_get.call_count, 0)
+        # Only the old file was fetched from the filebucket.
+        self.assertEqual(self.requests_get_mock.call_count, 1)
@@ -0,0 +1,77 @@
+import shutil
+import tempfile
+from unittest import TestCase
+
+from pano.methods.filecache import ContentStore, decode_body, filebucket_body, fileserver_body, get_md5
+
+__author__ = 'etaklar'
+
+
+class TestFileCache(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.store = ContentStore(self.directory, 10)
+
+    def test_store(self):
+        md5 = self.store.put(b'hello')
+        self.assertEqual(md5, get_md5(b'hello'))
+        self.assertEqual(self.store.get(md5), b'hello')
+        self.assertIn(md5, self.store)
+        # A body that does not match its md5 is not kept.
+        self.store.put(b'world', md5='0' * 32)
+        self.assertIsNone(self.store.get('0' * 32))
+        self.assertIsNone(self.store.get(get_md5(b'world')))
+        # The bodies are found again after a restart.
+        self.assertEqual(ContentStore(self.directory, 10).get(md5), b'hello')
+
+    def test_eviction(self):
+        first, second = self.store.put(b'first'), self.store.put(b'other')
+        self.store.get(first)
+        third = self.store.put(b'third')
+        self.assertIsNone(self.store.get(second))
+        self.assertEqual((self.store.get(first), self.store.get(third)), (b'first', b'third'))
+        self.assertEqual(self.store.size, 10)
+        # Larger than the whole cache.
+        self.store.put(b'far too large')
+        self.assertEqual(self.store.get(first), b'first')
+
+    def test_fetch_once(self):
+        fetched = []
+
+        def fetch(body):
+            fetched.append(body)
+            return body, None
+
+        md5 = get_md5(b'hello')
+        for i in range(2):
+            self.assertEqual(filebucket_body(md5, lambda: fetch(b'hello'), self.store), (b'hello', None))
+            self.assertEqual(fileserver_body('https://puppet/', 'production', 'files/motd', lambda: fetch(b'motd'),
+                                             self.store), (b'motd', None))
+        self.assertEqual(fetched, [b'hello', b'motd'])
+        self.assertEqual(filebucket_body('1' * 32, lambda: (None, None), self.store), (None, None))
+        # Fetched again once the ttl passed.
+        self.assertEqual(fileserver_body('https://puppet/', 'production', 'files/motd', lambda: fetch(b'new'),
+                                         self.store, ttl=0), (b'new', None))
+
+    def test_charset_from_cache(self):
+        body = '\u041c\u0438\u0440'.encode('koi8-r')
+        md5 = get_md5(body)
+        self.assertEqual(filebucket_body(md5, lambda: (body, 'koi8-r'), self.store), (body, 'koi8-r'))
+        # Read back from the cache, also after a restart, with the charset the filebucket declared.
+        for store in (self.store, ContentStore(self.directory, 10)):
+            cached, charset = filebucket_body(md5, lambda: self.fail('fetched again'), store)
+            self.assertEqual(decode_body(cached, charset), '\u041c\u0438\u0440')
+        # The charset files are not counted as bodies.
+        restarted = ContentStore(self.directory, 10)
+        self.assertIn(md5, restarted)
+        self.assertEqual(restarted.size, len(body))
+        self.store.put(b'evicted!!!')
+        self.assertIsNone(self.store.get_charset(md5))
+
+    def test_decode(self):
+        self.assertEqual(decode_body('caf\u00e9'.encode('utf-8')), 'caf\u00e9')
+        # Not UTF-8 and no charset declared.
+        self.assertEqual(decode_body('caf\u00e9'.encode('latin-1')), 'caf\u00e9')
+        self.assertEqual(decode_body('\u041c\u0438\u0440'.encode('koi8-r'), 'koi8-r'), '\u041c\u0438\u0440')
+        self.assertEqual(decode_body(b'caf\xc3\xa9', 'no-such-charset'), 'caf\u00e9')
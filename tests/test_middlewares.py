@@ -0,0 +1,66 @@
+import json
+import time
+
+from django.conf.urls import url
+from django.contrib.auth.models import User
+from django.http import HttpResponse
+from django.test import TestCase, override_settings
+
+from pano.puppetdb import puppetdb, resilience
+from pano.settings import PUPPETDB_HOST
+from pano.views.api.fact_data import facts_json
+
+__author__ = 'etaklar'
+
+
+def deadline_view(request):
+    return HttpResponse(json.dumps(resilience.current_deadline()), content_type='application/json')
+
+
+def puppetdb_view(request):
+    return HttpResponse(json.dumps(puppetdb.api_get(api_url=PUPPETDB_HOST, path='/nodes')))
+
+
+urlpatterns = [
+    url(r'^deadline/$', deadline_view),
+    url(r'^puppetdb/$', puppetdb_view),
+    url(r'^pano/api/facts/$', facts_json),
+]
+
+
+@override_settings(ROOT_URLCONF='tests.test_middlewares')
+class TestMiddlewares(TestCase):
+    def test_deadline(self):
+        # Served through the middleware of the settings, the view runs within the deadline.
+        response = self.client.get('/deadline/')
+        self.assertIsNotNone(json.loads(response.content.decode('utf-8')))
+        self.assertIsNone(resilience.current_deadline())
+
+    def test_profiler(self):
+        user = User.objects.create_user('staff', password='secret')
+        self.client.force_login(user)
+        # Only staff users get the profile.
+        response = self.client.get('/deadline/?_profile=1')
+        self.assertEqual(response['Content-Type'], 'application/json')
+        user.is_staff = True
+        user.save()
+        response = self.client.get('/deadline/?_profile=1')
+        self.assertEqual(response['Content-Type'], 'text/plain')
+        self.assertIn('PuppetDB requests: 0', response.content.decode('utf-8'))
+        self.assertEqual(self.client.get('/deadline/?_profile=true')['Content-Type'], 'text/plain')
+        for value in ('0', 'false', ''):
+            response = self.client.get('/deadline/', {'_profile': value})
+            self.assertEqual(response['Content-Type'], 'application/json')
+
+    def test_puppetdb_unavailable(self):
+        self.client.force_login(User.objects.create_user('user', password='secret'))
+        breaker = resilience.get_breaker(PUPPETDB_HOST)
+        self.addCleanup(resilience._breakers.pop, PUPPETDB_HOST, None)
+        breaker.opened = time.time()
+        response = self.client.get('/pano/api/facts/', {'certname': 'node1.example.com'})
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('not querying it for now', json.loads(response.content.decode('utf-8'))['error'])
+        self.assertIn('Retry-After', response)
+        response = self.client.get('/puppetdb/')
+        self.assertEqual(response.status_code, 503)
+        self.assertIn(b'<h1>PuppetDB unavailable</h1>', response.content)
@@ -0,0 +1,97 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from pano.puppetdb.mirror import FleetMirror, sort_nodes
+from pano.puppetdb.pdbutils import latest_timestamp, timestamp_before
+
+__author__ = 'etaklar'
+
+
+def node(certname, timestamp, status='unchanged'):
+    return {'certname': certname, 'report_timestamp': timestamp, 'facts_timestamp': timestamp,
+            'catalog_timestamp': timestamp, 'latest_report_status': status, 'deactivated': None}
+
+
+def counts(certname, failures=0):
+    return {'subject_type': 'certname', 'subject': {'title': certname}, 'successes': 1, 'failures': failures,
+            'noops': 0, 'skips': 0}
+
+
+class StaticMirror(FleetMirror):
+    """FleetMirror answering from lists instead of PuppetDB."""
+
+    def __init__(self, sqlite_path=None):
+        self.active = []
+        self.removed = []
+        self.events_by_certname = {}
+        super(StaticMirror, self).__init__('http://puppetdb:8080', (None, None), False, sqlite_path)
+
+    def _api_get(self, path, params):
+        if path == '/event-counts':
+            return list(self.events_by_certname.values())
+        if params['query'].startswith('["extract"'):
+            return [{'certname': n} for n in self.removed]
+        return list(self.active)
+
+
+class TestFleetMirror(TestCase):
+    def setUp(self):
+        self.mirror = StaticMirror()
+        self.mirror.active = [node('a.example.com', '2015-06-01T10:00:00.000Z'),
+                              node('b.example.com', '2015-06-01T11:00:00.000Z', 'failed')]
+        self.mirror.events_by_certname = {'b.example.com': counts('b.example.com', 2)}
+        self.mirror.refresh()
+
+    def test_full_refresh(self):
+        state = self.mirror.state()
+        self.assertEqual(sorted(n['certname'] for n in state['all_nodes']), ['a.example.com', 'b.example.com'])
+        self.assertEqual(state['event_counts'], [counts('b.example.com', 2)])
+        self.assertIn({'certname': 'b.example.com', 'status': 'failed'}, state['reports'])
+        self.assertEqual(self.mirror.watermark, '2015-06-01T11:00:00.000Z')
+
+    def test_incremental_refresh(self):
+        self.mirror.active = [node('c.example.com', '2015-06-01T12:00:00.000Z')]
+        self.mirror.events_by_certname = {'c.example.com': counts('c.example.com')}
+        self.mirror.removed = ['a.example.com']
+        self.mirror.refresh()
+        state = self.mirror.state()
+        self.assertEqual(sorted(n['certname'] for n in state['all_nodes']), ['b.example.com', 'c.example.com'])
+        self.assertEqual(len(state['event_counts']), 2)
+        self.assertEqual(self.mirror.last_changed, {'a.example.com', 'c.example.com'})
+        self.assertEqual(self.mirror.watermark, '2015-06-01T12:00:00.000Z')
+
+    def test_sqlite(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'mirror.sqlite3')
+            mirror = StaticMirror(path)
+            mirror.active = self.mirror.active
+            mirror.events_by_certname = self.mirror.events_by_certname
+            mirror.refresh()
+
+            loaded = StaticMirror(path)
+            self.assertEqual(loaded.nodes, mirror.nodes)
+            self.assertEqual(loaded.events, mirror.events)
+            self.assertEqual(loaded.watermark, mirror.watermark)
+            # Loaded mirrors sync the changes on first use instead of reloading everything.
+            self.assertIsNone(loaded.refreshed)
+            self.assertIsNotNone(loaded.full_refreshed)
+        finally:
+            shutil.rmtree(directory)
+
+
+class TestMirrorFunctions(TestCase):
+    def test_sort_nodes(self):
+        nodes = [{'certname': 'a', 'report_timestamp': '2015-06-01T10:00:00.000Z'},
+                 {'certname': 'b', 'report_timestamp': None},
+                 {'certname': 'c', 'report_timestamp': '2015-06-01T11:00:00.000Z'}]
+        self.assertEqual([n['certname'] for n in sort_nodes(nodes, 'report_timestamp', 'desc')], ['c', 'a', 'b'])
+        self.assertEqual([n['certname'] for n in sort_nodes(nodes, 'report_timestamp', 'asc')], ['a', 'c', 'b'])
+
+    def test_timestamps(self):
+        self.assertEqual(timestamp_before('2015-06-01T10:00:00.000Z', 600), '2015-06-01T09:50:00.000000Z')
+        self.assertEqual(latest_timestamp([{'a': '2015-06-01T10:00:00.000Z', 'b': None},
+                                           {'a': '2015-06-01T09:00:00.000Z', 'b': '2015-06-02T09:00:00.000Z'}],
+                                          ('a', 'b')), '2015-06-02T09:00:00.000Z')
@@ -0,0 +1,81 @@
+import datetime
+import json
+from unittest import TestCase, mock
+
+from django.contrib.auth.models import User
+from django.test import RequestFactory
+
+from pano.methods.nodechanges import changed_nodes, format_timestamp, parse_since
+from pano.views.api.node_data import nodes_changes_json
+
+__author__ = 'etaklar'
+
+
+class TestParseSince(TestCase):
+    def test_utc(self):
+        self.assertEqual(parse_since('2015-06-01T10:00:00Z'), '2015-06-01T10:00:00.000Z')
+        self.assertEqual(parse_since('2015-06-01T10:00:00.123456Z'), '2015-06-01T10:00:00.123Z')
+
+    def test_offset(self):
+        self.assertEqual(parse_since('2015-06-01T12:00:00+02:00'), '2015-06-01T10:00:00.000Z')
+
+    def test_naive_is_utc(self):
+        self.assertEqual(parse_since('2015-06-01T10:00:00'), '2015-06-01T10:00:00.000Z')
+        self.assertEqual(format_timestamp(datetime.datetime(2015, 6, 1, 10)), '2015-06-01T10:00:00.000Z')
+
+    def test_invalid(self):
+        self.assertIsNone(parse_since(None))
+        self.assertIsNone(parse_since('yesterday'))
+        self.assertIsNone(parse_since('2015-13-01T10:00:00Z'))
+
+
+def get_server(request, type='puppetdb'):
+    if type == 'run_time':
+        return 60
+    return 'http://puppetdb.local:8080/', None, False
+
+
+class TestChangedNodes(TestCase):
+    def setUp(self):
+        self.jobs = {}
+        self.results = {
+            'changed': [{'certname': 'node1.example.com', 'report_timestamp': '2015-06-01T10:05:00.000Z',
+                         'facts_timestamp': '2015-06-01T10:04:00.000Z', 'catalog_timestamp': None}],
+            'removed': [{'certname': 'node2.example.com', 'deactivated': '2015-06-01T10:07:00.000Z',
+                         'expired': None}],
+        }
+        for target, replacement in (('pano.methods.nodechanges.get_server', get_server),
+                                    ('pano.methods.nodechanges.run_puppetdb_jobs', self.run_jobs),
+                                    ('pano.methods.nodechanges.node_records',
+                                     lambda request, nodes: [{'certname': node['certname']} for node in nodes])):
+            patcher = mock.patch(target, replacement)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def run_jobs(self, jobs):
+        self.jobs = jobs
+        return self.results
+
+    def test_changes(self):
+        changes = changed_nodes(None, '2015-06-01T10:00:00.000Z', now=datetime.datetime(2015, 6, 1, 12))
+        # Reports stored late with an earlier timestamp are found by looking back 10 minutes.
+        query = self.jobs['changed']['params']['query'][1]
+        self.assertIn('[">","report_timestamp","2015-06-01T09:50:00.000000Z"]', query)
+        self.assertIn('["<=","report_timestamp","2015-06-01T11:00:00.000Z"]', query)
+        self.assertIn('[">","deactivated","2015-06-01T09:50:00.000000Z"]', self.jobs['removed']['params']['query'][1])
+        self.assertEqual(changes['since'], '2015-06-01T10:00:00.000Z')
+        self.assertEqual(changes['watermark'], '2015-06-01T10:07:00.000Z')
+        self.assertEqual(changes['nodes'], [{'certname': 'node1.example.com'}])
+        self.assertEqual(changes['removed'], ['node2.example.com'])
+
+    def test_nothing_changed(self):
+        self.results = {}
+        self.assertEqual(changed_nodes(None, '2015-06-01T10:00:00.000Z')['watermark'], '2015-06-01T10:00:00.000Z')
+
+    def test_invalid_since(self):
+        request = RequestFactory().get('/pano/api/nodes/changes', {'since': 'yesterday'})
+        request.user = User(username='user')
+        response = nodes_changes_json(request)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(json.loads(response.content.decode('utf-8')),
+                         {'error': 'since must be an ISO 8601 timestamp.'})
@@ -0,0 +1,52 @@
+import json
+from unittest import TestCase, mock
+
+from pano.methods.nodeexport import _node_sorted_pages, _status_sorted_pages, certname_filter, parse_facts
+
+__author__ = 'etaklar'
+
+
+class TestNodeExport(TestCase):
+    def test_parse_facts(self):
+        self.assertEqual(parse_facts('kernel, ipaddress,,operatingsystem '), ['kernel', 'ipaddress', 'operatingsystem'])
+
+    def test_parse_no_facts(self):
+        self.assertEqual(parse_facts(False), [])
+        self.assertEqual(parse_facts(''), [])
+
+    def test_certname_filter(self):
+        query = json.loads(certname_filter(['node1.example.com', 'node2.example.com']))
+        self.assertEqual(query, ['or', ['=', 'certname', 'node1.example.com'], ['=', 'certname', 'node2.example.com']])
+
+
+class TestExportPages(TestCase):
+    def setUp(self):
+        self.nodes = [{'certname': 'node%d.example.com' % i, 'report_timestamp': '2016-01-01T00:00:%02d.000Z' % i}
+                      for i in range(10)]
+        patcher = mock.patch('pano.methods.nodeexport._api_get', side_effect=self.api_get)
+        self.api_get_mock = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def api_get(self, request, path, params):
+        if path == '/event-counts':
+            return [{'subject': {'title': node['certname']}} for node in self.nodes[::-1]]
+        query = params['query'][1]
+        if 'extract' in params['query']:
+            return sorted(self.nodes, key=lambda node: node['report_timestamp'], reverse=True)
+        # A node reports while the export runs and would move to the first page.
+        self.nodes[0]['report_timestamp'] = '2016-01-01T00:01:00.000Z'
+        certnames = [condition[2] for condition in json.loads(query)[1:]]
+        return [node for node in self.nodes if node['certname'] in certnames]
+
+    def test_node_sorted(self):
+        pages = list(_node_sorted_pages(None, None, 'report_timestamp', 'desc', 3))
+        certnames = [node['certname'] for node_list, report_list in pages for node in node_list]
+        # Every node once, in the order of the start of the export.
+        self.assertEqual(certnames, ['node%d.example.com' % i for i in range(9, -1, -1)])
+        self.assertEqual([len(node_list) for node_list, report_list in pages], [3, 3, 3, 1])
+
+    def test_status_sorted(self):
+        pages = list(_status_sorted_pages(None, None, 'failures', 'desc', 4))
+        self.assertEqual([node['certname'] for node_list, report_list in pages for node in node_list],
+                         ['node%d.example.com' % i for i in range(9, -1, -1)])
+        self.assertEqual(self.api_get_mock.call_count, 4)
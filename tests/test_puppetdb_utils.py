@@ -1,7 +1,11 @@
+import threading
+import time
 from datetime import datetime, timedelta
 from django.test import TestCase
 
 from pano.puppetdb.pdbutils import is_unreported
+from pano.puppetdb import admission, resilience, tracing
+from pano.puppetdb.pdbutils import in_context
 
 __author__ = 'etaklar'
 
@@ -55,3 +59,27 @@ def test_unreported_date_with_hours_set_to_24_hours(self):
         date = (datetime.utcnow() - timedelta(hours=25)).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
         results = is_unreported(date, unreported=24*60)
         self.assertEquals(results, True)
+
+
+class RunInContext(TestCase):
+    def run_in_thread(self, function):
+        results = []
+        worker = threading.Thread(target=lambda: results.append(function()))
+        worker.start()
+        worker.join()
+        return results[0]
+
+    def current(self):
+        return tracing.current_trace(), resilience.current_deadline(), admission.current_priority()
+
+    def test_context_of_caller(self):
+        trace = tracing.start_trace()
+        self.addCleanup(tracing.stop_trace)
+        with resilience.deadline(60), admission.priority(admission.EXPORT):
+            context = self.current()
+            self.assertEqual(self.run_in_thread(in_context(self.current)), context)
+            self.assertIs(context[0], trace)
+            # A sooner deadline replaces the caller's, a later one does not.
+            soon = time.time() + 1
+            self.assertEqual(self.run_in_thread(in_context(self.current, until=soon))[1], soon)
+            self.assertEqual(self.run_in_thread(in_context(self.current, until=soon + 3600))[1], context[1])
@@ -0,0 +1,110 @@
+import threading
+import time
+from unittest import TestCase
+
+import requests
+
+from pano.puppetdb.replicas import ReplicaSet, _replica_sets, register, send_request
+
+__author__ = 'etaklar'
+
+
+class FakeResponse(object):
+    def __init__(self, status_code=200):
+        self.status_code = status_code
+
+
+class TestReplicaSet(TestCase):
+    def setUp(self):
+        self.replica_set = ReplicaSet(['http://db1:8080', 'http://db2:8080/'], max_failures=2, eject_time=30)
+        self.db1, self.db2 = self.replica_set.endpoints
+
+    def test_lowest_latency_first(self):
+        self.replica_set.begin(self.db1)
+        self.replica_set.succeeded(self.db1, 0.5)
+        self.replica_set.begin(self.db2)
+        self.replica_set.succeeded(self.db2, 0.1)
+        self.assertEqual([e.url for e in self.replica_set.candidates()], ['http://db2:8080/', 'http://db1:8080/'])
+
+    def test_in_flight(self):
+        for endpoint in (self.db1, self.db2):
+            self.replica_set.begin(endpoint)
+            self.replica_set.succeeded(endpoint, 0.1)
+        self.replica_set.begin(self.db2)
+        self.replica_set.begin(self.db2)
+        self.assertIs(self.replica_set.candidates()[0], self.db1)
+
+    def test_unmeasured(self):
+        self.replica_set.begin(self.db1)
+        self.replica_set.succeeded(self.db1, 0.1)
+        # db2 did not answer yet and counts with the latency of db1, its queries in flight still count.
+        self.replica_set.begin(self.db2)
+        self.replica_set.begin(self.db2)
+        self.assertIs(self.replica_set.candidates()[0], self.db1)
+
+    def test_ejection(self):
+        for i in range(2):
+            self.replica_set.begin(self.db1)
+            self.replica_set.failed(self.db1)
+        self.assertEqual(self.replica_set.candidates(), [self.db2, self.db1])
+        self.assertTrue(self.db1.state()['ejected'])
+        # Back after the eject time.
+        self.db1.ejected_until = time.time() - 1
+        self.assertFalse(self.db1.state()['ejected'])
+
+
+class TestSendRequest(TestCase):
+    def setUp(self):
+        self.primary = register(['http://primary:8080', 'http://replica:8080'])
+
+    def tearDown(self):
+        _replica_sets.pop(self.primary)
+
+    def test_register(self):
+        self.assertEqual(self.primary, 'http://primary:8080/')
+        self.assertEqual(register('http://single:8080'), 'http://single:8080')
+
+    def test_failover(self):
+        tried = []
+
+        def send(base_url):
+            tried.append(base_url)
+            if len(tried) == 1:
+                raise requests.ConnectionError('refused')
+            return FakeResponse()
+
+        self.assertEqual(send_request(self.primary, send).status_code, 200)
+        self.assertEqual(sorted(tried), ['http://primary:8080/', 'http://replica:8080/'])
+
+    def test_server_error_failover(self):
+        responses = [FakeResponse(503), FakeResponse(200)]
+        self.assertEqual(send_request(self.primary, lambda base_url: responses.pop(0)).status_code, 200)
+        # The last endpoint's answer is returned even if it is an error.
+        responses = [FakeResponse(503), FakeResponse(502)]
+        self.assertEqual(send_request(self.primary, lambda base_url: responses.pop(0)).status_code, 502)
+
+    def test_all_failing(self):
+        def send(base_url):
+            raise requests.ConnectionError('refused')
+
+        self.assertRaises(requests.ConnectionError, send_request, self.primary, send)
+
+    def test_without_replicas(self):
+        self.assertEqual(send_request('http://single:8080/', lambda base_url: base_url), 'http://single:8080/')
+
+    def test_concurrent(self):
+        # Queries starting at the same time on endpoints that did not answer yet are spread over them.
+        started = threading.Barrier(10)
+        tried = []
+
+        def send(base_url):
+            tried.append(base_url)
+            started.wait(5)
+            return FakeResponse()
+
+        workers = [threading.Thread(target=send_request, args=(self.primary, send)) for i in range(10)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(sorted(tried), ['http://primary:8080/'] * 5 + ['http://replica:8080/'] * 5)
@@ -0,0 +1,108 @@
+import time
+from unittest import TestCase
+
+import requests
+
+from pano.puppetdb import resilience
+from pano.puppetdb.resilience import CircuitBreaker, DeadlineExceeded, PuppetDBUnavailable, call, deadline, \
+    timeouts
+
+__author__ = 'etaklar'
+
+SOURCE = 'http://flaky:8080/'
+
+
+class FakeResponse(object):
+    def __init__(self, status_code=200):
+        self.status_code = status_code
+
+
+class TestCircuitBreaker(TestCase):
+    def test_opens_after_failures(self):
+        breaker = CircuitBreaker(max_failures=2, reset_time=30)
+        breaker.failed()
+        self.assertEqual(breaker.state, 'closed')
+        breaker.failed()
+        self.assertEqual(breaker.state, 'open')
+        self.assertFalse(breaker.allow())
+
+    def test_half_open_trial(self):
+        breaker = CircuitBreaker(max_failures=1, reset_time=30)
+        breaker.failed()
+        breaker.opened = time.time() - 31
+        self.assertEqual(breaker.state, 'half-open')
+        self.assertTrue(breaker.allow())
+        # Only one trial query at a time.
+        self.assertFalse(breaker.allow())
+        breaker.succeeded()
+        self.assertEqual(breaker.state, 'closed')
+
+    def test_failed_trial(self):
+        breaker = CircuitBreaker(max_failures=3, reset_time=30)
+        breaker.opened = time.time() - 31
+        self.assertTrue(breaker.allow())
+        breaker.failed()
+        self.assertEqual(breaker.state, 'open')
+
+
+class TestCall(TestCase):
+    def setUp(self):
+        self.backoff = resilience.PUPPETDB_RETRY_BACKOFF
+        resilience.PUPPETDB_RETRY_BACKOFF = 0
+
+    def tearDown(self):
+        resilience.PUPPETDB_RETRY_BACKOFF = self.backoff
+        resilience._breakers.pop(SOURCE, None)
+
+    def test_retries(self):
+        responses = [requests.ConnectionError('refused'), FakeResponse(503), FakeResponse(200)]
+
+        def send(timeout):
+            response = responses.pop(0)
+            if isinstance(response, Exception):
+                raise response
+            return response
+
+        self.assertEqual(call(SOURCE, send, retries=2).status_code, 200)
+        self.assertEqual(resilience.get_breaker(SOURCE).failures, 0)
+
+    def test_retries_run_out(self):
+        sent = []
+
+        def send(timeout):
+            sent.append(timeout)
+            return FakeResponse(502)
+
+        self.assertEqual(call(SOURCE, send, retries=2).status_code, 502)
+        self.assertEqual(len(sent), 3)
+        self.assertEqual(resilience.get_breaker(SOURCE).failures, 1)
+
+    def test_no_retry_on_client_error(self):
+        sent = []
+
+        def send(timeout):
+            sent.append(timeout)
+            return FakeResponse(404)
+
+        self.assertEqual(call(SOURCE, send, retries=2).status_code, 404)
+        self.assertEqual(len(sent), 1)
+
+    def test_breaker_open(self):
+        breaker = resilience.get_breaker(SOURCE)
+        for i in range(breaker.max_failures):
+            breaker.failed()
+        self.assertRaises(PuppetDBUnavailable, call, SOURCE, lambda timeout: FakeResponse())
+
+
+class TestDeadline(TestCase):
+    def test_read_timeout_limited(self):
+        with deadline(2):
+            connect_timeout, read_timeout = timeouts()
+        self.assertLessEqual(read_timeout, 2)
+        self.assertIsNone(resilience.current_deadline())
+
+    def test_exceeded(self):
+        with deadline(-1):
+            self.assertRaises(DeadlineExceeded, timeouts)
+            self.assertRaises(DeadlineExceeded, call, SOURCE, lambda timeout: FakeResponse())
+        self.assertEqual(resilience.get_breaker(SOURCE).state, 'closed')
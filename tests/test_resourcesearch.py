@@ -0,0 +1,35 @@
+import json
+from unittest import TestCase
+
+from pano.methods.resourcesearch import ResourceSearch, parse_resource, resource_query
+
+__author__ = 'etaklar'
+
+
+class FakeRequest(object):
+    def __init__(self):
+        self.session = {}
+
+
+def search(generation):
+    resource_search = ResourceSearch(FakeRequest(), 'Package', 'openssl')
+    resource_search._generation = generation
+    return resource_search
+
+
+class TestResourceSearch(TestCase):
+    def test_parse_resource(self):
+        self.assertEqual(parse_resource('package[openssl]'), ('Package', 'openssl'))
+        self.assertEqual(parse_resource('apache::vhost[www [old]]'), ('Apache::Vhost', 'www [old]'))
+        self.assertIsNone(parse_resource('openssl'))
+        self.assertEqual(json.loads(resource_query('File', '/etc/"motd"')),
+                         ['and', ['=', 'type', 'File'], ['=', 'title', '/etc/"motd"']])
+
+    def test_cache(self):
+        nodes = [{'certname': 'node1.example.com', 'environment': 'production'}]
+        search((10, '2016-01-01T00:00:00.000Z'))._store(environments={'production': 1}, nodes=nodes)
+        cached = search((10, '2016-01-01T00:00:00.000Z'))
+        self.assertEqual(cached.environments(), {'production': 1})
+        self.assertEqual(list(cached.nodes()), nodes)
+        # A new catalogue is a new generation.
+        self.assertIsNone(search((10, '2016-01-01T00:30:00.000Z'))._cached())
@@ -0,0 +1,40 @@
+import difflib
+from unittest import TestCase
+
+from pano.methods.textdiff import diff_files, matching_lines, unified_diff
+
+__author__ = 'etaklar'
+
+OLD = ['# ntp.conf', 'driftfile /var/lib/ntp/drift', 'server 0.pool.ntp.org', 'server 1.pool.ntp.org',
+       'restrict 127.0.0.1', 'restrict ::1', 'includefile /etc/ntp/crypto/pw', 'keys /etc/ntp/keys',
+       'disable monitor', '']
+NEW = ['# ntp.conf', 'driftfile /var/lib/ntp/drift', 'server 0.pool.ntp.org', 'server 2.pool.ntp.org',
+       'restrict 127.0.0.1', 'restrict ::1', 'includefile /etc/ntp/crypto/pw', 'keys /etc/ntp/keys',
+       'disable monitor', 'tinker panic 0', '']
+
+
+class TestTextDiff(TestCase):
+    def test_unified_diff(self):
+        self.assertEqual(list(unified_diff(OLD, NEW, 'a', 'b')),
+                         list(difflib.unified_diff(OLD, NEW, 'a', 'b', lineterm='')))
+        self.assertEqual(list(unified_diff(OLD, OLD)), [])
+
+    def test_matching_lines(self):
+        # Repeated lines without a unique line between them are matched with Myers' algorithm.
+        self.assertEqual(matching_lines(list('abcabba'), list('cbabac')), [(2, 0), (3, 2), (4, 3), (6, 4)])
+        self.assertEqual(matching_lines(['}', 'a', '}', 'b', '}'], ['}', 'b', '}', 'a', '}']),
+                         [(0, 0), (3, 1), (4, 4)])
+
+    def test_diff_files(self):
+        self.assertEqual(diff_files('a\x00b', 'a', 'from', 'to'), ['Binary files from and to differ'])
+        old_text, new_text = '\n'.join(OLD), '\n'.join(NEW)
+        lines = list(diff_files(old_text, new_text, from_md5='1' * 32, to_md5='2' * 32))
+        self.assertIn('+tinker panic 0', lines)
+        # The diff of the same two files is kept by their md5, the texts are not compared again.
+        self.assertEqual(diff_files(old_text, old_text, from_md5='1' * 32, to_md5='2' * 32), lines)
+        # Nothing to show for the same file, also when the diff was kept.
+        self.assertEqual(diff_files(old_text, old_text, from_md5='1' * 32, to_md5='1' * 32), [])
+        self.assertEqual(diff_files(old_text, old_text, from_md5='1' * 32, to_md5='1' * 32), [])
+        # Not kept without the md5s.
+        self.assertEqual(list(diff_files(old_text, new_text)), lines)
+        self.assertEqual(diff_files(old_text, old_text), [])